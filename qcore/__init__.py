@@ -2,7 +2,7 @@ __version__ = "1.2.3"
 
 from qcore.helpers.logger import logger
 from qcore.resource import Resource
-from qcore.experiment import Experiment
+from qcore.experiment import Experiment, MergedExperiment
 import qcore.libs.qua_macros as qua
 from qcore.helpers.server import Server
 from qcore.helpers.stage import Stage
@@ -12,12 +12,15 @@ from qm.qua._dsl import _ProgramScope, _Variable, _ResultSource
 from qcore.instruments.instrument import Instrument
 from qcore.instruments import QM
 from qcore.helpers.datasaver import Datasaver
+from qcore.helpers.liveview import LiveViewPublisher
 from qcore.helpers.logger import logger
 from qcore.helpers.plotter import Plotter
+from qcore.helpers import server
 from qcore.helpers.stage import Stage
-from qcore.libs.qua_macros import QuaVariable
+from qcore.libs.qua_macros import ActiveReset, QuaVariable
 from qcore.modes.mode import Mode
 from qcore.pulses.pulse import Pulse
+from qcore.pulses.pulse_family import PulseFamily
 from qcore.resource import Resource
 from qcore.variables.datasets import Dataset
 from qcore.variables.sweeps import Sweep
@@ -39,7 +42,8 @@ class ExperimentManager:
     """handle Experiment setup tasks related to resources, sweeps, datasets"""
 
     def get_resources(self, folder) -> dict[str, Instrument]:
-        """get all available resources from remote stage and local config"""
+        """get all available resources from remote stage and local config, pulses
+        include the PulseFamilies in the local config"""
         with Stage(remote=True) as stage:
             instruments = {rsc.name: rsc for rsc in stage.get(*stage.resources)}
 
@@ -51,7 +55,9 @@ class ExperimentManager:
         with Stage(modes_config) as stage:
             rscs = stage.get(*stage.resources)
             modes = {m.name: m for m in rscs if isinstance(m, Mode)}
+            families = {f.name: f for f in rscs if isinstance(f, PulseFamily)}
         pulses = {p.name: p for m in modes.values() for p in m.operations.values()}
+        pulses.update(families)
         return instruments, modes, pulses
 
     def select_resources(self, resources, map, cls) -> dict[str, Resource]:
@@ -81,7 +87,7 @@ class ExperimentManager:
 
     def select_pulses(self, all_pulses, pulse_map) -> dict[str, Pulse]:
         """ """
-        return self.select_resources(all_pulses, pulse_map, Pulse)
+        return self.select_resources(all_pulses, pulse_map, (Pulse, PulseFamily))
 
     def validate_sweeps(
         self, sweeps: list[Sweep], primary_sweeps: list[str], **kwargs
@@ -234,7 +240,11 @@ class ExperimentManager:
 
 
 class Experiment:
-    """generic experiment class written for executing QUA sequences on the QM OPX"""
+    """generic experiment class written for executing QUA sequences on the QM OPX
+
+    Live plots and fits run in spawned processes, which import the __main__ script, so
+    scripts must run experiments under 'if __name__ == "__main__":', see
+    qcore.helpers.spawn"""
 
     # datasets with these names will be streamed by the OPX
     primary_datasets: list = []  # to be specified by child classes
@@ -253,6 +263,8 @@ class Experiment:
         sweeps: list[Sweep],
         datasets: list[Dataset],
         fetch_interval: int = 1,
+        liveview_port: int = None,  # to publish live data to LiveViewClients if set
+        active_reset: ActiveReset = None,  # to reset the qubit before each repetition
         **kwargs,
     ) -> None:
         """ """
@@ -281,6 +293,12 @@ class Experiment:
         self.datasets: dict[str, Dataset] = {dset.name: dset for dset in datasets}
 
         self.fetch_interval = fetch_interval
+        self.liveview_port = liveview_port
+        self._liveview = None  # LiveViewPublisher, started on run() if port is set
+
+        self.active_reset = active_reset
+        if active_reset is not None:
+            active_reset.bind(self.modes, self.pulses)
 
         # container for the various types of QuaVariables involved in this experiment
         self._qua_variables: dict[str, QuaVariable] = {}  # for all QuaVariables
@@ -318,6 +336,7 @@ class Experiment:
         """
         # make Mode and Pulse objects Experiment attributes for easy access
         # for each Mode, select only the subset of Pulses required for this Experiment
+        # and the variants of its PulseFamilies, see PulseFamily.add_to()
         """
         for mode_name, mode in self.modes.items():
             if not hasattr(self, mode_name):
@@ -327,7 +346,15 @@ class Experiment:
             all_op_names = [p.name for p in mode.operations.values()]
             selected_operations = {}
             for pulse_name, pulse in self.pulses.items():
-                if pulse.name in all_op_names:
+                if isinstance(pulse, PulseFamily):
+                    variants = {variant.name for variant in pulse.get_pulses()}
+                    for op_name, operation in mode.operations.items():
+                        if operation.name in variants:
+                            selected_operations[op_name] = operation
+                    if not hasattr(self, pulse_name):
+                        setattr(self, pulse_name, pulse)
+                        logger.info(f"Set '{self.name}' attribute '{pulse_name}'.")
+                elif pulse.name in all_op_names:
                     selected_operations[pulse_name] = pulse
                     if not hasattr(self, pulse_name):
                         setattr(self, pulse_name, pulse)
@@ -337,6 +364,8 @@ class Experiment:
     def run(self):
         """ """
         outermost_sweep = list(self.sweeps.values())[0]
+        if self.liveview_port is not None:
+            self._liveview = LiveViewPublisher(self.liveview_port)
         try:
             if not outermost_sweep.is_qua_sweep:
                 self._run_with_qcore_sweep(outermost_sweep)
@@ -347,6 +376,10 @@ class Experiment:
             msg = f"Experiment '{self.name}' interrupted, closing QM now..."
             logger.info(msg)
             self._qm.disconnect()
+        finally:
+            if self._liveview is not None:
+                self._liveview.close()
+                self._liveview = None
 
     def _run_with_qcore_sweep(self, qcore_sweep: Sweep):
         """ """
@@ -394,13 +427,14 @@ class Experiment:
 
         self._configure_resources()
 
-        for point in points:
+        for i, point in enumerate(points):
             setattr(target, name, point)
             suffix = point.name if has_resource_sweep_points else str(point)
             tag = f"_{target.name}_{suffix}"
             filepath = self._get_filepath()
             self._filepath = filepath.parent / (filepath.stem + tag + filepath.suffix)
-            self._run_qua_sweeps(point, exit_plotter=True)
+            is_last_point = i == len(points) - 1  # keep the plot window till then
+            self._run_qua_sweeps(point, exit_plotter=is_last_point)
             time.sleep(self.fetch_interval)
 
     def _run_qua_sweeps(self, qcore_sweep_point=None, exit_plotter=False):
@@ -411,9 +445,6 @@ class Experiment:
 
         time.sleep(self.fetch_interval)
 
-        dsets_to_save = {k: dset for k, dset in self.datasets.items() if dset.save}
-        sweeps_to_save = {k: swp for k, swp in self._qua_sweeps.items() if swp.save}
-
         datasaver = Datasaver(self._filepath, *self.datasets.values())
 
         to_plot = [dset for dset in self.datasets.values() if dset.plot]
@@ -432,49 +463,20 @@ class Experiment:
                 data, prev_count, incoming_count = self._qm.fetch()
                 plot_msg = f": {incoming_count} / {self.repetitions} data batches"
                 if data:  # to prevent update when empty data dict is fetched
-                    # update sweep data and save to datafile
-                    for name, sweep in sweeps_to_save.items():
-                        if sweep.is_qua_sweep:
-                            sweep.update(data[name])
-                            datasaver.save_data(sweep)
-
-                    # update primary datasets first
-                    for name, dset in self.datasets.items():
-                        if name in self.primary_datasets:
-                            rawdata = (data[name], data[f"{name}_avg"])
-                            dset.update(rawdata, prev_count, incoming_count)
-
-                    # update derived datasets
-                    for name, dset in self.datasets.items():
-                        if dset.inputs:  # is derived dataset with datafn and inputs
-                            dsets = []
-                            for i in dset.inputs:
-                                if i in self.datasets:
-                                    dsets.append(self.datasets[i])
-                                elif i in self.sweeps:
-                                    dsets.append(self.sweeps[i])
-                            dset.update(dsets, prev_count, incoming_count)
-                            data[name] = dset.data
-
-                    # process additional user-defined datasets in subclasses
-                    self.process_data(
-                        data,
-                        prev_count,
-                        incoming_count,
-                        qcore_sweep_point,
+                    self._update(
+                        data, prev_count, incoming_count, datasaver, qcore_sweep_point
                     )
 
-                    # save datasets and sweeps (after updating) to datafile
-                    for name, dataset in dsets_to_save.items():
-                        datasaver.save_data(dataset)
-
                 if plotter:
                     plotter.plot(message=plot_msg)  # update live plot
+                if self._liveview:  # after plotting to publish the latest fits
+                    self._liveview.publish(f"{self.name}{plot_msg}", *to_plot)
 
                 time.sleep(self.fetch_interval)
 
             self._qm.disconnect()
             logger.info(f"{self.name} experiment has stopped running!")
+            self._save_results(datasaver)
 
             # plot final data batch and stop plotting loop
             if plotter:
@@ -482,6 +484,57 @@ class Experiment:
                     plotter.plot(message=f"{plot_msg} [DONE]", stop=True, exit=True)
                 else:
                     plotter.plot(message=f"{plot_msg} [DONE]", stop=True)
+            if self._liveview:
+                msg = f"{self.name}{plot_msg} [DONE]"
+                self._liveview.publish(msg, *to_plot, is_done=True)
+
+    def _update(
+        self, data, prev_count, incoming_count, datasaver, qcore_sweep_point=None
+    ) -> None:
+        """update sweeps and datasets with a batch of data fetched from the QM, keyed by
+        the names of the sweeps and datasets, and save them to the datafile"""
+        dsets_to_save = {k: dset for k, dset in self.datasets.items() if dset.save}
+        sweeps_to_save = {k: swp for k, swp in self._qua_sweeps.items() if swp.save}
+
+        # update sweep data and save to datafile
+        for name, sweep in sweeps_to_save.items():
+            if sweep.is_qua_sweep:
+                sweep.update(data[name])
+                datasaver.save_data(sweep)
+
+        # update primary datasets first
+        for name, dset in self.datasets.items():
+            if name in self.primary_datasets:
+                rawdata = (data[name], data[f"{name}_avg"])
+                dset.update(rawdata, prev_count, incoming_count)
+
+        # update derived datasets
+        for name, dset in self.datasets.items():
+            if dset.inputs:  # is derived dataset with datafn and inputs
+                dsets = []
+                for i in dset.inputs:
+                    if i in self.datasets:
+                        dsets.append(self.datasets[i])
+                    elif i in self.sweeps:
+                        dsets.append(self.sweeps[i])
+                dset.update(dsets, prev_count, incoming_count)
+                data[name] = dset.data
+
+        if self.active_reset is not None:
+            self.active_reset.update(data)
+
+        # process additional user-defined datasets in subclasses
+        self.process_data(data, prev_count, incoming_count, qcore_sweep_point)
+
+        # save datasets and sweeps (after updating) to datafile
+        for name, dataset in dsets_to_save.items():
+            datasaver.save_data(dataset)
+
+    def _save_results(self, datasaver) -> None:
+        """save results known once the QM has stopped running to the datafile"""
+        if self.active_reset is not None and self.active_reset.results:
+            datasaver.save_metadata({"active_reset": self.active_reset.results})
+            logger.info(f"Active reset results: {self.active_reset.results}.")
 
     def process_data(self, data, prev_count, incoming_count, qcore_sweep_point):
         """Subclass(es) to implement process_data()"""
@@ -491,39 +544,60 @@ class Experiment:
         """ """
         # enter QUA program scope
         with qua.program() as qua_program:
-            # declare QUA variables and streams
-            # set those as self attributes for easy access
-            for name, var in self._qua_variables.items():
-                qua_variable = var.declare_variable()
-                qua_stream = var.declare_stream()
-                if var.is_adc_trace:
-                    setattr(self, name, qua_stream)
-                else:
-                    setattr(self, name, qua_variable)
-                logger.info(f"Set QUA variable attribute {name} for {self.name}.")
-
-            # generate and enter QUA loop contexts programmatically
-            with ExitStack() as stack:
-                for name, sweep in self._qua_sweeps.items():
-                    logger.debug(f"Expect {sweep.length} '{name}' sweep points.")
-                    fn, *args = sweep.generate_loop()
-                    stack.enter_context(fn(*args))
-                    sweep.save_to_stream()
-                self.sequence()
-                for dataset in self._qua_datasets.values():
-                    dataset.save_to_stream()
-
+            self._declare_qua_variables()
+            self._play_qua_sweeps()
             with qua.stream_processing():
-                for idx, (sweep) in enumerate(self._qua_sweeps.values()):
-                    if idx != 0:  # we don't save repetitions at all
-                        sweep.process_stream()
-                for dataset in self._qua_datasets.values():
-                    dataset.process_stream()
-
+                self._process_streams()
         return qua_program
 
+    def _declare_qua_variables(self) -> None:
+        """call in qua variable declaration section of qua program scope"""
+        # declare QUA variables and streams
+        # set those as self attributes for easy access
+        for name, var in self._qua_variables.items():
+            qua_variable = var.declare_variable()
+            qua_stream = var.declare_stream()
+            if var.is_adc_trace:
+                setattr(self, name, qua_stream)
+            else:
+                setattr(self, name, qua_variable)
+            logger.info(f"Set QUA variable attribute {name} for {self.name}.")
+        if self.active_reset is not None:
+            self.active_reset.declare()
+
+    def _play_qua_sweeps(self) -> None:
+        """play the sequence in QUA loops over sweeps, save datasets to streams"""
+        # generate and enter QUA loop contexts programmatically
+        with ExitStack() as stack:
+            for name, sweep in self._qua_sweeps.items():
+                logger.debug(f"Expect {sweep.length} '{name}' sweep points.")
+                fn, *args = sweep.generate_loop()
+                stack.enter_context(fn(*args))
+                sweep.save_to_stream()
+            if self.active_reset is not None:
+                self.active_reset.play()
+            self.sequence()
+            for dataset in self._qua_datasets.values():
+                dataset.save_to_stream()
+
+    def _process_streams(self, prefix: str = "") -> None:
+        """call in the stream processing section of qua program scope, streams are saved
+        with their tags prefixed by prefix"""
+        for idx, (sweep) in enumerate(self._qua_sweeps.values()):
+            if idx != 0:  # we don't save repetitions at all
+                sweep.process_stream(prefix)
+        for dataset in self._qua_datasets.values():
+            dataset.process_stream(prefix)
+        if self.active_reset is not None:
+            self.active_reset.process_stream(prefix)
+
     def _get_qm(self):
         """pre-requisite: remote stage must already be setup and serving instruments"""
+        mode_lo_map = self._get_mode_lo_map()
+        return QM(modes=mode_lo_map.keys(), oscillators=mode_lo_map.values())
+
+    def _get_mode_lo_map(self) -> dict[Mode, Instrument]:
+        """ """
         mode_lo_map = {}
         for name, mode in self.modes.items():
             lo_name = mode.lo_name
@@ -534,7 +608,7 @@ class Experiment:
                     message = f"'{lo_name = }' for Mode '{name}' not found on stage."
                     logger.error(message)
                     raise ExperimentInitializationError(message)
-        return QM(modes=mode_lo_map.keys(), oscillators=mode_lo_map.values())
+        return mode_lo_map
 
     def _get_filepath(self) -> Path:
         """ """
@@ -551,10 +625,11 @@ class Experiment:
     @property
     def metadata(self):
         """ """
-        inst_mdata = {k: i.snapshot() for k, i in self.instruments.items()}
+        snapshots = server.snapshot(*self.instruments.values())  # one call per Server
+        inst_mdata = dict(zip(self.instruments, snapshots))
         mode_mdata = {k: m.snapshot(flatten=True) for k, m in self.modes.items()}
 
-        xcls = (_Variable, Resource, _ResultSource)  # excluded classes
+        xcls = (_Variable, Resource, _ResultSource, ActiveReset)  # excluded classes
         xkeys = ("instruments", "modes", "pulses", "sweeps", "datasets")
         snapshot = {}
         for k, v in self.__dict__.items():
@@ -562,3 +637,209 @@ class Experiment:
                 snapshot[k] = v
 
         return {"instruments": inst_mdata, "modes": mode_mdata, None: snapshot}
+
+
+class ExperimentMergeError(Exception):
+    """ """
+
+
+class MergedExperiment:
+    """Runs Experiments on disjoint modes simultaneously in one QUA program, e.g. a T1
+    on one qubit and a Ramsey on another, instead of one after the other. The sweep
+    loops and sequence() of each Experiment follow each other in the program without
+    aligning their modes, so the OPX plays them in parallel. sequence() must hence only
+    align the modes of its own Experiment, i.e. never call qua.align() without modes.
+
+    Each Experiment keeps its sweeps, datasets and datafile. Its streams are saved with
+    tags prefixed by f"{index}_{name}_" and fetched data is split back among the
+    Experiments by prefix. Experiments must only have QUA sweeps and the same number of
+    repetitions "N". Datasets are live plotted in one window, tagged by the prefix of
+    their Experiment, and their plots are exported next to the datafile of their
+    Experiment."""
+
+    def __init__(
+        self,
+        *experiments: Experiment,
+        fetch_interval: int = None,  # defaults to the shortest of the Experiments'
+        liveview_port: int = None,  # to publish live data to LiveViewClients if set
+    ) -> None:
+        """ """
+        self._validate(experiments)
+        self.experiments = experiments
+        self.name = "+".join(experiment.name for experiment in experiments)
+        self.prefixes = [f"{i}_{e.name}_" for i, e in enumerate(experiments)]
+        self.repetitions = experiments[0].repetitions
+
+        if fetch_interval is None:
+            fetch_interval = min(e.fetch_interval for e in experiments)
+        self.fetch_interval = fetch_interval
+        self.liveview_port = liveview_port
+        self._liveview = None  # LiveViewPublisher, started on run() if port is set
+
+        self._qm = None
+
+    def _validate(self, experiments: tuple[Experiment]) -> None:
+        """ """
+        if len(experiments) < 2:
+            message = f"Expect at least 2 Experiments to merge, got {len(experiments)}."
+            logger.error(message)
+            raise ExperimentMergeError(message)
+
+        owners = {}  # mode name: name of the Experiment it belongs to
+        for experiment in experiments:
+            if not isinstance(experiment, Experiment):
+                message = f"Expect {Experiment}, got {experiment = }."
+                logger.error(message)
+                raise ExperimentMergeError(message)
+
+            if not list(experiment.sweeps.values())[0].is_qua_sweep:
+                message = f"Can't merge '{experiment.name}' with an outer Qcore Sweep."
+                logger.error(message)
+                raise ExperimentMergeError(message)
+
+            if experiment.repetitions != experiments[0].repetitions:
+                message = (
+                    f"Merged Experiments must have equal repetitions, got "
+                    f"{experiment.repetitions} for '{experiment.name}' and "
+                    f"{experiments[0].repetitions} for '{experiments[0].name}'."
+                )
+                logger.error(message)
+                raise ExperimentMergeError(message)
+
+            for name in {mode.name for mode in experiment.modes.values()}:
+                if name in owners:
+                    message = (
+                        f"Mode '{name}' is used by both '{owners[name]}' and "
+                        f"'{experiment.name}', merged Experiments must have disjoint "
+                        f"modes."
+                    )
+                    logger.error(message)
+                    raise ExperimentMergeError(message)
+                owners[name] = experiment.name
+
+    def run(self) -> None:
+        """ """
+        if self.liveview_port is not None:
+            self._liveview = LiveViewPublisher(self.liveview_port)
+        try:
+            self._run_qua_sweeps()
+        except KeyboardInterrupt:
+            msg = f"Experiment '{self.name}' interrupted, closing QM now..."
+            logger.info(msg)
+            self._qm.disconnect()
+        finally:
+            if self._liveview is not None:
+                self._liveview.close()
+                self._liveview = None
+
+    def _run_qua_sweeps(self) -> None:
+        """ """
+        filepaths = []
+        for i, experiment in enumerate(self.experiments):
+            filepath = experiment._get_filepath()
+            if filepath in filepaths:  # of an Experiment of the same class
+                filepath = filepath.parent / f"{filepath.stem}_{i}{filepath.suffix}"
+                experiment._filepath = filepath
+            filepaths.append(filepath)
+        self._qm: QM = self._get_qm()
+        qua_program = self._build_qua_program()
+        self._qm.execute(qua_program, self.repetitions)
+
+        time.sleep(self.fetch_interval)
+
+        to_plot, tags, datafiles = [], [], []
+        merged = zip(self.experiments, self.prefixes, filepaths)
+        for experiment, prefix, filepath in merged:
+            for dset in experiment.datasets.values():
+                if dset.plot:
+                    to_plot.append(dset)
+                    tags.append(f"{prefix}{dset.name}")
+                    datafiles.append(filepath)
+        if len(to_plot) > 0:
+            plotter = Plotter(
+                self.fetch_interval,
+                self.name,
+                filepaths[0],
+                *to_plot,
+                tags=tags,
+                datafiles=datafiles,
+            )
+        else:
+            plotter = None
+
+        # each datafile records the Experiments and datafiles it was merged with
+        merged = {
+            "experiments": [experiment.name for experiment in self.experiments],
+            "datafiles": [str(filepath) for filepath in filepaths],
+        }
+        with ExitStack() as stack:
+            datasavers = []
+            for experiment, filepath in zip(self.experiments, filepaths):
+                datasets = experiment.datasets.values()
+                datasaver = stack.enter_context(Datasaver(filepath, *datasets))
+                datasaver.save_metadata(experiment.metadata)
+                datasaver.save_metadata({"merged": merged})
+                datasavers.append(datasaver)
+
+            while self._qm.is_processing():
+                if plotter and plotter.stop_expt:
+                    break
+
+                data, prev_count, incoming_count = self._qm.fetch()
+                plot_msg = f": {incoming_count} / {self.repetitions} data batches"
+                if data:
+                    for experiment, datasaver, experiment_data in zip(
+                        self.experiments, datasavers, self._split(data)
+                    ):
+                        experiment._update(
+                            experiment_data, prev_count, incoming_count, datasaver
+                        )
+
+                if plotter:
+                    plotter.plot(message=plot_msg)
+                if self._liveview:
+                    message = f"{self.name}{plot_msg}"
+                    self._liveview.publish(message, *to_plot, tags=tags)
+
+                time.sleep(self.fetch_interval)
+
+            self._qm.disconnect()
+            logger.info(f"{self.name} experiments have stopped running!")
+            for experiment, datasaver in zip(self.experiments, datasavers):
+                experiment._save_results(datasaver)
+
+            if plotter:
+                plotter.plot(message=f"{plot_msg} [DONE]", stop=True, exit=True)
+            if self._liveview:
+                msg = f"{self.name}{plot_msg} [DONE]"
+                self._liveview.publish(msg, *to_plot, is_done=True, tags=tags)
+
+    def _split(self, data: dict) -> list[dict]:
+        """return data fetched from the QM as one dict per Experiment, keyed by the
+        names of its sweeps and datasets without prefix"""
+        split = [{} for _ in self.experiments]
+        for tag, value in data.items():
+            for experiment_data, prefix in zip(split, self.prefixes):
+                if tag.startswith(prefix):
+                    experiment_data[tag[len(prefix) :]] = value
+                    break
+        return split
+
+    def _build_qua_program(self) -> _ProgramScope:
+        """ """
+        with qua.program() as qua_program:
+            for experiment in self.experiments:
+                experiment._declare_qua_variables()
+            for experiment in self.experiments:  # no align, to play simultaneously
+                experiment._play_qua_sweeps()
+            with qua.stream_processing():
+                for experiment, prefix in zip(self.experiments, self.prefixes):
+                    experiment._process_streams(prefix)
+        return qua_program
+
+    def _get_qm(self) -> QM:
+        """ """
+        mode_lo_map = {}
+        for experiment in self.experiments:
+            mode_lo_map.update(experiment._get_mode_lo_map())
+        return QM(modes=mode_lo_map.keys(), oscillators=mode_lo_map.values())
@@ -0,0 +1,213 @@
+""" Headless export of plots of Datasets and datafiles to PNG in worker processes """
+
+from concurrent import futures
+from pathlib import Path
+
+import h5py
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from qcore.helpers.logger import logger
+from qcore.helpers import spawn
+
+
+class PlotExportError(Exception):
+    """ """
+
+
+# a plot is a dict with the name, units, plot_args, avg, sem, best_fit and fit_params of
+# a Dataset, and its axes as a list of {"name", "units", "data"} without the averaging
+# axis "N", plots are plain data so that they can be sent to worker processes
+
+
+def get_plot(dataset) -> dict:
+    """return the plot of a Dataset or of any object with the same attributes"""
+    axes = []
+    for axis, (key, data) in list(zip(dataset.axes, dataset.sweep_data.items()))[1:]:
+        name = getattr(axis, "name", key)
+        axes.append({"name": name, "units": getattr(axis, "units", ""), "data": data})
+    return {
+        "name": dataset.name,
+        "units": dataset.units,
+        "plot_args": dict(dataset.plot_args),
+        "avg": None if dataset.avg is None else np.array(dataset.avg),
+        "sem": None if dataset.sem is None else np.array(dataset.sem),
+        "best_fit": dataset.best_fit,
+        "fit_params": dataset.fit_params,
+        "axes": axes,
+    }
+
+
+def read_plots(datafile, names: list[str] = None) -> list[dict]:
+    """return plots of the datasets in a datafile saved by a Datasaver, of all that are
+    not coordinates if names is None, averaged over their first axis "N", datasets with
+    two axes besides "N" are plotted as images"""
+    plots = []
+    with h5py.File(datafile, mode="r") as file:
+        if names is None:
+            names = [
+                name
+                for name, h5dset in file.items()
+                if isinstance(h5dset, h5py.Dataset)
+                and not h5py.h5ds.is_scale(h5dset.id)
+                and h5dset.ndim > 1
+            ]
+        for name in names:
+            try:
+                h5dset = file[name]
+            except KeyError:
+                msg = f"Dataset '{name}' does not exist in {datafile}."
+                logger.error(msg)
+                raise PlotExportError(msg) from None
+            data = np.asarray(h5dset[()], dtype=float)
+            count = data.shape[0]
+            axes = []
+            for i in range(1, h5dset.ndim):
+                dim = h5dset.dims[i]
+                if len(dim):  # has an attached coordinate dataset
+                    scale = dim[0]
+                    units = scale.attrs.get("units", "")
+                    axes.append({"name": dim.label, "units": units, "data": scale[()]})
+                else:
+                    axis_data = np.arange(1, data.shape[i] + 1)
+                    axes.append({"name": dim.label, "units": "", "data": axis_data})
+            plot_args = {"plot_type": "image"} if len(axes) == 2 else {}
+            plots.append(
+                {
+                    "name": name,
+                    "units": h5dset.attrs.get("units", ""),
+                    "plot_args": plot_args,
+                    "avg": np.nanmean(data, axis=0),
+                    "sem": np.nanstd(data, axis=0) / np.sqrt(count),
+                    "best_fit": None,
+                    "fit_params": None,
+                    "axes": axes,
+                }
+            )
+    return plots
+
+
+def render(plots: list[dict], filepath, title: str = "") -> Path:
+    """render plots to a PNG file without a display, return its path"""
+    filepath = Path(filepath)
+    num_cols = max(PlotExporter.MAX_COLS, int(np.ceil(np.sqrt(len(plots)))))
+    num_cols = min(num_cols, len(plots))
+    num_rows = int(np.ceil(len(plots) / num_cols))
+    width, height = PlotExporter.PLOT_SIZE
+    figure = Figure(figsize=(width * num_cols, height * num_rows), layout="constrained")
+    FigureCanvasAgg(figure)
+    for i, plot in enumerate(plots):
+        _render_plot(figure, figure.add_subplot(num_rows, num_cols, i + 1), plot)
+    if title:
+        figure.suptitle(title)
+    figure.savefig(filepath, dpi=PlotExporter.DPI)
+    return filepath
+
+
+def _render_plot(figure: Figure, ax, plot: dict) -> None:
+    """ """
+    plot_args, axes, avg = plot["plot_args"], plot["axes"], plot["avg"]
+    xaxis = axes[-1]
+    xlabel = plot_args.get("xlabel") or f"{xaxis['name']} ({xaxis['units']})"
+    ylabel = plot_args.get("ylabel") or f"{plot['name']} ({plot['units']})"
+    title = plot_args.get("title") or plot["name"]
+
+    if avg is None:
+        ax.set_title(f"{title} [no data]")
+        return
+
+    if plot_args.get("plot_type") == "image":
+        yaxis = axes[-2]
+        ylabel = plot_args.get("ylabel") or f"{yaxis['name']} ({yaxis['units']})"
+        cmap = plot_args.get("cmap", "viridis")
+        mesh = ax.pcolormesh(xaxis["data"], yaxis["data"], avg, cmap=cmap)
+        figure.colorbar(mesh, ax=ax, label=f"{plot['name']} ({plot['units']})")
+    else:
+        traces, sem = np.atleast_2d(avg), plot["sem"]
+        sem = None if sem is None else np.atleast_2d(sem)
+        best_fit = plot["best_fit"]
+        best_fit = None if best_fit is None else np.atleast_2d(best_fit)
+        fmt = "-" if plot_args.get("plot_type") == "line" else "o"
+        plot_err = plot_args.get("plot_err", True) and sem is not None
+        labels = [None] * len(traces)
+        if 1 < len(traces) <= PlotExporter.MAX_LEGEND_ITEMS:
+            labels = [str(label) for label in axes[-2]["data"]]
+        cmap, x = colormaps["viridis"], xaxis["data"]
+        is_few = len(traces) <= PlotExporter.MAX_LEGEND_ITEMS
+        for j, trace in enumerate(traces):
+            color = f"C{j}" if is_few else cmap(j / (len(traces) - 1))
+            yerr = sem[j] if plot_err else None
+            kwargs = {"fmt": fmt, "ms": 3, "color": color, "label": labels[j]}
+            ax.errorbar(x, trace, yerr=yerr, **kwargs)
+            if best_fit is not None:
+                ax.plot(x, best_fit[j], "k--", lw=1)
+        if labels[0] is not None:
+            ax.legend(fontsize="small")
+
+    fit_params = plot["fit_params"]
+    if isinstance(fit_params, dict):  # of a single trace
+        fit_str = ", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
+        title = f"{title}\n{fit_str}"
+    ax.set(xlabel=xlabel, ylabel=ylabel, title=title)
+    ax.grid(alpha=0.5)
+
+
+def _export_datafile(datafile, filepath, names: list[str] = None) -> Path:
+    """ """
+    return render(read_plots(datafile, names), filepath, title=Path(datafile).name)
+
+
+class PlotExporter:
+    """Renders plots to PNG files with matplotlib in a pool of worker processes, without
+    a display and without blocking the caller. Plots are rendered from the in-memory
+    averages of Datasets with submit() or from datafiles saved by a Datasaver with
+    submit_datafile(), both return futures of the path of the PNG file. export() renders
+    a batch of datafiles in parallel e.g. for reports. Workers are spawned, so scripts
+    must run under 'if __name__ == "__main__":', see qcore.helpers.spawn."""
+
+    MAX_COLS: int = 2  # columns grow to keep the plot grid about square beyond 4 plots
+    MAX_LEGEND_ITEMS: int = 10  # traces beyond which colors follow a colormap
+    PLOT_SIZE: tuple[float] = (6.4, 4.8)  # inches
+    DPI: int = 100
+
+    def __init__(self, max_workers: int = None) -> None:
+        """max_workers = None uses as many processes as there are cpus"""
+        context = spawn.get_context()
+        self._pool = futures.ProcessPoolExecutor(max_workers, mp_context=context)
+
+    def submit(self, filepath, *datasets, title: str = "") -> futures.Future:
+        """render the current averages, errors and fits of Datasets (or objects with the
+        same attributes) to filepath, they are copied before this method returns"""
+        plots = [get_plot(dataset) for dataset in datasets]
+        return self._pool.submit(render, plots, filepath, title)
+
+    def submit_datafile(
+        self, datafile, filepath=None, names: list[str] = None
+    ) -> futures.Future:
+        """render datasets with names (default all) of a datafile to filepath, which
+        defaults to the datafile path with a .png suffix"""
+        datafile = Path(datafile)
+        filepath = datafile.with_suffix(".png") if filepath is None else filepath
+        return self._pool.submit(_export_datafile, datafile, filepath, names)
+
+    def export(self, datafiles, names: list[str] = None) -> dict[Path, Path]:
+        """render datafiles in parallel and wait for all, return {datafile: PNG path}
+        of those exported successfully, failures are logged"""
+        submitted = {}
+        for datafile in datafiles:
+            submitted[self.submit_datafile(datafile, names=names)] = Path(datafile)
+        exported = {}
+        for future in futures.as_completed(submitted):
+            datafile = submitted[future]
+            try:
+                exported[datafile] = future.result()
+            except Exception as err:
+                logger.warning(f"Failed to export '{datafile}', details: {err}.")
+        logger.info(f"Exported {len(exported)} / {len(submitted)} datafiles to PNG.")
+        return exported
+
+    def shutdown(self, wait: bool = True) -> None:
+        """wait = True blocks till submitted exports are done"""
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,93 @@
+""" Asynchronous fitting of live data with fit functions from qcore.libs.fit_fns """
+
+from concurrent import futures
+from typing import Callable, Hashable
+
+import numpy as np
+
+from qcore.helpers.logger import logger
+from qcore.helpers import spawn
+from qcore.libs.fit_fns import estimate
+
+
+class Fitter:
+    """Runs fits in a pool of worker processes so that they do not block the caller.
+
+    Fits are identified by a key supplied by the caller e.g. (dataset name, trace
+    index). Each fit is warm-started from the best values of the previous fit with the
+    same key, or from closed-form estimates if there is none. A new fit is skipped if
+    the previous one is still running or if the data has changed by less than a
+    relative tolerance since it was last fitted. Callers forget() keys they no longer
+    fit, e.g. of datasets no longer plotted, to release their data.
+
+    Workers are spawned, so scripts that fit live data must run under
+    'if __name__ == "__main__":', see qcore.helpers.spawn."""
+
+    MAX_WORKERS: int = 2
+    RTOL: float = 1e-3  # relative change in data below which a refit is skipped
+
+    def __init__(self, max_workers: int = MAX_WORKERS, rtol: float = RTOL) -> None:
+        """ """
+        self.rtol = rtol
+        context = spawn.get_context()
+        self._pool = futures.ProcessPoolExecutor(max_workers, mp_context=context)
+        self._pending: dict[Hashable, futures.Future] = {}
+        self._last_data: dict[Hashable, np.ndarray] = {}  # data of the latest fit
+        self._best_values: dict[Hashable, dict] = {}  # best values of the latest fit
+
+    def submit(self, key: Hashable, fitfn: Callable, y, x) -> bool:
+        """submit fitfn(y, x) to the pool, returns True if a fit was submitted"""
+        if key in self._pending or not self._has_changed(key, y):
+            return False
+        y = np.array(y, dtype=float)  # copy as the caller may update y in place
+        init = self._best_values.get(key)
+        if init is None:
+            estimated = estimate(fitfn, y, x)
+            init = estimated[1] if estimated is not None else None
+        self._pending[key] = self._pool.submit(fitfn, y, x, init=init)
+        self._last_data[key] = y
+        return True
+
+    def _has_changed(self, key: Hashable, y) -> bool:
+        """ """
+        last_y = self._last_data.get(key)
+        if last_y is None or last_y.shape != np.shape(y):
+            return True
+        return np.linalg.norm(y - last_y) > self.rtol * np.linalg.norm(last_y)
+
+    def results(self, wait: bool = False) -> dict[Hashable, tuple[np.ndarray, dict]]:
+        """return {key: (best_fit, best_values)} of fits completed since the last call,
+        set wait = True to block till all pending fits are complete"""
+        if wait:
+            futures.wait(self._pending.values())
+
+        results = {}
+        for key, future in list(self._pending.items()):
+            if not future.done():
+                continue
+            del self._pending[key]
+            try:
+                best_fit, best_values = future.result()
+            except Exception as err:  # fits of noisy early data are expected to fail
+                logger.debug(f"Fit '{key}' failed, details: {err}.")
+                self._best_values.pop(key, None)  # do not warm-start from a failed fit
+            else:
+                self._best_values[key] = best_values
+                results[key] = (best_fit, best_values)
+        return results
+
+    def forget(self, predicate: Callable[[Hashable], bool] = None) -> None:
+        """drop the pending fit, latest data and best values of keys for which
+        predicate(key) is True, of all keys if predicate is None"""
+        keys = set(self._pending) | set(self._last_data) | set(self._best_values)
+        for key in keys:
+            if predicate is None or predicate(key):
+                future = self._pending.pop(key, None)
+                if future is not None:
+                    future.cancel()
+                self._last_data.pop(key, None)
+                self._best_values.pop(key, None)
+
+    def shutdown(self) -> None:
+        """ """
+        self._pool.shutdown(wait=False, cancel_futures=True)
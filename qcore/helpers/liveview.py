@@ -0,0 +1,273 @@
+""" Publishing live Dataset averages, errors and fits to viewers over TCP """
+
+import json
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from qcore.helpers.logger import logger
+from qcore.variables.datasets import Dataset
+
+
+class LiveViewError(Exception):
+    """ """
+
+
+HOST = "127.0.0.1"
+
+# a frame is (JSON header length, body length) followed by the JSON header and the
+# zlib compressed body, which holds the float64 bytes of the arrays listed in the
+# header for keyframes, or their XOR with those of the previous frame for deltas
+_LENGTHS = struct.Struct("!II")
+_FIELDS = ("avg", "sem")  # Dataset arrays that are published
+
+
+def _to_json(value):
+    """ """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return str(value)
+
+
+def _encode(header: dict, metadata: dict, arrays: dict, previous=None) -> bytes:
+    """encode arrays {(dataset name, field): array} as a keyframe with the metadata if
+    previous is None, else as a delta to the previous arrays"""
+    header = {**header, "type": "key" if previous is None else "delta"}
+    if previous is None:
+        header["metadata"] = metadata
+    header["arrays"] = [[*key, array.shape] for key, array in arrays.items()]
+    chunks = []
+    for key, array in arrays.items():
+        if previous is not None:
+            array = np.bitwise_xor(array.view(np.uint64), previous[key].view(np.uint64))
+        chunks.append(array.tobytes())
+    body = zlib.compress(b"".join(chunks), level=1)
+    header = json.dumps(header, default=_to_json).encode()
+    return _LENGTHS.pack(len(header), len(body)) + header + body
+
+
+class LiveViewPublisher:
+    """Broadcasts the averages, standard errors, fit parameters and progress of Datasets
+    to any number of LiveViewClients connected over TCP.
+
+    publish() only takes a snapshot of the Datasets. Each snapshot is encoded once and
+    sent to all clients by a background thread, so the load on the caller does not grow
+    with the number of clients. Snapshots are rate limited to max_rate per second and a
+    snapshot not yet sent is replaced by a newer one. Arrays are sent as deltas, the XOR
+    of their bytes with those of the previous frame, which compress well as the bytes
+    of unchanged values are zero. New clients receive a keyframe of the full arrays and
+    the units and sweep data of the Datasets, as do all clients every KEYFRAME_INTERVAL
+    frames or when the published Datasets change."""
+
+    MAX_RATE: float = 5.0  # snapshots per second
+    KEYFRAME_INTERVAL: int = 100  # frames
+    SEND_TIMEOUT: float = 2.0  # seconds, slower clients are disconnected
+    ACCEPT_TIMEOUT: float = 0.5  # seconds between checks for close() by the acceptor
+
+    def __init__(self, port: int, host: str = HOST, max_rate: float = MAX_RATE):
+        """port = 0 binds to a free port, see address"""
+        self.min_interval = 1 / max_rate
+        self._server = socket.create_server((host, port))
+        self._server.settimeout(LiveViewPublisher.ACCEPT_TIMEOUT)
+        self.address = self._server.getsockname()
+
+        self._condition = threading.Condition()  # guards the attributes below
+        self._snapshot = None  # (header, metadata, arrays) yet to be sent
+        self._new_clients: list[socket.socket] = []  # yet to receive a keyframe
+        self._is_closed = False
+        self._last_publish = -np.inf
+
+        self._clients: list[socket.socket] = []  # only used by the sender thread
+        self._acceptor = threading.Thread(target=self._accept, daemon=True)
+        self._sender = threading.Thread(target=self._send, daemon=True)
+        self._acceptor.start()
+        self._sender.start()
+        logger.info(f"Live view publisher listening on {self.address}.")
+
+    def publish(
+        self, message: str, *datasets: Dataset, is_done=False, tags: list[str] = None
+    ) -> bool:
+        """snapshot datasets to be sent to clients by their name, or by their unique tag
+        if tags are given, returns False if rate limited, the snapshot with is_done =
+        True is never rate limited"""
+        now = time.perf_counter()
+        if self._is_closed:
+            return False
+        if now - self._last_publish < self.min_interval and not is_done:
+            return False
+        self._last_publish = now
+
+        header = {"message": message, "is_done": is_done, "fit_params": {}}
+        metadata, arrays = {}, {}
+        tags = [dataset.name for dataset in datasets] if tags is None else tags
+        for tag, dataset in zip(tags, datasets):
+            shape = dataset.shape[1:]  # discard the averaging dimension "N"
+            header["fit_params"][tag] = dataset.fit_params
+            metadata[tag] = {
+                "units": dataset.units,
+                "sweep_data": dict(dataset.sweep_data),
+            }
+            for field in _FIELDS:
+                value = getattr(dataset, field)
+                array = np.full(shape, np.nan) if value is None else value
+                arrays[(tag, field)] = np.array(array, dtype=float, order="C")
+
+        with self._condition:
+            self._snapshot = (header, metadata, arrays)
+            self._condition.notify()
+        return True
+
+    def close(self) -> None:
+        """send the latest snapshot and disconnect all clients"""
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify()
+        self._sender.join(timeout=LiveViewPublisher.SEND_TIMEOUT)
+        self._acceptor.join(timeout=LiveViewPublisher.ACCEPT_TIMEOUT * 2)
+        for client in self._clients + self._new_clients:
+            client.close()
+        self._server.close()
+        logger.info(f"Live view publisher on {self.address} closed.")
+
+    def _accept(self) -> None:
+        """ """
+        while not self._is_closed:
+            try:
+                client, address = self._server.accept()
+            except socket.timeout:  # not an alias of TimeoutError before Python 3.10
+                continue
+            except OSError as err:
+                if self._is_closed:
+                    return
+                logger.warning(f"Failed to accept a live view client, details: {err}.")
+                time.sleep(LiveViewPublisher.ACCEPT_TIMEOUT)
+                continue
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client.settimeout(LiveViewPublisher.SEND_TIMEOUT)
+            with self._condition:
+                self._new_clients.append(client)
+                self._condition.notify()
+            logger.info(f"Live view client connected from {address}.")
+
+    def _send(self) -> None:
+        """ """
+        frame = None  # (header, metadata, arrays) of the last frame sent
+        count = 0  # of frames sent
+        while True:
+            with self._condition:  # new clients wait till there is a frame to send
+                self._condition.wait_for(
+                    lambda: self._snapshot is not None
+                    or (self._new_clients and frame is not None)
+                    or self._is_closed
+                )
+                snapshot, self._snapshot = self._snapshot, None
+                new_clients = []
+                if frame is not None or snapshot is not None:
+                    new_clients, self._new_clients = self._new_clients, []
+                if snapshot is None and not new_clients and self._is_closed:
+                    return
+
+            if snapshot is not None:  # deltas to clients that have the previous frame
+                previous = None if frame is None else frame[2]
+                frame = snapshot
+                header, metadata, arrays = frame
+                is_key = count % LiveViewPublisher.KEYFRAME_INTERVAL == 0
+                if previous is None or previous.keys() != arrays.keys():
+                    is_key = True
+                elif any(a.shape != previous[k].shape for k, a in arrays.items()):
+                    is_key = True
+                data = _encode(header, metadata, arrays, None if is_key else previous)
+                self._clients = [c for c in self._clients if self._sendall(c, data)]
+                count += 1
+
+            if new_clients:  # keyframe of the last frame sent
+                data = _encode(*frame)
+                self._clients += [c for c in new_clients if self._sendall(c, data)]
+
+    def _sendall(self, client: socket.socket, data: bytes) -> bool:
+        """returns False and closes the client if sending failed"""
+        try:
+            client.sendall(data)
+        except OSError as err:
+            logger.info(f"Live view client disconnected, details: {err}.")
+            client.close()
+            return False
+        return True
+
+
+class LiveViewClient:
+    """Receives frames from a LiveViewPublisher and keeps the latest state of the
+    published Datasets in datasets {name: {"avg", "sem", "units", "fit_params",
+    "sweep_data"}}, with the latest progress message and whether the run is done"""
+
+    def __init__(self, port: int, host: str = HOST, timeout: float = None) -> None:
+        """timeout in seconds applies to connecting and to each receive()"""
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._arrays: dict[tuple[str, str], np.ndarray] = {}  # of the last frame
+        self._metadata: dict[str, dict] = {}  # of the last keyframe
+        self.datasets: dict[str, dict] = {}
+        self.message, self.is_done = None, False
+
+    def __enter__(self):
+        """ """
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        """ """
+        self.close()
+
+    def receive(self) -> dict[str, dict]:
+        """block till the next frame is received and return the updated datasets"""
+        header_length, body_length = _LENGTHS.unpack(self._receive(_LENGTHS.size))
+        header = json.loads(self._receive(header_length))
+        body = zlib.decompress(self._receive(body_length))
+
+        is_key = header["type"] == "key"
+        if is_key:
+            self._metadata = header["metadata"]
+        arrays, offset = {}, 0
+        for name, field, shape in header["arrays"]:
+            count = int(np.prod(shape))
+            array = np.frombuffer(body, np.uint64, count=count, offset=offset)
+            offset += array.nbytes
+            if not is_key:
+                try:
+                    array = np.bitwise_xor(array, self._arrays[(name, field)].ravel())
+                except KeyError:
+                    msg = f"Received a delta of '{name}' {field} before a keyframe."
+                    logger.error(msg)
+                    raise LiveViewError(msg) from None
+            arrays[(name, field)] = array.view(float).reshape(shape).copy()
+        self._arrays = {key: array.view(np.uint64) for key, array in arrays.items()}
+
+        self.message, self.is_done = header["message"], header["is_done"]
+        self.datasets = {
+            name: {
+                **self._metadata[name],
+                "fit_params": fit_params,
+                **{field: arrays[(name, field)] for field in _FIELDS},
+            }
+            for name, fit_params in header["fit_params"].items()
+        }
+        return self.datasets
+
+    def _receive(self, size: int) -> bytes:
+        """ """
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        while view:
+            received = self._socket.recv_into(view)
+            if not received:
+                msg = "Live view publisher closed the connection."
+                logger.error(msg)
+                raise LiveViewError(msg)
+            view = view[received:]
+        return bytes(buffer)
+
+    def close(self) -> None:
+        """ """
+        self._socket.close()
@@ -1,30 +1,134 @@
-""" python threading """
+""" Live plotting of Datasets in a separate process """
 
-import threading
+from functools import partial
+from multiprocessing import shared_memory
+from pathlib import Path
+import queue
 import time
+from types import SimpleNamespace
 
 import numpy as np
 import pyqtgraph as pg
-from pyqtgraph.exporters import ImageExporter
 from PyQt6 import QtCore as qtc
 from PyQt6 import QtWidgets as qtw
 
+from qcore.helpers.exporter import PlotExporter
+from qcore.helpers.fitter import Fitter
 from qcore.helpers.logger import logger
+from qcore.helpers import spawn
+from qcore.libs.fit_fns import ESTIMATOR_MAP, estimate, fit_batch
 from qcore.variables.datasets import Dataset
-from qcore.variables.sweeps import Sweep
 
 
 class PlotterInitializationError(Exception):
     """ """
 
 
+class SharedArray:
+    """Float array in shared memory, pickled by the name of its shared memory block so
+    that the array unpickled in another process is backed by the same memory. Only the
+    creator unlinks the block, processes it spawns share its resource tracker."""
+
+    def __init__(self, shape: tuple[int], name: str = None) -> None:
+        """creates a new shared memory block if name is None, else attaches to it"""
+        self.shape = tuple(shape)
+        size = max(int(np.prod(self.shape)), 1) * np.dtype(float).itemsize
+        create = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.array = np.ndarray(self.shape, dtype=float, buffer=self.memory.buf)
+
+    def __reduce__(self):
+        """ """
+        return SharedArray, (self.shape, self.memory.name)
+
+    def write(self, value) -> None:
+        """ """
+        if value is not None:
+            self.array[...] = value
+
+    def close(self, unlink: bool = False) -> None:
+        """ """
+        self.array = None  # release the buffer export before closing the memory block
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class DatasetView:
+    """Picklable stand-in for a Dataset in the plotting process with the attributes that
+    are plotted, avg and sem are read from shared memory written by the Plotter. It is
+    named by its tag in the Plotter and exported with the plots of the same datafile,
+    that of the Plotter if datafile is None."""
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        avg: SharedArray,
+        sem: SharedArray,
+        tag: str = None,
+        datafile=None,
+    ) -> None:
+        """ """
+        self.name = dataset.name if tag is None else tag
+        self.units, self.datafile = dataset.units, datafile
+        self.fitfn, self.plot_args = dataset.fitfn, dataset.plot_args
+        self.shape, self.sweep_data = dataset.shape, dataset.sweep_data
+        self.axes = [  # Sweeps are replaced by their name and units
+            ax if isinstance(ax, int) else SimpleNamespace(name=ax.name, units=ax.units)
+            for ax in dataset.axes
+        ]
+        self.avg, self.sem = None, None
+        self.best_fit, self.fit_params = None, None
+        self._buffers = (avg, sem)
+
+    def read(self) -> bool:
+        """copy avg and sem from shared memory, return True if either has changed since
+        the last read"""
+        avg, sem = (np.array(buffer.array) for buffer in self._buffers)
+        is_changed = self.avg is None or not (
+            np.array_equal(avg, self.avg, equal_nan=True)
+            and np.array_equal(sem, self.sem, equal_nan=True)
+        )
+        self.avg, self.sem = avg, sem
+        return is_changed
+
+    def close(self) -> None:
+        """ """
+        for buffer in self._buffers:
+            buffer.close()
+
+
+def _concatenate_traces(x, traces, max_points: int = None):
+    """return x and the rows of traces concatenated into 1D arrays with NaN breaks
+    between rows, rows with more than max_points points are peak downsampled i.e. each
+    block of points is replaced by its min and max, the last block holds the remaining
+    points if the row length is not a multiple of the block size"""
+    x, traces = np.asarray(x, dtype=float), np.asarray(traces, dtype=float)
+    step = 0 if max_points is None else 2 * len(x) // max_points
+    if step > 1:
+        size = len(x) // step * step
+        blocks = traces[:, :size].reshape(len(traces), -1, step)
+        mins, maxs, starts = blocks.min(axis=-1), blocks.max(axis=-1), x[:size:step]
+        if size < len(x):  # the remainder is a last, shorter block
+            rest = traces[:, size:]
+            mins = np.column_stack((mins, rest.min(axis=-1)))
+            maxs = np.column_stack((maxs, rest.max(axis=-1)))
+            starts = np.append(starts, x[size])
+        traces = np.stack((mins, maxs), axis=-1).reshape(len(traces), -1)
+        x = np.repeat(starts, 2)
+    xs = np.tile(np.append(x, np.nan), len(traces))
+    ys = np.hstack((traces, np.full((len(traces), 1), np.nan))).ravel()
+    return xs, ys
+
+
 class PlotSpec:
     """ """
 
-    def __init__(self, dataset: Dataset) -> None:
+    def __init__(self, dataset: DatasetView) -> None:
         """ """
         self.plot_item = pg.PlotItem()
-        self.fit_label = None  # will be set by Plotter
+        self.fit_label = None  # will be set by PlotWindow
+        self.fit_results: dict[int, tuple] = {}  # data item index: (best_fit, params)
 
         # determine plot type
         supported_plot_types = ("scatter", "line", "image")
@@ -51,10 +155,14 @@ class PlotSpec:
             logger.error(msg)
             raise PlotterInitializationError(msg)
 
-        if self.num_data_items > Plotter.MAX_DATA_ITEMS:
-            msg = f"Maximum {Plotter.MAX_DATA_ITEMS} data items per plot item allowed."
-            logger.error(msg)
-            raise PlotterInitializationError(msg)
+        # plots with more than MAX_DATA_ITEMS traces draw them concatenated with NaN
+        # breaks, with one data item per group of consecutive traces, one errorbar item
+        # and one fit item, rather than with one of each per trace
+        self.is_multi_trace = self.num_data_items > Plotter.MAX_DATA_ITEMS
+        rows = np.arange(self.num_data_items)
+        self.groups = np.split(rows, self.num_data_items)  # traces of each data item
+        if self.is_multi_trace:
+            self.groups = np.array_split(rows, Plotter.MAX_DATA_ITEMS)
 
         # determine whether or not to plot errorbars, default = True
         self.plot_err = True
@@ -63,26 +171,55 @@ class PlotSpec:
         elif "plot_err" in dataset.plot_args:
             self.plot_err = dataset.plot_args["plot_err"]
 
+        # determine whether to fit with closed-form estimates, default = False
+        self.fast_fit = dataset.plot_args.get("fast_fit", False)
+        fitfn = dataset.fitfn
+        if self.fast_fit and fitfn is not None and fitfn.__name__ not in ESTIMATOR_MAP:
+            logger.warning(f"No closed-form estimator for {fitfn.__name__}, full fit.")
+            self.fast_fit = False
+
+        # determine whether to downsample and clip traces to the view, default = True
+        self.downsample = dataset.plot_args.get("downsample", True)
+        self.err_step = 1  # stride of the data points drawn with errorbars
+        self.max_trace_points = None  # of each trace drawn by a multi-trace plot
+        if self.downsample:
+            num_points = shape[-1] * (self.num_data_items if self.is_multi_trace else 1)
+            self.err_step = -(-num_points // Plotter.MAX_ERRORBARS)  # ceil division
+            self.max_trace_points = Plotter.MAX_TRACE_POINTS
+        self.levels = None  # colorbar (low, high) levels of image plots
+
         # initialize pyqtgraph graphics objects and add them to the plot item
         self.plot_data_items = []
         self.plot_err_items = []
         self.plot_fit_items = []
-        for i in range(self.num_data_items):
-            color = (i, self.num_data_items)
+        num_items = len(self.groups)
+        for i in range(num_items):
+            color = (i, num_items)
             if self.plot_type == "scatter":
                 size = Plotter.SCATTER_DOT_SIZE
-                plot_data_item = pg.ScatterPlotItem(pen=None, size=size, brush=color)
+                plot_data_item = pg.PlotDataItem(
+                    pen=None, symbol="o", symbolSize=size, symbolBrush=color
+                )
+                plot_data_item.setSymbolPen(None)
             elif self.plot_type == "line":
-                plot_data_item = pg.PlotCurveItem(pen=color)
+                plot_data_item = pg.PlotDataItem(pen=color, connect="finite")
             elif self.plot_type == "image":
                 plot_data_item = pg.ImageItem()
                 cmap = dataset.plot_args.get("cmap", "viridis")
                 self.cbar = self.plot_item.addColorBar(
                     plot_data_item, colorMap=cmap, interactive=False
                 )
+            # clipping to the view and pyqtgraph's downsampling assume x is monotonic,
+            # concatenated traces are downsampled by _concatenate_traces() instead
+            is_trace = not self.plot_type == "image"
+            if self.downsample and is_trace and not self.is_multi_trace:
+                self._set_downsampling(plot_data_item)
             self.plot_data_items.append(plot_data_item)
             self.plot_item.addItem(plot_data_item)
 
+            if self.is_multi_trace:  # errorbar and fit items are added below
+                continue
+
             if self.plot_err:
                 plot_err_item = pg.ErrorBarItem(pen={"color": color, "width": 3})
                 self.plot_err_items.append(plot_err_item)
@@ -90,10 +227,22 @@ class PlotSpec:
 
             if dataset.fitfn is not None:
                 pen = pg.mkPen(color=color, style=qtc.Qt.PenStyle.DashLine)
-                plot_fit_item = pg.PlotCurveItem(pen=pen)
+                plot_fit_item = pg.PlotDataItem(pen=pen)
+                if self.downsample:
+                    self._set_downsampling(plot_fit_item)
                 self.plot_fit_items.append(plot_fit_item)
                 self.plot_item.addItem(plot_fit_item)
 
+        if self.is_multi_trace and self.plot_err:
+            plot_err_item = pg.ErrorBarItem(pen={"color": "k", "width": 1})
+            self.plot_err_items.append(plot_err_item)
+            self.plot_item.addItem(plot_err_item)
+        if self.is_multi_trace and dataset.fitfn is not None:
+            pen = pg.mkPen(color="k", style=qtc.Qt.PenStyle.DashLine)
+            plot_fit_item = pg.PlotDataItem(pen=pen, connect="finite")
+            self.plot_fit_items.append(plot_fit_item)
+            self.plot_item.addItem(plot_fit_item)
+
         # set legends
         if self.num_data_items == 1 and not self.plot_type == "image":
             self.plot_legend.addItem(self.plot_data_items[0], f"{dataset.name}_avg")
@@ -101,10 +250,15 @@ class PlotSpec:
                 self.plot_legend.addItem(self.plot_fit_items[0], f"{dataset.name}_fit")
         elif not self.plot_type == "image":
             y = list(dataset.sweep_data.values())[-2]
-            for i in range(self.num_data_items):
-                to_round = (float, np.floating)
-                ytxt = f"{y[i]:.5f}" if isinstance(y[i], to_round) else f"{y[i]}"
-                self.plot_legend.addItem(self.plot_data_items[i], ytxt)
+            to_round = (float, np.floating)
+            self.trace_labels = [  # used by the legend and the fit label
+                f"{y[i]:.5f}" if isinstance(y[i], to_round) else f"{y[i]}"
+                for i in range(self.num_data_items)
+            ]
+            for plot_data_item, rows in zip(self.plot_data_items, self.groups):
+                ytxts = [self.trace_labels[row] for row in (rows[0], rows[-1])]
+                ytxt = ytxts[0] if len(rows) == 1 else " to ".join(ytxts)
+                self.plot_legend.addItem(plot_data_item, ytxt)
 
         # add a crosshair for mouse interaction
         cx = pg.InfiniteLine(angle=90, movable=False)
@@ -119,13 +273,13 @@ class PlotSpec:
         ylabel = dataset.plot_args.get("ylabel", "")
         title = dataset.plot_args.get("title", "")
         if not xlabel:
-            if axes and isinstance(axes[-1], Sweep):
+            if axes and not isinstance(axes[-1], int):
                 xaxis = axes[-1]
                 xlabel = f"{xaxis.name} ({xaxis.units})"
         if not ylabel:
             if data_dim == 2 and self.plot_type == "image":
                 yaxis = axes[-2]
-                if isinstance(yaxis, Sweep):
+                if not isinstance(yaxis, int):
                     ylabel = f"{yaxis.name} ({yaxis.units})"
             else:
                 ylabel = f"{dataset.name} ({dataset.units})"
@@ -139,67 +293,85 @@ class PlotSpec:
         self.plot_item.showGrid(x=True, y=True, alpha=0.5)
         self.plot_item.setMenuEnabled(False)
 
+    def reset(self) -> None:
+        """clear fits and colorbar levels to show the Dataset of a new Plotter"""
+        self.fit_results, self.levels = {}, None
+        for plot_fit_item in self.plot_fit_items:
+            plot_fit_item.setData(x=[], y=[])
+        if self.fit_label is not None:
+            self.fit_label.setText("")
+
+    def _set_downsampling(self, plot_data_item: pg.PlotDataItem) -> None:
+        """draw about two points per pixel, the min and max of the points merged into
+        each, and skip points outside the visible x range"""
+        plot_data_item.setDownsampling(auto=True, method="peak")
+        plot_data_item.setClipToView(True)
+
+    def update_levels(self, z: np.ndarray, exact: bool = False) -> tuple[float]:
+        """update the colorbar levels to the min and max of an evenly strided subsample
+        of z with about MAX_LEVEL_SAMPLES points, or of all of z if exact, the colorbar
+        is only redrawn if the levels have changed"""
+        if not exact:
+            step = int(np.sqrt(z.size / Plotter.MAX_LEVEL_SAMPLES)) + 1
+            z = z[::step, ::step]
+        levels = (float(np.nanmin(z)), float(np.nanmax(z)))
+        if levels != self.levels:
+            self.levels = levels
+            self.cbar.setLevels(low=levels[0], high=levels[1])
+        return self.levels
+
 
 class PlotWidget(pg.GraphicsLayoutWidget):
     """ """
 
-    def __init__(self, filename, *args, **kwargs):
+    def __init__(self, *args, **kwargs):
         """ """
         super().__init__(*args, **kwargs)
-        self.filename = str(filename)
-        self.window_closed = threading.Event()  # set if plot window closed by the user
+        self.on_close = None  # called with no arguments when the widget is closed
 
     def closeEvent(self, *args, **kwargs):
         """ """
-        self.window_closed.set()
-        ImageExporter(self.ci).export(self.filename)
+        if self.on_close is not None:
+            self.on_close()
         super().closeEvent(*args, **kwargs)
 
 
-class Plotter:
-    """ """
+class PlotWindow:
+    """Plotting window shown by the plotting process that Plotters share. Each Plotter
+    binds its Dataset views to the window, which redraws them at every interval in which
+    the Plotter has sent new data. The plot items of the previous Plotter's views are
+    reused if the new views match them, else the plot layout is rebuilt."""
 
-    WINDOW_SIZE = (1200, 800)
-    WINDOW_BORDER = True
-
-    MAX_PLOTS = 4
-    MAX_COLS = 2
-
-    MAX_DATA_ITEMS: int = 10  # maximum number of traces in one plot
-    SCATTER_DOT_SIZE: int = 6
+    IDLE_INTERVAL: float = 0.1  # seconds between checks for commands till first bound
 
     def __init__(
-        self, interval: float, expt_name: str, datafile, *datasets: Dataset
+        self,
+        lock,  # guards the shared memory buffers of the Dataset views
+        commands,  # queue of ("bind", ...) and ("plot", message, stop, exit) commands
+        events,  # queue of events sent back to the Plotter
     ) -> None:
         """ """
-        self.interval = interval
-        self.datasets = datasets
-        self.header, self._header_text = None, expt_name
-        self._expt_name = expt_name
-        self.footer, self._footer_text = None, f"Datafile: {datafile}"
-        self.filename = datafile.parent / f"{datafile.stem}.png"
-
-        if len(datasets) > Plotter.MAX_PLOTS:
-            message = f"Exceeded max number of supported plots: {Plotter.MAX_PLOTS}."
-            logger.error(message)
-            raise PlotterInitializationError(message)
+        self.interval = PlotWindow.IDLE_INTERVAL
+        self.datasets: list[DatasetView] = []
+        self.header, self._expt_name = None, ""
+        self.footer, self._footer_text = None, ""
+        self.lock, self.commands, self.events = lock, commands, events
 
-        # Qt objects to be controlled by the Plotter
+        # Qt objects to be controlled by the PlotWindow
         self.app, self.layout, self.timer = None, None, None
 
-        # Events to coordinate plotting window behaviour in plot()
-        self.new_data_event = threading.Event()  # set if new data is found for plotting
-        self.done_event = threading.Event()  # set if plotting is complete
-        self.exit_event = threading.Event()  # to close plots by the Experiment
+        # fits are run in worker processes to keep the plotting window responsive
+        self.fitter = None  # created by bind() once any dataset is to be fitted
 
-        self.stop_expt = False  # to stop experiment if user closes plotting window
+        # so are PNG exports of the final data batch, or of the latest if closed early
+        self.exporter = None  # created by run()
+        # {datafile: views} exported to a PNG per datafile, emptied once exported
+        self.exports: dict[Path, list[DatasetView]] = {}
 
-        # run() will initialize plots in the plotting window after updating the plotspec
-        self.plotspec: dict[Dataset, PlotSpec] = {}
+        self.is_done = True  # unset by bind(), set once the final batch is plotted
 
-        # open the plotting window in a separate thread
-        self.thread = threading.Thread(target=self.run)
-        self.thread.start()
+        # bind() will initialize plots in the plotting window after updating plotspec
+        self.plotspec: dict[DatasetView, PlotSpec] = {}
 
     def run(self) -> None:
         """ """
@@ -208,17 +380,87 @@ class Plotter:
         )
 
         self.app = pg.mkQApp()
-        self.layout = PlotWidget(filename=self.filename, show=True)
+        self.layout = PlotWidget(show=True)
         self.layout.showMaximized()
         self.layout.setWindowTitle("Qcore plotter")
+        self.layout.on_close = self._export
+        self.exporter = PlotExporter(max_workers=1)
+        self.layout.scene().sigMouseMoved.connect(self.mouse_moved)  # for crosshairs
 
-        self.plotspec: dict[Dataset, PlotSpec] = {d: PlotSpec(d) for d in self.datasets}
+        self.timer = qtc.QTimer()
+        self.timer.timeout.connect(self.update)
+        self.timer.start(int(self.interval * 1000))
 
-        cmax = Plotter.MAX_COLS
-        ht, ft = self._header_text, self._footer_text
+        self.app.exec()
+
+        if not self.is_done:  # the plotting window was closed by the user
+            for dataset in self.datasets:
+                dataset.close()
+            self.events.put(("closed",))
+
+        if self.fitter is not None:
+            self.fitter.shutdown()
+        self.exporter.shutdown(wait=True)  # for the last PNG to be written
+
+    def bind(self, interval: float, expt_name: str, datafile, datasets) -> None:
+        """show the Dataset views of a new Plotter"""
+        if not self.is_done:  # the previous Plotter did not stop
+            for dataset in self.datasets:
+                dataset.close()
+
+        is_reusable = len(datasets) == len(self.datasets) and all(
+            self._is_reusable(old, new) for old, new in zip(self.datasets, datasets)
+        )
+        self.interval, self.datasets, self.is_done = interval, datasets, False
+        self.exports = {}
+        for dataset in datasets:
+            self.exports.setdefault(dataset.datafile or datafile, []).append(dataset)
+        datafiles = ", ".join(str(path) for path in self.exports) or str(datafile)
+        label = "Datafiles" if len(self.exports) > 1 else "Datafile"
+        self._expt_name, self._footer_text = expt_name, f"{label}: {datafiles}"
+
+        if is_reusable:
+            specs = list(self.plotspec.values())
+            self.plotspec = dict(zip(datasets, specs))
+            for spec in specs:
+                spec.reset()
+            self.header.setText(self._expt_name)
+            self.footer.setText(self._footer_text)
+        else:
+            self.layout.clear()
+            self._build()
+
+        if self.fitter is not None:  # of the views of a previous Plotter
+            self.fitter.forget(lambda key: key[0] not in self.plotspec)
+        specs = self.plotspec.items()
+        if self.fitter is None and any(
+            d.fitfn is not None and not s.fast_fit for d, s in specs
+        ):
+            self.fitter = Fitter()
+        self.timer.setInterval(int(self.interval * 1000))
+
+    def _is_reusable(self, old: DatasetView, new: DatasetView) -> bool:
+        """plot items of the old view are reused for the new view if both have the same
+        name, units, shape, fit function, plot arguments and sweep data"""
+        fitfns = [getattr(d.fitfn, "__name__", None) for d in (old, new)]
+        if (old.name, old.units, old.shape) != (new.name, new.units, new.shape):
+            return False
+        if fitfns[0] != fitfns[1] or old.plot_args != new.plot_args:
+            return False
+        if old.sweep_data.keys() != new.sweep_data.keys():
+            return False
+        sweeps = old.sweep_data.keys()
+        return all(np.array_equal(old.sweep_data[k], new.sweep_data[k]) for k in sweeps)
+
+    def _build(self) -> None:
+        """create the plot layout based on the total number of datasets to be plotted"""
+        self.plotspec = {dataset: PlotSpec(dataset) for dataset in self.datasets}
+
+        num_plots = len(self.datasets)
+        cmax = max(Plotter.MAX_COLS, int(np.ceil(np.sqrt(num_plots))))
+        ht, ft = self._expt_name, self._footer_text
         self.header = self.layout.addLabel(ht, colspan=cmax, size="16pt", bold=True)
 
-        # create the plot layout based on the total number of datasets to be plotted
         if len(self.datasets) == 1:  # to ensure proper alignment of borders
             plotspec = list(self.plotspec.values())[0]
             self.layout.addItem(plotspec.plot_item, row=1, col=0, colspan=cmax)
@@ -237,59 +479,79 @@ class Plotter:
                     plotspec.fit_label = fit_lbl
                     has_flbl = True
                 c += 1
-                if c >= Plotter.MAX_COLS:
+                if c >= cmax:
                     c = 0
                     r = r + 2 if has_flbl else r + 1
                     has_flbl = False
-            if c < Plotter.MAX_COLS:
+            if c < cmax:
                 r = r + 2 if has_flbl else r + 1
             ftr = self.layout.addLabel(ft, r, 0, colspan=cmax, size="10pt", bold=True)
         self.footer = ftr
 
-        # setup crosshair
-        for spec in self.plotspec.values():
-            spec.plot_item.scene().sigMouseMoved.connect(self.mouse_moved)
-
         self.layout.ci.layout.setSpacing(20)
         self.layout.ci.setContentsMargins(20, 20, 20, 20)
 
-        self.timer = qtc.QTimer()
-        self.timer.timeout.connect(self.update)
-        self.timer.start(self.interval * 1000)
-
-        self.app.exec()
-
-    def plot(self, message, stop=False, exit=False) -> None:
-        """ """
-        if self.layout is not None and self.layout.window_closed.is_set():
-            self.stop_expt = True
-
-        self._header_text = f"{self._expt_name}{message}"
-        self.new_data_event.set()
-        if exit:
-            time.sleep(self.interval)
-            self.exit_event.set()
-        if stop:
-            time.sleep(self.interval)
-            self.done_event.set()
-
     def update(self):
         """ """
-        if not self.done_event.is_set():
-            if self.new_data_event.is_set():
-                self.new_data_event.clear()
-                self.header.setText(f"{self._header_text}")
+        message, stop, exit, binding = self._receive()
+        if message is not None:
+            self.header.setText(f"{self._expt_name}{message}")
+            with self.lock:  # only redraw datasets that have changed since last update
+                changed = [dataset for dataset in self.datasets if dataset.read()]
+
+            for dataset in changed:
+                spec = self.plotspec[dataset]
+                if spec.num_data_items == 1:
+                    self._plot_single(dataset, spec)
+                else:
+                    self._plot_multiple(dataset, spec)
+
+        if self.fitter is not None:  # plot fits to the final data batch if stopped
+            self._plot_fits(self.fitter.results(wait=stop))
 
-                for dataset, spec in self.plotspec.items():
-                    if spec.num_data_items == 1:
-                        self._plot_single(dataset, spec)
-                    else:
-                        self._plot_multiple(dataset, spec)
-
-        else:
-            if self.exit_event.is_set():
+        if stop:
+            self.is_done = True
+            for dataset, spec in self.plotspec.items():  # exact levels of final data
+                if spec.plot_type == "image":
+                    spec.update_levels(dataset.avg, exact=True)
+            for dataset in self.datasets:
+                dataset.close()
+            if self.fitter is not None:  # as the final fits have been plotted
+                self.fitter.forget()
+            self._export()
+            self.events.put(("done",))
+            if exit:
                 self.layout.close()
-            self.timer.stop()
+                return
+
+        if binding is not None:
+            self.bind(*binding)
+            self.update()  # handle commands sent after the new binding
+
+    def _export(self) -> None:
+        """export the latest data of the Dataset views to a PNG file in the background
+        with matplotlib, rather than by rendering the window on the GUI thread"""
+        title = self.header.text if self.header is not None else ""
+        for datafile, datasets in self.exports.items():
+            filename = datafile.parent / f"{datafile.stem}.png"
+            self.exporter.submit(filename, *datasets, title=title)
+        self.exports = {}  # as the final data batch has been exported
+
+    def _receive(self):
+        """return the latest (message, stop, exit) sent by Plotter.plot() since the last
+        update, message is None if nothing was sent, stop and exit are True if set by
+        any of the commands received, and the arguments of a ("bind", ...) command if
+        one was received, commands after which are left for the next call"""
+        message, stop, exit = None, False, False
+        while True:
+            try:
+                command, *args = self.commands.get_nowait()
+            except queue.Empty:
+                return message, stop, exit, None
+            if command == "bind":
+                return message, stop, exit, args
+            message, is_stop, is_exit = args
+            stop, exit = stop or is_stop, exit or is_exit
 
     def mouse_moved(self, position):
         """ """
@@ -305,7 +567,7 @@ class Plotter:
                 cx.setPos(x)
                 cy.setPos(y)
 
-    def _plot_single(self, dataset: Dataset, plotspec: PlotSpec):
+    def _plot_single(self, dataset: DatasetView, plotspec: PlotSpec):
         """ """
         plot_data_item = plotspec.plot_data_items[0]
         sweep_data = list(dataset.sweep_data.values())
@@ -314,67 +576,280 @@ class Plotter:
         if plotspec.plot_type == "image":
             y = sweep_data[-2]
             z = dataset.avg
-            self._plot_2D(plot_data_item, x, y, z)
-            plotspec.cbar.setLevels(low=np.min(z), high=np.max(z))
+            levels = plotspec.update_levels(z)
+            self._plot_2D(plot_data_item, x, y, z, levels)
         elif plotspec.plot_type in ("scatter", "line"):
             self._plot_1D(plot_data_item, x, y)
             if plotspec.plot_err:
                 plot_err_item = plotspec.plot_err_items[0]
-                self._plot_errorbar(plot_err_item, x, y, dataset.sem)
+                step = plotspec.err_step
+                self._plot_errorbar(plot_err_item, x, y, dataset.sem, step)
 
-            if dataset.fitfn is not None:
-                plot_fit_item = plotspec.plot_fit_items[0]
-                best_fit, fit_params = dataset.fitfn(y, x)
-                self._plot_1D(plot_fit_item, x, best_fit)
-                fit_str = f", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
-                plotspec.fit_label.setText(fit_str)
-                dataset.best_fit, dataset.fit_params = best_fit, fit_params
+            if dataset.fitfn is not None and plotspec.fast_fit:
+                estimated = estimate(dataset.fitfn, y, x)
+                if estimated is not None:
+                    self._plot_fits({(dataset, 0): estimated})
+            elif dataset.fitfn is not None:
+                self.fitter.submit((dataset, 0), dataset.fitfn, y, x)
 
-    def _plot_multiple(self, dataset: Dataset, plotspec: PlotSpec):
+    def _plot_multiple(self, dataset: DatasetView, plotspec: PlotSpec):
         """ """
         sweep_data = list(dataset.sweep_data.values())
         data = dataset.avg
-        x, y, err = sweep_data[-1], sweep_data[-2], dataset.sem
-        all_best_fits, all_fit_params = [], {}
-        for i in range(plotspec.num_data_items):
-            z = data[i]
-            plot_data_item = plotspec.plot_data_items[i]
-            self._plot_1D(plot_data_item, x, z)
-            if plotspec.plot_err:
-                plot_err_item = plotspec.plot_err_items[i]
-                self._plot_errorbar(plot_err_item, x, z, err[i])
-            if dataset.fitfn is not None:
-                plot_fit_item = plotspec.plot_fit_items[i]
-                best_fit, fit_params = dataset.fitfn(z, x)
-                to_round = (float, np.floating)
-                ytxt = f"{y[i]:.5f}" if isinstance(y[i], to_round) else f"{y[i]}"
-                all_fit_params[ytxt] = fit_params
-                all_best_fits.append(best_fit)
-                self._plot_1D(plot_fit_item, x, best_fit)
-
-        dataset.best_fit = np.array(all_best_fits)
-        dataset.fit_params = list(all_fit_params.values())
-
-        fit_str = ""
-        for label, fit_params in all_fit_params.items():
-            fit_str += f"[{label}] "
-            fit_str += f", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
-            fit_str += "<br>"
-        if fit_str:
+        x, err = sweep_data[-1], dataset.sem
+        if plotspec.is_multi_trace:
+            self._plot_traces(plotspec, x, data, err)
+        else:
+            for i in range(plotspec.num_data_items):
+                z = data[i]
+                plot_data_item = plotspec.plot_data_items[i]
+                self._plot_1D(plot_data_item, x, z)
+                if plotspec.plot_err:
+                    plot_err_item = plotspec.plot_err_items[i]
+                    step = plotspec.err_step
+                    self._plot_errorbar(plot_err_item, x, z, err[i], step)
+
+        if dataset.fitfn is not None and plotspec.fast_fit:
+            estimates = {i: estimate(dataset.fitfn, z, x) for i, z in enumerate(data)}
+            estimates = {(dataset, i): e for i, e in estimates.items() if e is not None}
+            self._plot_fits(estimates)
+        elif dataset.fitfn is not None:  # fit all data items in one batched fit
+            fitfn = partial(fit_batch, dataset.fitfn.__name__)
+            self.fitter.submit((dataset, None), fitfn, data, x)
+
+    def _plot_traces(self, plotspec: PlotSpec, x, data, err):
+        """plot the rows of data of a multi-trace plot with one data item per group of
+        rows and one errorbar item for all rows"""
+        max_points = plotspec.max_trace_points
+        for plot_data_item, rows in zip(plotspec.plot_data_items, plotspec.groups):
+            xs, ys = _concatenate_traces(x, data[rows], max_points)
+            self._plot_1D(plot_data_item, xs, ys)
+        if plotspec.plot_err:
+            xs = np.tile(x, len(data))
+            step = plotspec.err_step
+            ys, errs = np.ravel(data), np.ravel(err)
+            self._plot_errorbar(plotspec.plot_err_items[0], xs, ys, errs, step)
+
+    def _plot_fits(self, results):
+        """plot fit results {(dataset, data item index): (best_fit, fit_params)}, where
+        index None denotes a batched fit result with one row per data item"""
+        updated_datasets = set()
+        for (dataset, i), (best_fit, fit_params) in results.items():
+            if dataset not in self.plotspec:  # fit of a previous Plotter's dataset
+                continue
+            plotspec = self.plotspec[dataset]
+            x = list(dataset.sweep_data.values())[-1]
+            if i is None:  # batched fit result with one row per data item
+                fit_results = {
+                    row: (best_fit[row], {k: v[row] for k, v in fit_params.items()})
+                    for row in range(plotspec.num_data_items)
+                }
+            else:
+                fit_results = {i: (best_fit, fit_params)}
+            plotspec.fit_results.update(fit_results)
+            if plotspec.is_multi_trace:  # redraw the fits of all rows with one item
+                best_fits = np.full((plotspec.num_data_items, len(x)), np.nan)
+                for row, (row_best_fit, _) in plotspec.fit_results.items():
+                    best_fits[row] = row_best_fit
+                xs, ys = _concatenate_traces(x, best_fits, plotspec.max_trace_points)
+                self._plot_1D(plotspec.plot_fit_items[0], xs, ys)
+                fit_results = {}
+            for row, (row_best_fit, _) in fit_results.items():
+                self._plot_1D(plotspec.plot_fit_items[row], x, row_best_fit)
+            updated_datasets.add(dataset)
+
+        for dataset in updated_datasets:
+            plotspec = self.plotspec[dataset]
+            fit_results = [v for _, v in sorted(plotspec.fit_results.items())]
+            if plotspec.num_data_items == 1:
+                ((best_fit, fit_params),) = fit_results
+                fit_str = f", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
+                plotspec.fit_label.setText(fit_str)
+                dataset.best_fit, dataset.fit_params = best_fit, fit_params
+                continue
+
+            fit_str = ""
+            rows = sorted(plotspec.fit_results)
+            for i in rows[: Plotter.MAX_DATA_ITEMS]:  # keep the label readable
+                _, fit_params = plotspec.fit_results[i]
+                fit_str += f"[{plotspec.trace_labels[i]}] "
+                fit_str += f", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
+                fit_str += "<br>"
+            if len(rows) > Plotter.MAX_DATA_ITEMS:
+                fit_str += f"... and {len(rows) - Plotter.MAX_DATA_ITEMS} more<br>"
             plotspec.fit_label.setText(fit_str[:-4])
+            dataset.best_fit = np.array([best_fit for best_fit, _ in fit_results])
+            dataset.fit_params = [fit_params for _, fit_params in fit_results]
+
+        for dataset in updated_datasets:  # to update the Plotter's Datasets
+            self.events.put(("fit", dataset.name, dataset.best_fit, dataset.fit_params))
 
     def _plot_1D(self, plot, x, y):
         """ """
         plot.setData(x=x, y=y)
 
-    def _plot_2D(self, plot, x, y, z):
+    def _plot_2D(self, plot, x, y, z, levels):
         """ """
         dx = np.abs(x[1] - x[0])
         dy = np.abs(y[1] - y[0])
         width = np.abs(x[-1] - x[0]) + dx
         height = np.abs(y[-1] - y[0]) + dy
-        plot.setImage(image=z, rect=(x[0] - dx / 2, y[0] - dy / 2, width, height))
+        rect = (x[0] - dx / 2, y[0] - dy / 2, width, height)
+        plot.setImage(image=z, rect=rect, levels=levels, autoLevels=False)
+
+    def _plot_errorbar(self, plot, x, y, err, step=1):
+        """plot errorbars on every step-th data point"""
+        x, y, err = np.asarray(x), np.asarray(y), np.asarray(err)
+        plot.setData(x=x[::step], y=y[::step], height=err[::step])
+
 
-    def _plot_errorbar(self, plot, x, y, err):
+class Plotter:
+    """Live plots Datasets in a plotting window run by a separate process, so that
+    rendering and fitting do not compete with data acquisition for the GIL.
+
+    plot() copies the averages and standard errors of the Datasets to shared memory and
+    sends a (message, stop, exit) command to the plotting process, which redraws at its
+    own pace. Fit results are sent back and set as the best_fit and fit_params of the
+    Datasets. If the user closes the plotting window, stop_expt is set.
+
+    Datasets are plotted by their name, or by a tag of their own if tags are given e.g.
+    when Datasets of merged Experiments share names. Their plots are exported to a PNG
+    next to datafile, or to that of the datafile given for each Dataset if any.
+
+    The plotting process outlives a Plotter that stops without exit, and the next
+    Plotter binds its Datasets to the same window, reusing its plot items if the
+    Datasets match, which saves starting a process and a Qt application per run.
+
+    The plotting process is spawned, so scripts that live plot must run experiments
+    under 'if __name__ == "__main__":', else SpawnError is raised, as the spawned
+    process imports the __main__ script and would run them again."""
+
+    WINDOW_SIZE = (1200, 800)
+    WINDOW_BORDER = True
+
+    MAX_PLOTS = 16
+    MAX_COLS = 2  # columns grow to keep the plot grid about square beyond 4 plots
+
+    MAX_DATA_ITEMS: int = 10  # of traces drawn by separate items, see PlotSpec
+    MAX_TRACE_POINTS: int = 2000  # of each trace drawn in multi-trace plots
+    SCATTER_DOT_SIZE: int = 6
+    MAX_ERRORBARS: int = 500  # errorbars on downsampled traces are drawn on a subset
+    MAX_LEVEL_SAMPLES: int = 4096  # points sampled to set image colorbar levels
+
+    STOP_TIMEOUT: float = 10.0  # seconds to wait for the final fits when stopping
+
+    _service: tuple = None  # (process, lock, commands, events) shared by Plotters
+
+    def __init__(
+        self,
+        interval: float,
+        expt_name: str,
+        datafile,
+        *datasets: Dataset,
+        tags: list[str] = None,  # unique names of the plots, default Dataset names
+        datafiles: list = None,  # of each Dataset, default datafile
+    ) -> None:
         """ """
-        plot.setData(x=x, y=y, height=err)
+        self.interval = interval
+        tags = [dataset.name for dataset in datasets] if tags is None else list(tags)
+        datafiles = [None] * len(datasets) if datafiles is None else list(datafiles)
+        self.datasets = dict(zip(tags, datasets))  # by tag
+
+        if len(self.datasets) != len(datasets) or len(datafiles) != len(datasets):
+            message = "Expect a unique tag and a datafile, if any, per Dataset."
+            logger.error(message)
+            raise PlotterInitializationError(message)
+
+        if len(datasets) > Plotter.MAX_PLOTS:
+            message = f"Exceeded max number of supported plots: {Plotter.MAX_PLOTS}."
+            logger.error(message)
+            raise PlotterInitializationError(message)
+        spawn.check_main_guard()  # before allocating shared memory
+
+        self.stop_expt = False  # to stop experiment if user closes plotting window
+        self.is_done = False  # set once plot() is called with stop = True
+
+        # shared memory buffers of the avg and sem of each dataset
+        self._buffers: dict[str, tuple[SharedArray, SharedArray]] = {}
+        for tag, dataset in self.datasets.items():
+            shape = dataset.shape[1:]  # discard the averaging dimension "N"
+            self._buffers[tag] = (SharedArray(shape), SharedArray(shape))
+        views = [
+            DatasetView(dataset, *self._buffers[tag], tag, datafile)
+            for (tag, dataset), datafile in zip(self.datasets.items(), datafiles)
+        ]
+
+        # start a plotting process unless that of a previous Plotter is still running
+        if Plotter._service is None or not Plotter._service[0].is_alive():
+            Plotter._service = _start_plotting_process()
+        self.process, self._lock, self._commands, self._events = Plotter._service
+        while True:  # discard events meant for a previous Plotter
+            try:
+                self._events.get_nowait()
+            except queue.Empty:
+                break
+        self._commands.put(("bind", interval, expt_name, datafile, views))
+
+    def plot(self, message, stop=False, exit=False) -> None:
+        """ """
+        if self.is_done:
+            return
+
+        self._handle_events()
+
+        with self._lock:
+            for name, (avg, sem) in self._buffers.items():
+                avg.write(self.datasets[name].avg)
+                sem.write(self.datasets[name].sem)
+        self._commands.put(("plot", message, stop, exit))
+
+        if stop:
+            self.is_done = True
+            self._handle_events(until_done=True)
+            for avg, sem in self._buffers.values():
+                avg.close(unlink=True)
+                sem.close(unlink=True)
+
+    def _handle_events(self, until_done: bool = False) -> None:
+        """handle events sent by the plotting process, set until_done = True to wait
+        till it has plotted the final data batch or STOP_TIMEOUT has elapsed"""
+        deadline = time.perf_counter() + Plotter.STOP_TIMEOUT
+        while True:
+            try:
+                if until_done:
+                    timeout = min(self.interval, deadline - time.perf_counter())
+                    event = self._events.get(timeout=max(timeout, 0))
+                else:
+                    event = self._events.get_nowait()
+            except queue.Empty:
+                if not until_done or time.perf_counter() > deadline:
+                    return
+                if not self.process.is_alive():
+                    return
+                continue
+
+            if event[0] == "fit":
+                _, name, best_fit, fit_params = event
+                if name in self.datasets:
+                    dataset = self.datasets[name]
+                    dataset.best_fit, dataset.fit_params = best_fit, fit_params
+            elif event[0] == "closed":
+                self.stop_expt = True
+                return
+            elif event[0] == "done":
+                return
+
+
+def _start_plotting_process() -> tuple:
+    """return (process, lock, commands, events) of a new plotting process"""
+    context = spawn.get_context()
+    lock, commands, events = context.Lock(), context.Queue(), context.Queue()
+    args = (lock, commands, events)
+    process = context.Process(target=_run_plot_window, args=args)
+    process.start()
+    return process, lock, commands, events
+
+
+def _run_plot_window(lock, commands, events):
+    """target of the plotting process shared by Plotters"""
+    PlotWindow(lock, commands, events).run()
@@ -0,0 +1,61 @@
+""" Binary serializer for Pyro5 that ships numpy arrays as raw buffers """
+
+import numpy as np
+from Pyro5 import serializers
+
+# an array is sent as a dict with its dtype, shape and the raw bytes of its data, which
+# marshal writes without conversion, instead of as a list of Python numbers
+_ARRAY_CLASS = "numpy.ndarray"
+
+
+def _array_to_dict(array: np.ndarray) -> dict:
+    """ """
+    array = np.ascontiguousarray(array)
+    return {
+        "__class__": _ARRAY_CLASS,
+        "dtype": array.dtype.str,
+        "shape": array.shape,
+        "data": memoryview(array).cast("B"),  # not copied before marshalling
+    }
+
+
+def _dict_to_array(classname: str, data: dict) -> np.ndarray:
+    """arrays are read-only views of the received bytes, copy them to write"""
+    array = np.frombuffer(data["data"], dtype=np.dtype(data["dtype"]))
+    return array.reshape(data["shape"])
+
+
+class NumpySerializer(serializers.MarshalSerializer):
+    """Marshal serializer that converts numpy arrays at any depth of the data, not only
+    at the top level, to raw buffers with dtype and shape headers, and numpy scalars
+    to Python numbers. Arrays of objects are sent as lists."""
+
+    serializer_id = 16  # ids below are reserved by Pyro5
+    NAME = "numpy"
+
+    def dumpsCall(self, obj, method, vargs, kwargs):
+        """proxies get remote attributes with kwargs None, which marshal can't dump"""
+        return super().dumpsCall(obj, method, vargs, kwargs or {})
+
+    def convert_obj_into_marshallable(self, obj):
+        """ """
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.hasobject:
+                return self.convert_obj_into_marshallable(obj.tolist())
+            return _array_to_dict(obj)
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            return type(obj)(self.convert_obj_into_marshallable(v) for v in obj)
+        if isinstance(obj, dict):
+            return {k: self.convert_obj_into_marshallable(v) for k, v in obj.items()}
+        return super().convert_obj_into_marshallable(obj)
+
+
+def register() -> None:
+    """make NumpySerializer available to Pyro5 in this process, both clients and the
+    server must register it, see Server.serializers"""
+    serializer = NumpySerializer()
+    serializers.serializers[NumpySerializer.NAME] = serializer
+    serializers.serializers_by_id[NumpySerializer.serializer_id] = serializer
+    serializers.SerializerBase.register_dict_to_class(_ARRAY_CLASS, _dict_to_array)
@@ -1,38 +1,276 @@
 """ Instrument server """
 
+from collections import Counter, deque
+from concurrent import futures
 from pathlib import Path
+import threading
+import time
+from typing import Any
 
+import numpy as np
 import Pyro5.api as pyro
 import Pyro5.errors as pyro_errors
+import Pyro5.serializers as pyro_serializers
 
 from qcore.helpers.logger import logger
+from qcore.helpers import serializer
 import qcore.helpers.yamlizer as yml
 from qcore.instruments.instrument import Instrument
 from qcore.resource import Resource
 from qcore.variables.parameter import Parameter
 
 
+class BatchError(Exception):
+    """ """
+
+
+serializer.register()  # on both the Server and its clients, which import this module
+
+
+# a batch operation is a tuple (instrument, parameter, op, value) with op one of
+# BATCH_OPS, parameter is None for "snapshot" and "configure", value is the dict of
+# parameters for "configure" and is None for "get" and "snapshot"
+BATCH_OPS = ("get", "set", "snapshot", "configure")
+
+
+def _execute(instrument, parameter: str, op: str, value: Any) -> Any:
+    """ """
+    if op == "get":
+        return getattr(instrument, parameter)
+    elif op == "set":
+        setattr(instrument, parameter, value)
+    elif op == "snapshot":
+        return instrument.snapshot()
+    elif op == "configure":
+        instrument.configure(**value)
+    else:
+        raise ValueError(f"Invalid {op = }, expect one of {BATCH_OPS}.")
+
+
+def _execute_all(instruments: dict, operations) -> list[tuple[bool, Any]]:
+    """execute operations on instruments {name: instrument} in order, return (True,
+    result) or (False, error message) per operation so one failure does not abort the
+    rest"""
+    results = []
+    for name, parameter, op, value in operations:
+        try:
+            results.append((True, _execute(instruments[name], parameter, op, value)))
+        except Exception as err:
+            message = f"{op} {parameter = } of '{name}' failed: {err!r}"
+            logger.warning(f"{message}.")
+            results.append((False, message))
+    return results
+
+
+class InstrumentDaemon(pyro.Daemon):
+    """Daemon serving a single instrument that handles one request at a time while
+    holding the instrument's lock, so calls to the same instrument are strictly ordered
+    and those to different instruments, each served by its own daemon, run in parallel.
+    It multiplexes client connections in one thread instead of a thread per connection
+    as in the default Pyro daemon, which would let clients reach the instrument
+    concurrently. Batch operations of the Server on the instrument take the same lock
+    through run(). Queue depth and latencies of calls are kept for stats()."""
+
+    MAX_LATENCIES: int = 1000  # number of latest call latencies kept for stats()
+
+    def __init__(self, name: str, **kwargs) -> None:
+        """ """
+        servertype, pyro.config.SERVERTYPE = pyro.config.SERVERTYPE, "multiplex"
+        try:
+            super().__init__(**kwargs)
+        finally:
+            pyro.config.SERVERTYPE = servertype
+        self.name = name
+        self.lock = threading.RLock()  # reentrant as instrument methods nest
+        self._stats_lock = threading.Lock()  # guards the attributes below
+        self._queue_depth = 0  # calls waiting for the lock or running
+        self._max_queue_depth = 0
+        self._latencies = deque(maxlen=InstrumentDaemon.MAX_LATENCIES)  # in seconds
+
+    def handleRequest(self, conn) -> None:
+        """ """
+        self.run(super().handleRequest, conn)
+
+    def run(self, fn, *args) -> Any:
+        """call fn(*args) holding the lock of the instrument and record its latency,
+        including the time spent waiting for the lock"""
+        start = time.perf_counter()
+        with self._stats_lock:
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        try:
+            with self.lock:
+                return fn(*args)
+        finally:
+            with self._stats_lock:
+                self._queue_depth -= 1
+                self._latencies.append(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        """return the current and maximum queue depth, and the number of the latest
+        calls and their latency statistics"""
+        with self._stats_lock:
+            latencies_ms = np.array(self._latencies) * 1e3
+            queue_depth, max_queue_depth = self._queue_depth, self._max_queue_depth
+        has_calls = latencies_ms.size > 0
+        p95 = float(np.percentile(latencies_ms, 95)) if has_calls else None
+        return {
+            "queue_depth": queue_depth,
+            "max_queue_depth": max_queue_depth,
+            "calls": int(latencies_ms.size),  # of the latest MAX_LATENCIES
+            "latency_ms_median": float(np.median(latencies_ms)) if has_calls else None,
+            "latency_ms_p95": p95,
+            "latency_ms_max": float(np.max(latencies_ms)) if has_calls else None,
+        }
+
+
+class InstrumentConnection:
+    """Instantiates, and so connects, an Instrument from its class and parameters in a
+    daemon thread, so that the Server can connect instruments in parallel and is not
+    blocked by a hung device. A connection that failed can be started again. Drivers
+    of the same class often share a vendor library that is not thread-safe, so
+    instruments of the same class connect one at a time, those of different classes
+    connect in parallel."""
+
+    _locks: dict[type, threading.Lock] = {}  # by Instrument class
+    _locks_lock = threading.Lock()  # guards _locks
+
+    def __init__(self, cls: type[Instrument], parameters: dict[str, Any]) -> None:
+        """ """
+        self.cls, self.parameters = cls, parameters
+        self.name = str(parameters.get("name"))
+        self.instrument: Instrument = None  # set once connected
+        self.error: Exception = None  # of the latest attempt
+        self.attempts, self.seconds = 0, None  # seconds taken by the latest attempt
+        self._start, self._thread = None, None
+
+    @property
+    def is_connecting(self) -> bool:
+        """ """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """ """
+        if self.instrument is not None or self.is_connecting:
+            return
+        self.attempts += 1
+        self.error, self.seconds = None, None
+        self._start = time.perf_counter()
+        name = f"connect {self.name}"
+        self._thread = threading.Thread(target=self._connect, name=name, daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> None:
+        """ """
+        with InstrumentConnection._locks_lock:
+            lock = InstrumentConnection._locks.setdefault(self.cls, threading.Lock())
+        try:
+            with lock:
+                self.instrument = self.cls(**self.parameters)
+        except Exception as err:
+            self.error = err
+        finally:
+            self.seconds = time.perf_counter() - self._start
+
+    def wait(self, timeout: float = None) -> bool:
+        """return True if the latest attempt is over within timeout seconds"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.is_connecting
+
+    def report(self) -> dict:
+        """return the status, one of "connected", "connecting" or "failed", the number
+        of attempts, and the seconds taken and error of the latest attempt"""
+        if self.instrument is not None:
+            status = "connected"
+        elif self.is_connecting:
+            status = "connecting"
+        else:
+            status = "failed"
+        seconds = self.seconds
+        if self.is_connecting:  # so far
+            seconds = time.perf_counter() - self._start
+        error = None if self.error is None else repr(self.error)
+        return {
+            "status": status,
+            "attempts": self.attempts,
+            "seconds": seconds,
+            "error": error,
+        }
+
+
 @pyro.expose
 class Server:
-    """ """
+    """Serves instruments, each with its own InstrumentDaemon, and batches of
+    operations on them, see batch(), with the Server's own daemon.
+
+    Instruments are connected at startup, in parallel for different classes and one
+    at a time within a class, see InstrumentConnection. Those that fail to connect
+    within timeout seconds do not delay the Server, they are retried every
+    retry_interval seconds while it serves and are served once connected. See
+    startup for the status and timing of each instrument's connection."""
 
     NAME = "SERVER"
     PORT = 9090  # port to bind a remote server on, used to initialize Pyro Daemon
     URI = f"PYRO:{NAME}@localhost:{PORT}"  # unique resource identifier (URI)
+    MAX_WORKERS: int = 16  # threads executing batch operations on instruments
+    CONNECT_TIMEOUT: float = 30.0  # seconds
+    RETRY_INTERVAL: float = 60.0  # seconds
 
-    def __init__(self, configpath: Path) -> None:
+    def __init__(
+        self,
+        configpath: Path,
+        max_workers: int = MAX_WORKERS,
+        timeout: float = CONNECT_TIMEOUT,
+        retry_interval: float = RETRY_INTERVAL,
+    ) -> None:
         """ """
-        self._instruments: list[Instrument] = yml.load(configpath)
         self._daemon = pyro.Daemon(port=Server.PORT)
-        self._services: list[pyro.URI] = []  # list of instrument URIs, set by _serve()
+        self._services: list[pyro.URI] = []  # instrument URIs, set by _register()
+        self._instruments: list[Instrument] = []  # served, set by _register()
+        self._instrument_map: dict[str, Instrument] = {}  # by name
+        self._daemons: dict[str, InstrumentDaemon] = {}  # by instrument name
+        self._lock = threading.Lock()  # guards the four attributes above
+        self._workers = futures.ThreadPoolExecutor(max_workers, "batch")
+        self._retry_interval = retry_interval
+        self._stopped = threading.Event()  # stops retrying failed connections
+
+        self._connections = [
+            InstrumentConnection(cls, parameters)
+            for cls, parameters in yml.parse(configpath)
+        ]
+        self._connect(timeout)
+
+    def _connect(self, timeout: float) -> None:
+        """ """
+        logger.info(f"Connecting {len(self._connections)} instruments...")
+        for connection in self._connections:
+            connection.start()
+        deadline = time.perf_counter() + timeout
+        for connection in self._connections:
+            connection.wait(max(0, deadline - time.perf_counter()))
+        for connection in self._connections:
+            name, report = connection.name, connection.report()
+            if report["status"] == "connected":
+                logger.info(f"Connected '{name}' in {report['seconds']:.3g}s.")
+            elif report["status"] == "connecting":
+                logger.warning(f"'{name}' timed out after {timeout}s, will retry.")
+            else:
+                logger.warning(f"Failed to connect '{name}', will retry: {report}.")
+
+    @property
+    def startup(self) -> dict[str, dict]:
+        """return InstrumentConnection.report() by instrument name"""
+        return {c.name: c.report() for c in self._connections}
 
     def serve(self) -> None:
         """blocking function"""
         self._expose()
-        for instrument in self._instruments:
-            uri = self._daemon.register(instrument, objectId=instrument.name)
-            self._services.append(uri)
-            logger.info(f"Registered {instrument = } with daemon at {uri = }.")
+        for connection in self._connections:
+            if connection.instrument is not None:
+                self._register(connection.instrument)
+        retrier = threading.Thread(target=self._retry, name="retry", daemon=True)
+        retrier.start()
         self._daemon.register(self, objectId=Server.NAME)
         with self._daemon:
             logger.info("Remote server setup complete! Now listening for requests...")
@@ -40,21 +278,93 @@ class Server:
 
     def _expose(self) -> None:
         """ """
-        classes = {instrument.__class__ for instrument in self._instruments}
+        classes = {connection.cls for connection in self._connections}
         classes |= {Instrument, Resource, Parameter}
         for cls in classes:
             pyro.expose(cls)
             logger.info(f"Exposed class {cls} to Pyro5.")
 
+    def _register(self, instrument: Instrument) -> None:
+        """serve instrument with an InstrumentDaemon of its own"""
+        name = instrument.name
+        daemon = InstrumentDaemon(name)
+        uri = daemon.register(instrument, objectId=name)
+        with self._lock:
+            self._instruments.append(instrument)
+            self._instrument_map[name] = instrument
+            self._daemons[name] = daemon
+            self._services.append(uri)
+        thread = threading.Thread(target=daemon.requestLoop, name=name, daemon=True)
+        thread.start()
+        logger.info(f"Registered {instrument = } with daemon at {uri = }.")
+
+    def _retry(self) -> None:
+        """retry failed connections and serve instruments once connected"""
+        with self._lock:
+            pending = [c for c in self._connections if c.name not in self._daemons]
+        while pending and not self._stopped.wait(self._retry_interval):
+            for connection in pending:
+                if connection.instrument is not None:
+                    self._register(connection.instrument)
+                elif not connection.is_connecting:
+                    logger.info(f"Retrying to connect '{connection.name}'...")
+                    connection.start()
+            with self._lock:
+                pending = [c for c in pending if c.name not in self._daemons]
+
     @property
     def services(self) -> list[pyro.URI]:
         """ """
-        return self._services.copy()
+        with self._lock:
+            return self._services.copy()
+
+    @property
+    def serializers(self) -> list[str]:
+        """names of the serializers this Server accepts, see link()"""
+        return list(pyro_serializers.serializers)
+
+    @property
+    def stats(self) -> dict[str, dict]:
+        """return InstrumentDaemon.stats() by instrument name"""
+        with self._lock:
+            daemons = dict(self._daemons)
+        return {name: daemon.stats() for name, daemon in daemons.items()}
+
+    def batch(self, operations: list[tuple]) -> list[tuple[bool, Any]]:
+        """execute operations (instrument name, parameter, op, value) server-side in a
+        single call, see BATCH_OPS, return (True, result) or (False, error message)
+        per operation in order. Operations on different instruments run in parallel
+        in the worker pool, those on the same instrument run in order."""
+        groups: dict[str, list[int]] = {}  # indices of operations by instrument name
+        for i, operation in enumerate(operations):
+            groups.setdefault(operation[0], []).append(i)
+
+        submitted = {}
+        for name, indices in groups.items():
+            group = [operations[i] for i in indices]
+            daemon = self._daemons.get(name)
+            if daemon is None:  # fails each operation with an unknown instrument
+                future = self._workers.submit(_execute_all, self._instrument_map, group)
+            else:
+                args = (_execute_all, self._instrument_map, group)
+                future = self._workers.submit(daemon.run, *args)
+            submitted[future] = indices
+
+        results = [None] * len(operations)
+        for future, indices in submitted.items():
+            for i, result in zip(indices, future.result()):
+                results[i] = result
+        return results
 
     def teardown(self) -> None:
         """ """
         logger.info("Tearing down the remote server...")
+        self._stopped.set()
+        self._workers.shutdown(wait=True)
         self._disconnect()
+        for daemon in self._daemons.values():
+            with daemon:
+                daemon.shutdown()
         with self._daemon:
             self._daemon.shutdown()
         logger.info("Remote server teardown complete!")
@@ -67,21 +377,224 @@ class Server:
                 instrument.disconnect()
 
 
+class PooledProxy(pyro.Proxy):
+    """Proxy handed out by the ProxyPool. If its connection turns out to be closed e.g.
+    as the server has restarted, it reconnects and retries the call once, so stale
+    connections are detected lazily on use rather than validated on every link. The
+    latency of each call is recorded in the pool."""
+
+    def _pyroInvoke(self, *args, **kwargs):
+        """ """
+        was_connected = self._pyroConnection is not None
+        start = time.perf_counter()
+        try:
+            result = super()._pyroInvoke(*args, **kwargs)
+        except pyro_errors.ConnectionClosedError as err:
+            if not was_connected:  # a new connection failed, not a stale one
+                raise
+            logger.info(f"Reconnecting to {self._pyroUri}, details: {err}.")
+            self._pyroReconnect(tries=ProxyPool.RECONNECT_TRIES)
+            PROXY_POOL.count(reconnects=1)
+            result = super()._pyroInvoke(*args, **kwargs)
+        PROXY_POOL.record(self, time.perf_counter() - start)
+        return result
+
+
+class ProxyPool:
+    """Process-wide pool of connected proxies to the Server and its instruments, so
+    that Stages that link to the Server reuse connections instead of opening one per
+    instrument each time. There is one proxy per (URI, thread) as Pyro proxies must not
+    be shared between threads. Released proxies stay connected in the pool. All proxies
+    to a host use the serializer negotiated once with the Server on that host, see
+    _negotiate_serializer()."""
+
+    RECONNECT_TRIES: int = 3  # with 2s between tries, see pyro.Proxy._pyroReconnect()
+    MAX_LATENCIES: int = 1000  # number of latest call latencies kept for stats()
+
+    def __init__(self) -> None:
+        """ """
+        self._lock = threading.Lock()
+        self._proxies: dict[tuple[str, int], PooledProxy] = {}
+        self._in_use: Counter[tuple[str, int]] = Counter()
+        self._counts = Counter()  # of "connects", "reconnects", "acquires"
+        self._connections: dict[int, int] = {}  # id of proxy: id of its connection
+        self._latencies = deque(maxlen=ProxyPool.MAX_LATENCIES)  # in seconds
+        self._serializers: dict[str, str] = {}  # name of serializer by Server host
+
+    def acquire(self, uri) -> PooledProxy:
+        """return the pooled proxy for uri owned by the calling thread, raise
+        CommunicationError if the serializer can't be negotiated with the Server"""
+        key = (str(uri), threading.get_ident())
+        with self._lock:
+            proxy = self._proxies.get(key)
+        if proxy is None:
+            proxy = PooledProxy(uri)
+            proxy._pyroSerializer = self.get_serializer(proxy._pyroUri.host)
+        with self._lock:
+            proxy = self._proxies.setdefault(key, proxy)
+            self._in_use[key] += 1
+            self._counts["acquires"] += 1
+        return proxy
+
+    def get_serializer(self, host: str) -> str:
+        """return the name of the serializer negotiated with the Server on host"""
+        with self._lock:
+            if host in self._serializers:
+                return self._serializers[host]
+        name = _negotiate_serializer(f"PYRO:{Server.NAME}@{host}:{Server.PORT}")
+        with self._lock:
+            return self._serializers.setdefault(host, name)
+
+    def release(self, *proxies: pyro.Proxy, close: bool = False) -> None:
+        """return proxies to the pool, set close = True to also close their connections
+        and drop them from the pool, proxies not from the pool are released"""
+        for proxy in proxies:
+            key = (str(proxy._pyroUri), threading.get_ident())
+            with self._lock:
+                is_pooled = self._proxies.get(key) is proxy
+                if is_pooled and self._in_use[key] > 0:
+                    self._in_use[key] -= 1
+                if is_pooled and close:
+                    del self._proxies[key]
+                    del self._in_use[key]
+                    self._connections.pop(id(proxy), None)
+            if close or not is_pooled:
+                proxy._pyroRelease()
+
+    def close(self) -> None:
+        """close the connections of all proxies of the calling thread in the pool"""
+        thread = threading.get_ident()
+        with self._lock:
+            proxies = [p for (_, t), p in self._proxies.items() if t == thread]
+        self.release(*proxies, close=True)
+
+    def count(self, **increments: int) -> None:
+        """ """
+        with self._lock:
+            self._counts.update(increments)
+
+    def record(self, proxy: PooledProxy, latency: float) -> None:
+        """record the latency of a call by proxy, and whether it has newly connected"""
+        connection = id(proxy._pyroConnection)
+        with self._lock:
+            if self._connections.get(id(proxy)) != connection:
+                self._connections[id(proxy)] = connection
+                self._counts["connects"] += 1
+            self._latencies.append(latency)
+
+    def stats(self) -> dict:
+        """return the number of pooled, in use and connected proxies, of connects,
+        reconnects and acquires so far, and of calls and their latency statistics"""
+        with self._lock:
+            proxies = list(self._proxies.values())
+            in_use = sum(1 for count in self._in_use.values() if count > 0)
+            counts = dict(self._counts)
+        latencies_ms = np.array(self._latencies) * 1e3
+        has_calls = latencies_ms.size > 0
+        p95 = float(np.percentile(latencies_ms, 95)) if has_calls else None
+        return {
+            "proxies": len(proxies),
+            "in_use": in_use,
+            "connected": sum(1 for p in proxies if p._pyroConnection is not None),
+            "connects": counts.get("connects", 0),
+            "reconnects": counts.get("reconnects", 0),
+            "acquires": counts.get("acquires", 0),
+            "calls": int(latencies_ms.size),  # of the latest MAX_LATENCIES
+            "latency_ms_median": float(np.median(latencies_ms)) if has_calls else None,
+            "latency_ms_p95": p95,
+            "latency_ms_max": float(np.max(latencies_ms)) if has_calls else None,
+        }
+
+
+PROXY_POOL = ProxyPool()
+
+
 def link() -> tuple[pyro.Proxy, list[pyro.Proxy]]:
-    """ """
-    server = pyro.Proxy(Server.URI)
+    """proxies use the NumpySerializer if the Server accepts it, else Pyro's default"""
+    server = None
     try:
+        server = PROXY_POOL.acquire(Server.URI)
         services = server.services
     except pyro_errors.CommunicationError as err:  # no remote server found
+        if server is not None:
+            PROXY_POOL.release(server)
         logger.error(f"Remote server requested but not found at {Server.URI}")
         raise err from None
     else:
-        instruments = [pyro.Proxy(uri) for uri in services]
+        instruments = [PROXY_POOL.acquire(uri) for uri in services]
         return (server, instruments)
 
 
+def _negotiate_serializer(uri: str) -> str:
+    """return the name of the NumpySerializer if the Server at uri accepts it, else
+    None for Pyro's default, asked with a proxy using Pyro's default serializer"""
+    with pyro.Proxy(uri) as server:
+        try:
+            is_accepted = serializer.NumpySerializer.NAME in server.serializers
+        except AttributeError:  # servers predating Server.serializers
+            is_accepted = False
+    if not is_accepted:
+        logger.warning(f"{uri} does not accept numpy arrays as buffers.")
+    return serializer.NumpySerializer.NAME if is_accepted else None
+
+
 def unlink(server: pyro.Proxy, *instruments: pyro.Proxy) -> None:
+    """return proxies to the pool, their connections are kept open for reuse"""
+    PROXY_POOL.release(server, *instruments)
+
+
+def release(*proxies: pyro.Proxy) -> None:
     """ """
-    server._pyroRelease()
-    for instrument in instruments:
-        instrument._pyroRelease()
+    PROXY_POOL.release(*proxies)
+
+
+def execute(*operations: tuple) -> list[Any]:
+    """execute operations (instrument, parameter, op, value) where instruments are
+    local or proxies to instruments on a Server, see BATCH_OPS. Operations on proxies
+    are sent in a single batch call per Server instead of one call per parameter.
+    Return results in order, raise BatchError if any operation failed, after all have
+    been executed."""
+    results = [None] * len(operations)
+    batches: dict[str, list[tuple[int, tuple]]] = {}  # {server host: operations}
+    for i, (instrument, parameter, op, value) in enumerate(operations):
+        if isinstance(instrument, pyro.Proxy):
+            uri = instrument._pyroUri
+            operation = (uri.object, parameter, op, value)
+            batches.setdefault(uri.host, []).append((i, operation))
+        else:
+            name = repr(instrument)
+            operation = (name, parameter, op, value)
+            results[i] = _execute_all({name: instrument}, [operation])[0]
+
+    for host, batch in batches.items():  # instruments are served on other ports
+        proxy = PROXY_POOL.acquire(f"PYRO:{Server.NAME}@{host}:{Server.PORT}")
+        try:
+            indices, batch = zip(*batch)
+            for i, result in zip(indices, proxy.batch(list(batch))):
+                results[i] = tuple(result)
+        finally:
+            PROXY_POOL.release(proxy)
+
+    errors = [result for is_ok, result in results if not is_ok]
+    if errors:
+        message = f"{len(errors)} / {len(operations)} operations failed: {errors}."
+        logger.error(message)
+        raise BatchError(message)
+    return [result for _, result in results]
+
+
+def snapshot(*instruments) -> list[dict]:
+    """return snapshots of instruments, in a single call per Server for proxies"""
+    return execute(*((i, None, "snapshot", None) for i in instruments))
+
+
+def configure(*settings: tuple) -> None:
+    """configure instruments with settings (instrument, {parameter: value}) in a single
+    call per Server for proxies"""
+    execute(*((instrument, None, "configure", value) for instrument, value in settings))
+
+
+def get(parameter: str, *instruments) -> list[Any]:
+    """return the value of parameter of each instrument in a single call per Server for
+    proxies"""
+    return execute(*((i, parameter, "get", None) for i in instruments))
@@ -0,0 +1,63 @@
+""" Context for worker processes that are spawned, not forked """
+
+import ast
+import functools
+import multiprocessing
+from multiprocessing.context import SpawnContext
+import sys
+
+from qcore.helpers.logger import logger
+
+
+class SpawnError(Exception):
+    """ """
+
+
+def get_context() -> SpawnContext:
+    """return the spawn context to start processes with, after check_main_guard(), as
+    forked processes would inherit Qt or acquisition threads"""
+    check_main_guard()
+    return multiprocessing.get_context("spawn")
+
+
+def check_main_guard() -> None:
+    """spawned processes import the __main__ module of the process that starts them,
+    which would run an experiment script again unless its code is guarded by
+    'if __name__ == "__main__":', raise SpawnError if the __main__ script has no such
+    guard, interactive sessions are not checked as they are not imported"""
+    path = getattr(sys.modules.get("__main__"), "__file__", None)
+    if path is not None and not _has_main_guard(path):
+        message = (
+            f"Script '{path}' must run experiments under 'if __name__ == \"__main__\":'"
+            f", else processes spawned for plotting and fitting will run them again."
+        )
+        logger.error(message)
+        raise SpawnError(message)
+
+
+@functools.lru_cache(maxsize=None)
+def _has_main_guard(path: str) -> bool:
+    """ """
+    try:
+        with open(path, encoding="utf-8") as file:
+            tree = ast.parse(file.read(), filename=path)
+    except (OSError, SyntaxError, ValueError):  # e.g. frozen or compiled scripts
+        return True
+    for node in tree.body:
+        if isinstance(node, ast.If) and _is_main_check(node.test):
+            return True
+    return False
+
+
+def _is_main_check(test: ast.expr) -> bool:
+    """ """
+    if not isinstance(test, ast.Compare) or len(test.comparators) != 1:
+        return False
+    if not isinstance(test.ops[0], ast.Eq):
+        return False
+    operands = (test.left, test.comparators[0])
+    has_name = any(isinstance(o, ast.Name) and o.id == "__name__" for o in operands)
+    has_main = any(
+        isinstance(o, ast.Constant) and o.value == "__main__" for o in operands
+    )
+    return has_name and has_main
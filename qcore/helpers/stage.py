@@ -49,6 +49,7 @@ class Stage:
             resources = yml.load(self._configpath)
             if resources:
                 self.add(*resources)
+        self._saved_versions = self._get_versions()  # to skip saving if unchanged
 
         self._server, self._proxies = None, []  # will be updated by _link()
         if remote:
@@ -78,12 +79,26 @@ class Stage:
         logger.debug("Tore down the Stage gracefully!")
 
     def save(self) -> None:
-        """ """
+        """save local Resources to the config file unless they are unchanged since they
+        were loaded or last saved, see Resource.version()"""
         if self._configpath is not None:
+            versions = self._get_versions()
+            if versions == self._saved_versions:
+                logger.debug("Staged resources unchanged, not saving them.")
+                return
             logger.debug(f"Saving staged resources to {self._configpath}...")
             resources = [r for r in self._resources.values() if isinstance(r, Resource)]
             if resources:
                 yml.dump(self._configpath, *resources)
+            self._saved_versions = versions
+
+    def _get_versions(self) -> dict[str, tuple[int, int]]:
+        """return (id, version) of local Resources by name"""
+        return {
+            name: (id(resource), resource.version())
+            for name, resource in self._resources.items()
+            if isinstance(resource, Resource)
+        }
 
     @property
     def resources(self) -> set[str]:
@@ -95,6 +95,22 @@ def load(configpath: Path):
         return yaml.safe_load(config)
 
 
+def parse(configpath: Path) -> list[tuple[Type[Any], dict[str, Any]]]:
+    """returns a list of (Resource class, parameters) read from a YAML file saved by
+    dump() without instantiating them, e.g. to instantiate them in parallel"""
+    with open(configpath, mode="r") as config:
+        logger.debug(f"Parsing resources from '{configpath.name}'...")
+        loader = yaml.SafeLoader(config)
+        try:
+            nodes = loader.get_single_node().value
+            return [
+                (_REGISTRAR._register[node.tag], loader.construct_mapping(node, True))
+                for node in nodes
+            ]
+        finally:
+            loader.dispose()
+
+
 def dump(configpath: Path, *resources) -> None:
     """saves a collection of Resource objects to given .yml configpath"""
     with open(configpath, mode="w+") as config:
@@ -2,6 +2,7 @@
 
 import time
 
+import numpy as np
 import pyvisa
 from Pyro5.errors import SerializeError
 
@@ -76,12 +77,12 @@ class MS46522B(Instrument):
         return [f"{s_param}_{trace_format}" for s_param, trace_format in self._traces]
 
     @property
-    def frequencies(self) -> list:
+    def frequencies(self) -> np.ndarray:
         """ """
         freq_str = self._handle.query(":sense:frequency:data?")[
             MS46522B.HEADER_LENGTH :
         ]
-        return [float(freq) for freq in freq_str.split()]
+        return np.array(freq_str.split(), dtype=float)
 
     @property
     def status(self) -> bool:
@@ -93,7 +94,7 @@ class MS46522B(Instrument):
         else:
             return True
 
-    def sweep(self) -> tuple[list[float], dict[str, list[float]]]:
+    def sweep(self) -> dict[str, np.ndarray]:
         """ """
         self._handle.write(":trigger:single")  # trigger single sweep
         self._handle.write(":display:window:y:auto")  # auto-scale all traces
@@ -114,7 +115,7 @@ class MS46522B(Instrument):
                     data_available = True
                 except:
                     time.sleep(0.5)
-            data[key] = [float(value) for value in datastr.split()]
+            data[key] = np.array(datastr.split(), dtype=float)
 
         return data
 
@@ -16,9 +16,13 @@ from qcore.modes.mode import Mode
 
 
 class QM(Instrument):
-    """By convention, we ensure only one QM is open at a given time"""
+    """By convention, we ensure only one QM is open at a given time. QMs share a config
+    builder so that opening a new QM, e.g. on each run of an Experiment or point of its
+    Qcore sweep, only rebuilds the operations of modes that changed since the last
+    open, see QMConfigBuilder"""
 
     QMM_PORT: int = 9510  # this works but 80 does not
+    _qcb: QMConfigBuilder = QMConfigBuilder()  # shared by QMs, see class docstring
 
     def __init__(
         self, modes: tuple[Mode] = None, oscillators: tuple[LMS] = None
@@ -29,7 +33,6 @@ class QM(Instrument):
         self._qmm: QuantumMachinesManager = None
         self._qm: QuantumMachine = None
         self._config: QMConfig = None
-        self._qcb: QMConfigBuilder = QMConfigBuilder()
 
         self._modes: tuple[Mode] = modes
         self._oscillators: tuple[LMS] = oscillators
@@ -59,7 +62,8 @@ class QM(Instrument):
     def open(self, modes: tuple[Mode], oscillators: tuple[LMS]) -> QuantumMachine:
         """ """
         self._config = self._qcb.build_config(modes, oscillators)
-        self._qm = self._qmm.open_qm(self._config, close_other_machines=True)
+        config = self._config.to_dict()
+        self._qm = self._qmm.open_qm(config, close_other_machines=True)
         return self._qm
 
     def get_config(self) -> dict:
@@ -1,12 +1,15 @@
 """ """
 
-from collections import defaultdict
-from typing import Any
+from collections import Counter, defaultdict
+import hashlib
+from typing import Any, Union
+import weakref
 
 import numpy as np
 
 from qcore.modes.mode import Mode
 from qcore.modes.readout import Readout
+from qcore.helpers import server
 from qcore.helpers.logger import logger
 from qcore.instruments.drivers.vaunix_lms import LMS
 from qcore.pulses.digital_waveform import DigitalWaveform
@@ -18,6 +21,80 @@ class QMConfigBuildingError(Exception):
     """ """
 
 
+def _to_native(value: Any) -> Any:
+    """ """
+    if isinstance(value, dict):
+        return {key: _to_native(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_to_native(v) for v in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+# digests of read-only arrays, such as the waveforms cached by Pulse.sample(), which are
+# hashed once while they are alive rather than at every build
+_array_digests: dict[int, tuple[weakref.ref, bytes]] = {}
+
+
+def _get_array_digest(array: np.ndarray) -> bytes:
+    """ """
+    key = id(array)
+    reference, digest = _array_digests.get(key, (None, None))
+    if reference is not None and reference() is array:
+        return digest
+    header = f"array{array.dtype.str}{array.shape}".encode()
+    digest = hashlib.sha256(header + np.ascontiguousarray(array).tobytes()).digest()
+    if not array.flags.writeable:
+
+        def forget(_) -> None:
+            _array_digests.pop(key, None)
+
+        _array_digests[key] = (weakref.ref(array, forget), digest)
+    return digest
+
+
+def _update_digest(digest, value: Any) -> None:
+    """ """
+    if isinstance(value, np.ndarray):
+        digest.update(_get_array_digest(value))
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for key in sorted(value):
+            _update_digest(digest, key)
+            _update_digest(digest, value[key])
+        digest.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"[")
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b"]")
+    else:
+        value = value.item() if isinstance(value, np.generic) else value
+        digest.update(repr(value).encode() + b",")
+
+
+def _get_digest(value: Any) -> str:
+    """return a hash of the contents of a waveform, digital waveform or integration
+    weights, arrays and lists of the same values hash differently"""
+    digest = hashlib.sha256()
+    _update_digest(digest, value)
+    return digest.hexdigest()[:16]
+
+
+def _get_nbytes(value: Any) -> int:
+    """return the approximate size of the samples in a config entry"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_get_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_get_nbytes(v) for v in value)
+    if isinstance(value, str):
+        return len(value)
+    return 8  # numbers
+
+
 class QMConfig(defaultdict):
     """https://qm-docs.qualang.io/introduction/config"""
 
@@ -34,19 +111,44 @@ class QMConfig(defaultdict):
     MIN_TIME_OF_FLIGHT: int = 24  # ns
     MIN_PULSE_LENGTH: int = 16  # ns
     MAX_PULSE_LENGTH: int = 2 ** 31 - 1  # ns
-
-    def __init__(self) -> None:
-        """ """
+    # sections whose entries are shared by pulses when deduplicated
+    SHARED_SECTIONS: tuple[str] = (
+        "waveforms",
+        "digital_waveforms",
+        "integration_weights",
+    )
+
+    def __init__(self, deduplicate: bool = True) -> None:
+        """deduplicate = True stores identical waveforms, digital waveforms and
+        integration weights once, named '<kind>:<hash of contents>', and shared by all
+        pulses that use them, instead of once per pulse named '<mode>.<pulse>...'"""
         super().__init__(QMConfig)
+        self.deduplicate: bool = deduplicate
 
     def __repr__(self) -> str:
         """ """
         return repr(dict(self))
 
+    def to_dict(self) -> dict:
+        """return a copy of plain dicts and lists, as expected by the QM, waveform
+        samples are stored as numpy arrays until then"""
+        return _to_native(self)
+
     def set_version(self) -> None:
         """ """
         self["version"] = 1
 
+    def remove_mode(self, name: str) -> None:
+        """remove the element of a mode and its pulses, waveforms, digital waveforms and
+        integration weights, which are named with the prefix '<mode name>.'"""
+        self["elements"].pop(name, None)
+        prefix = name + "."
+        for key in ("pulses", "waveforms", "digital_waveforms", "integration_weights"):
+            section = self[key]
+            for entry in [k for k in section if k.startswith(prefix)]:
+                del section[entry]
+        logger.debug(f"Removed mode '{name}' from config.")
+
     def set_ports(self, mode: Mode) -> None:
         """ """
         self.set_controllers()
@@ -80,8 +182,9 @@ class QMConfig(defaultdict):
             "lo_frequency": int(lo_freq),
             "correction": mixer_correction_matrix,
         }
-        if mixer_name in self["mixers"]:
-            self["mixers"][mixer_name].append(mixer_config)
+        if mixer_name in self["mixers"]:  # shared by modes on the same ports
+            if mixer_config not in self["mixers"][mixer_name]:
+                self["mixers"][mixer_name].append(mixer_config)
         else:
             self["mixers"][mixer_name] = [mixer_config]
 
@@ -105,9 +208,62 @@ class QMConfig(defaultdict):
         self["elements"][name]["smearing"] = smearing
         logger.debug(f"Set {name} {smearing = }.")
 
+    def get_shared_name(self, kind: str, contents: Any) -> str:
+        """ """
+        return f"{kind}:{_get_digest(contents)}"
+
+    def get_references(self) -> dict[str, Counter]:
+        """return the number of pulses that refer to each waveform, digital waveform and
+        integration weights"""
+        references = {key: Counter() for key in QMConfig.SHARED_SECTIONS}
+        for pulse_config in self["pulses"].values():
+            references["waveforms"].update(pulse_config.get("waveforms", {}).values())
+            weights = pulse_config.get("integration_weights", {}).values()
+            references["integration_weights"].update(weights)
+            marker = pulse_config.get("digital_marker")
+            if marker is not None:
+                references["digital_waveforms"][marker] += 1
+        return references
+
+    def remove_unused(self) -> None:
+        """remove waveforms, digital waveforms and integration weights that no pulse
+        refers to e.g. shared ones left behind by changed or removed modes"""
+        references = self.get_references()
+        for key in QMConfig.SHARED_SECTIONS:
+            section = self[key]
+            for name in [name for name in section if name not in references[key]]:
+                del section[name]
+
+    def get_deduplication_report(self) -> dict[str, dict]:
+        """return the number of entries and of pulse references to them, the bytes of
+        their samples, and the bytes saved by sharing entries, by section and total"""
+        references, report = self.get_references(), {}
+        for key in QMConfig.SHARED_SECTIONS:
+            section = self[key]
+            sizes = {name: _get_nbytes(entry) for name, entry in section.items()}
+            counts = references[key]
+            report[key] = {
+                "entries": len(section),
+                "references": sum(counts[name] for name in section),
+                "bytes": sum(sizes.values()),
+                "bytes_saved": sum((counts[k] - 1) * v for k, v in sizes.items()),
+            }
+        report["total"] = {
+            stat: sum(report[key][stat] for key in QMConfig.SHARED_SECTIONS)
+            for stat in ("entries", "references", "bytes", "bytes_saved")
+        }
+        return report
+
     def set_operations(self, mode: Mode) -> None:
         """ """
-        for op_name, pulse in mode.operations.items():
+        operations = mode.operations
+        pulses_by_class = defaultdict(list)
+        for pulse in operations.values():
+            pulses_by_class[type(pulse)].append(pulse)
+        for cls, pulses in pulses_by_class.items():  # set_pulse() finds them cached
+            cls.sample_all(pulses)
+
+        for op_name, pulse in operations.items():
             pulse_name = mode.name + "." + pulse.name
             self["elements"][mode.name]["operations"][op_name] = pulse_name
             self.set_pulse(pulse, pulse_name)
@@ -186,18 +342,33 @@ class QMConfig(defaultdict):
         if rf_switch is not None:
             self.set_digital_output_port(rf_switch.port)
 
+    def check_shared_port_offset(self, ports: dict, number: int, offset: float) -> None:
+        """ports may be shared by modes e.g. multiplexed readouts on one feedline, but
+        their offsets must agree as they are set per port"""
+        if number in ports and ports[number]["offset"] != offset:
+            message = (
+                f"Conflicting offsets {ports[number]['offset']} and {offset} for port "
+                f"{number = } shared by modes, modes on the same port must have equal "
+                f"offsets."
+            )
+            raise ValueError(message)
+
     def set_analog_output_port(self, number: int, offset: float) -> None:
         """ """
         self.check_output_port_bounds(number, "Analog output port")
         controllers_config = self["controllers"][QMConfig.CONTROLLER_NAME]
-        controllers_config["analog_outputs"][number]["offset"] = offset
+        ports = controllers_config["analog_outputs"]
+        self.check_shared_port_offset(ports, number, offset)
+        ports[number]["offset"] = offset
         logger.debug(f"Set controller analog output port {number = } with {offset = }.")
 
     def set_analog_input_port(self, number: int, offset: float) -> None:
         """ """
         self.check_input_port_bounds(number, "Analog input port")
         controllers_config = self["controllers"][QMConfig.CONTROLLER_NAME]
-        controllers_config["analog_inputs"][number]["offset"] = offset
+        ports = controllers_config["analog_inputs"]
+        self.check_shared_port_offset(ports, number, offset)
+        ports[number]["offset"] = offset
         logger.debug(f"Set controller analog input port {number = } with {offset = }.")
 
     def set_digital_output_port(self, number: int) -> None:
@@ -246,25 +417,24 @@ class QMConfig(defaultdict):
         if pulse.has_mixed_waveforms():
             waveform_I_name = pulse_name + ".waveform." + "I"
             waveform_Q_name = pulse_name + ".waveform." + "Q"
-            pulse_config["waveforms"]["I"] = waveform_I_name
-            pulse_config["waveforms"]["Q"] = waveform_Q_name
-            self.set_waveforms(pulse, waveform_I_name, waveform_Q_name)
+            names = self.set_waveforms(pulse, waveform_I_name, waveform_Q_name)
+            pulse_config["waveforms"]["I"], pulse_config["waveforms"]["Q"] = names
         else:
             waveform_name = pulse_name + ".waveform"
+            waveform_name, _ = self.set_waveforms(pulse, waveform_name)
             pulse_config["waveforms"]["single"] = waveform_name
-            self.set_waveforms(pulse, waveform_name)
 
         digital_marker = pulse.digital_marker
         if digital_marker is not None:
             marker_name = pulse_name + "." + digital_marker.name
+            marker_name = self.set_digital_waveform(digital_marker, marker_name)
             pulse_config["digital_marker"] = marker_name
-            self.set_digital_waveform(digital_marker, marker_name)
 
         if pulse_type == "measurement" and pulse.has_mixed_waveforms():
             iw_cos_name, iw_sin_name = pulse_name + ".cos", pulse_name + ".sin"
-            pulse_config["integration_weights"]["cos"] = iw_cos_name
-            pulse_config["integration_weights"]["sin"] = iw_sin_name
-            self.set_integration_weights(pulse, iw_cos_name, iw_sin_name)
+            iw_names = self.set_integration_weights(pulse, iw_cos_name, iw_sin_name)
+            pulse_config["integration_weights"]["cos"] = iw_names[0]
+            pulse_config["integration_weights"]["sin"] = iw_names[1]
 
     def set_pulse_length(self, name: str, value: int) -> None:
         """ """
@@ -273,32 +443,42 @@ class QMConfig(defaultdict):
         self["pulses"][name]["length"] = length
         logger.debug(f"Set '{name}' {length = }.")
 
-    def set_waveforms(self, pulse: Pulse, wf_i: str, wf_q: str = None) -> None:
-        """ """
+    def set_waveforms(
+        self, pulse: Pulse, wf_i: str, wf_q: str = None
+    ) -> tuple[str, Union[str, None]]:
+        """return the names the waveforms were set with, see set_waveform()"""
         i_wave, q_wave = pulse.sample()
-        waveform_dict = {wf_i: i_wave, wf_q: q_wave}
-        for name, wave in waveform_dict.items():
-            if wave is not None:
-                try:
-                    wave_len = len(wave)
-                except TypeError:
-                    waveform_type = "constant"
-                else:
-                    waveform_type = "arbitrary"
-                    pulse_len = pulse.total_length
-                    if not pulse_len == wave_len:
-                        message = f"Unequal '{name}' {wave_len = } and {pulse_len = }."
-                        raise ValueError(message)
-
-            self.set_waveform(name, waveform_type, wave)
-
-    def set_waveform(self, name: str, type: str, sample) -> None:
-        """ """
+        names = []
+        for name, wave in ((wf_i, i_wave), (wf_q, q_wave)):
+            if wave is None:
+                names.append(None)
+                continue
+            try:
+                wave_len = len(wave)
+            except TypeError:
+                waveform_type = "constant"
+            else:
+                waveform_type = "arbitrary"
+                pulse_len = pulse.total_length
+                if not pulse_len == wave_len:
+                    message = f"Unequal '{name}' {wave_len = } and {pulse_len = }."
+                    raise ValueError(message)
+            names.append(self.set_waveform(name, waveform_type, wave))
+        return tuple(names)
+
+    def set_waveform(self, name: str, type: str, sample) -> str:
+        """return the name the waveform was set with, which is shared by waveforms with
+        the same type and samples if the config is deduplicated"""
+        if self.deduplicate:
+            name = self.get_shared_name("waveform", (type, sample))
+            if name in self["waveforms"]:
+                return name
         self["waveforms"][name]["type"] = type
         if type == "constant":
             self.set_constant_waveform(name, sample)
         elif type == "arbitrary":
             self.set_arbitrary_waveform(name, sample)
+        return name
 
     def set_constant_waveform(self, name: str, sample: float) -> None:
         """ """
@@ -306,36 +486,58 @@ class QMConfig(defaultdict):
         self["waveforms"][name]["sample"] = sample
         logger.debug(f"Set constant waveform '{name}' with {sample = }.")
 
-    def set_arbitrary_waveform(self, name: str, samples: list[float]) -> None:
+    def set_arbitrary_waveform(self, name: str, samples: np.ndarray) -> None:
         """ """
-        self.check_voltage_bounds(min(samples), f"'{name}' voltage")
-        self.check_voltage_bounds(max(samples), f"'{name}' voltage")
+        samples = np.asarray(samples, dtype=float)
+        self.check_voltage_bounds(float(samples.min()), f"'{name}' voltage")
+        self.check_voltage_bounds(float(samples.max()), f"'{name}' voltage")
         self["waveforms"][name]["samples"] = samples
         logger.debug(f"Set arbitrary waveform '{name}' with {len(samples)} samples.")
 
-    def set_digital_waveform(self, waveform: DigitalWaveform, name: str) -> None:
-        """ """
+    def set_digital_waveform(self, waveform: DigitalWaveform, name: str) -> str:
+        """return the name the digital waveform was set with, see set_waveform()"""
+        if self.deduplicate:
+            name = self.get_shared_name("digital_waveform", waveform.samples)
+            if name in self["digital_waveforms"]:
+                return name
         self["digital_waveforms"][name]["samples"] = waveform.samples
         logger.debug(f"Set digital waveform '{name}'.")
-
-    def set_integration_weights(self, pulse: ReadoutPulse, cos: str, sin: str) -> None:
-        """ """
-        cos_weights, sin_weights = pulse.sample_integration_weights()
-        self["integration_weights"][cos] = cos_weights
-        self["integration_weights"][sin] = sin_weights
+        return name
+
+    def set_integration_weights(
+        self, pulse: ReadoutPulse, cos: str, sin: str
+    ) -> tuple[str, str]:
+        """return the names the integration weights were set with, see
+        set_waveform()"""
+        names = []
+        for name, weights in zip((cos, sin), pulse.sample_integration_weights()):
+            if self.deduplicate:
+                name = self.get_shared_name("integration_weights", weights)
+            self["integration_weights"][name] = weights
+            names.append(name)
+        return tuple(names)
 
 
 class QMConfigBuilder:
-    """ """
-
-    def __init__(self) -> None:
-        """ """
+    """Builds the config incrementally. The operations of a mode, i.e. its pulses,
+    waveforms and integration weights, which are costly to sample, are only rebuilt if
+    the mode or its pulses changed since the previous build, see Resource.version(), or
+    if the files its pulses are sampled from changed. The rest of the config is cheap
+    to build and is rebuilt every time."""
+
+    def __init__(self, deduplicate: bool = True) -> None:
+        """deduplicate = True shares identical waveforms, digital waveforms and
+        integration weights between pulses, see QMConfig"""
+        self.deduplicate: bool = deduplicate
         self._config: QMConfig = None  # built by build_config()
         self._modes: tuple[Mode] = None
         self._lo_frequencies: dict[str, float] = {}
+        # name: (mode, (version, file stamps of pulses)) of modes in the config, the
+        # mode is kept so that a new mode cannot reuse its id while it is compared
+        self._versions: dict[str, tuple] = {}
 
     def build_config(self, modes: tuple[Mode], los: tuple[LMS]) -> QMConfig:
-        """ """
+        """return the config, which is updated in place by later builds"""
         try:
             self._check_modes(*modes)
             self._check_local_oscillators(*los)
@@ -343,16 +545,35 @@ class QMConfigBuilder:
             message = f"Expect tuple arguments for 'modes' and 'los'."
             raise QMConfigBuildingError(message) from None
         else:
-            self._config = QMConfig()
+            if self._config is None:
+                self._config = QMConfig(self.deduplicate)
             self._build_config()
             return self._config
 
+    def invalidate(self) -> None:
+        """rebuild the whole config on the next build e.g. after changes to modes or
+        pulses that bypass Resource change tracking"""
+        self._config, self._versions = None, {}
+
     def _build_config(self) -> None:
         """ """
         config, modes, lo_freqs = self._config, self._modes, self._lo_frequencies
+        names = {mode.name for mode in modes}
+        for name in [name for name in self._versions if name not in names]:
+            config.remove_mode(name)
+            del self._versions[name]
+        for key in ("controllers", "mixers"):  # shared by modes
+            config.pop(key, None)
+
         config.set_version()
         config.set_controllers()
+        num_rebuilt = 0
         for mode in modes:
+            version = (mode.version(), self._get_file_stamps(mode))
+            built_mode, built_version = self._versions.get(mode.name, (None, None))
+            is_changed = built_mode is not mode or built_version != version
+            if is_changed:
+                config.remove_mode(mode.name)
             config.set_ports(mode)
             config.set_intermediate_frequency(mode.name, mode.int_freq)
 
@@ -368,7 +589,23 @@ class QMConfigBuilder:
                 config.set_time_of_flight(mode.name, mode.tof)
                 config.set_smearing(mode.name, mode.smearing)
 
-            config.set_operations(mode)
+            if is_changed:
+                config.set_operations(mode)
+                self._versions[mode.name] = (mode, version)
+                num_rebuilt += 1
+        config.remove_unused()
+        logger.debug(f"Rebuilt operations of {num_rebuilt} / {len(modes)} modes.")
+
+    def get_deduplication_report(self) -> dict[str, dict]:
+        """return QMConfig.get_deduplication_report() of the latest build"""
+        if self._config is None:
+            message = "No config has been built yet, call 'build_config()' first."
+            raise QMConfigBuildingError(message)
+        return self._config.get_deduplication_report()
+
+    def _get_file_stamps(self, mode: Mode) -> tuple:
+        """ """
+        return tuple(pulse.get_file_stamps() for pulse in mode.operations.values())
 
     def _check_modes(self, *modes: Mode) -> None:
         """ """
@@ -386,9 +623,11 @@ class QMConfigBuilder:
 
     def _check_local_oscillators(self, *los: LMS) -> None:
         """ """
-        for lo in los:
-            try:
-                self._lo_frequencies[lo.name] = lo.frequency
-            except AttributeError:
-                message = f"Invalid {lo = }, missing 'name' and 'frequency' attributes."
-                raise QMConfigBuildingError(message) from None
+        keys = ("name", "frequency")
+        operations = [(lo, key, "get", None) for lo in los for key in keys]
+        try:  # in a single call per Server for proxies to remote LOs
+            values = server.execute(*operations)
+        except server.BatchError:
+            message = f"Invalid {los = }, missing 'name' and 'frequency' attributes."
+            raise QMConfigBuildingError(message) from None
+        self._lo_frequencies.update(zip(values[::2], values[1::2]))
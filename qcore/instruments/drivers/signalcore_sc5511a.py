@@ -15,6 +15,7 @@ from ctypes import (
 from pathlib import Path
 
 from qcore.instruments.instrument import Instrument
+from qcore.variables.parameter import Parameter
 
 
 class RFParams(Structure):
@@ -107,6 +108,11 @@ SC.sc5511a_get_device_status.argtypes = [c_void_p, POINTER(DeviceStatus)]
 class SC5511A(Instrument):
     """ """
 
+    output: bool = Parameter(ttl=Instrument.CACHE_TTL)
+    # sets are quantized to the device resolution, so they are read back
+    frequency: float = Parameter(ttl=Instrument.CACHE_TTL, write_through=False)
+    power: float = Parameter(ttl=Instrument.CACHE_TTL, write_through=False)
+
     def __init__(
         self,
         name: str,
@@ -158,7 +164,7 @@ class SC5511A(Instrument):
         """ """
         return bool(self._get_status().operate_status.ext_ref_detect)
 
-    @property
+    @output.getter
     def output(self) -> bool:
         """ """
         return bool(self._get_status().operate_status.rf1_out_enable)
@@ -168,7 +174,7 @@ class SC5511A(Instrument):
         """ """
         SC.sc5511a_set_output(self._handle, int(bool(value)))
 
-    @property
+    @frequency.getter
     def frequency(self) -> float:
         """ """
         return float(self._get_rf_params().rf1_freq)
@@ -178,7 +184,7 @@ class SC5511A(Instrument):
         """ """
         SC.sc5511a_set_freq(self._handle, int(value))
 
-    @property
+    @power.getter
     def power(self) -> float:
         """ """
         return self._get_rf_params().rf_level
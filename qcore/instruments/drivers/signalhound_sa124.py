@@ -87,7 +87,7 @@ class SA124(Instrument):
         self._handle = None
         self._status = False  # set by connect() and _errorcheck()
         self._is_sweep_configured: bool = False  # to set sweep parameters on device
-        self._freqs: list[float] = None  # to save sweep frequencies for quick access
+        self._freqs: np.ndarray = None  # to save sweep frequencies for quick access
 
         # these sweep parameters are set by the user to configure sweeps
         self._center: float = center
@@ -141,7 +141,7 @@ class SA124(Instrument):
         """ """
         return self._status
 
-    def sweep(self) -> tuple[list[float], list[float]]:
+    def sweep(self) -> tuple[np.ndarray, np.ndarray]:
         """ """
         if not self._is_sweep_configured:
             self._configure_sweep()  # updates self._freqs
@@ -149,7 +149,7 @@ class SA124(Instrument):
         sweep_max = np.zeros(len(self._freqs)).astype(np.float64)
         self._errorcheck(SA.saGetSweep_64f(self._handle, sweep_min, sweep_max))
         # as SA124.DETECTOR = 1, returning sweep_max is okay
-        return self._freqs, sweep_max.tolist()
+        return self._freqs, sweep_max
 
     def single_sweep(
         self, center: float = None, averages: int = 1, configure: bool = False
@@ -188,7 +188,7 @@ class SA124(Instrument):
         self._sweep_length = sweep_length = sweep_length.value
         self._start_frequency = start_frequency = start_frequency.value
         self._bin_size = bin_size = bin_size.value
-        self._freqs = [start_frequency + i * bin_size for i in range(sweep_length)]
+        self._freqs = start_frequency + np.arange(sweep_length) * bin_size
         self._is_sweep_configured = True
 
     @property
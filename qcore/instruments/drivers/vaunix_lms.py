@@ -52,9 +52,14 @@ class LMS(Instrument):
     """ """
 
     clocked: bool = Parameter()
-    output: bool = Parameter()
-    frequency: float = Parameter(bounds=check_frequency)
-    power: float = Parameter(bounds=check_power)
+    output: bool = Parameter(ttl=Instrument.CACHE_TTL)
+    # sets are quantized to UNIT_FREQUENCY and UNIT_POWER, so they are read back
+    frequency: float = Parameter(
+        bounds=check_frequency, ttl=Instrument.CACHE_TTL, write_through=False
+    )
+    power: float = Parameter(
+        bounds=check_power, ttl=Instrument.CACHE_TTL, write_through=False
+    )
 
     def __init__(
         self,
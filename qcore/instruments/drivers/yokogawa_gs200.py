@@ -6,6 +6,7 @@ import numpy as np
 import pyvisa
 
 from qcore.instruments.instrument import Instrument, ConnectionError
+from qcore.variables.parameter import Parameter
 
 
 class GS200(Instrument):
@@ -14,6 +15,10 @@ class GS200(Instrument):
     # GS200 takes 10ms to change source level and 20ms for output relay to stabilize
     WAIT_TIME = 0.1  # we set it to 0.1s to be safe
 
+    # Ampere, sets are quantized to the resolution of the range, so they are read back
+    current: float = Parameter(ttl=Instrument.CACHE_TTL, write_through=False)
+    output: bool = Parameter(ttl=Instrument.CACHE_TTL)
+
     def __init__(
         self,
         name: str,
@@ -53,7 +58,7 @@ class GS200(Instrument):
         else:
             return True
 
-    @property
+    @current.getter
     def current(self) -> float:
         """ """
         return float(self._handle.query(":source:level?"))
@@ -64,7 +69,7 @@ class GS200(Instrument):
         self._handle.write(f":source:level:auto {value}")
         time.sleep(GS200.WAIT_TIME)
 
-    @property
+    @output.getter
     def output(self) -> bool:
         """ """
         return bool(int(self._handle.query(":output?")))
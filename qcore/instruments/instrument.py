@@ -1,20 +1,53 @@
 """ """
 
+import functools
+from typing import Any
+
 import numpy as np
 
 from qcore.helpers.logger import logger
-from qcore.variables.parameter import Parameter
+from qcore.variables.parameter import Parameter, ParameterCache
 from qcore.resource import Resource
 
 class ConnectionError(Exception):
     """ """
 
 
-class Instrument(Resource):
+def _is_cached(param) -> bool:
     """ """
+    if not isinstance(param, Parameter):
+        return False
+    return param.ttl is not None and param.is_gettable()
+
+
+def _invalidates_cache(method):
+    """decorate connect() and disconnect() so that cached Parameters are read anew"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        ParameterCache.of(self).invalidate()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class Instrument(Resource):
+    """Parameters of subclasses may opt in to caching their values, see Parameter, with
+    ttl = CACHE_TTL, e.g. for getters that query the hardware, and with write_through =
+    False if the device quantizes set values. Cached values are invalidated on
+    connect() and disconnect() and can be refreshed with refresh()."""
+
+    CACHE_TTL: float = 5.0  # seconds
 
     id: str = Parameter()
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        """ """
+        super().__init_subclass__(**kwargs)
+        for name in ("connect", "disconnect"):
+            if name in cls.__dict__:
+                setattr(cls, name, _invalidates_cache(cls.__dict__[name]))
+
     def __init__(self, id: str, **parameters) -> None:
         """ """
         self._id = str(id)
@@ -49,6 +82,23 @@ class Instrument(Resource):
             raise ConnectionError(f"{self} is not connected (status = False).")
         super().configure(**parameters)
 
+    def refresh(self, *names: str) -> dict[str, Any]:
+        """return the values of the cached Parameters with names (default all) read
+        anew from their getters"""
+        names = names or [k for k, v in self.__class__.params.items() if _is_cached(v)]
+        values = {}
+        for name in names:
+            param = self.__class__.params.get(name)
+            if not _is_cached(param):
+                logger.warning(f"'{name}' is not a cached Parameter of {self}.")
+                continue
+            values[name] = param.refresh(self)
+        return values
+
+    def cache_stats(self) -> dict:
+        """return ParameterCache.stats() of this instrument"""
+        return ParameterCache.of(self).stats()
+
     def snapshot(self) -> dict:
         """ """
         if not self.status:
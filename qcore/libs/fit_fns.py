@@ -1,11 +1,11 @@
 """ """
 
-from inspect import isfunction
+from functools import partial
+from inspect import isfunction, signature
 import math
 
 import lmfit
 from lmfit import Model
-from lmfit.models import LinearModel
 import numpy as np
 
 
@@ -21,92 +21,186 @@ def create_params(**kwargs):
     return lmfit.create_params(**params)
 
 
-def atan(y, x):
+def _fit(model, params, data, init=None, jacobian=None, **independent_vars):
+    """fit model to data, params values are overridden by init (e.g. the best values
+    of a previous fit) to warm-start the fit, parameter bounds are kept as they are.
+    jacobian(**independent_vars, **param values) is an optional analytic Jacobian of
+    the model that returns a dict of parameter name: derivative of the model, it
+    replaces the finite-difference Jacobian of the least-squares solver"""
+    if init is not None:
+        for name, value in init.items():
+            if name in params and params[name].vary:
+                params[name].set(value=float(value))
+    fit_kws = None
+    if jacobian is not None:
+        fit_kws = {"Dfun": partial(_dfun, jacobian), "col_deriv": True}
+    result = model.fit(data, params, fit_kws=fit_kws, **independent_vars)
+    return result.best_fit, result.best_values
+
+
+def _dfun(jacobian, params, data, weights, **independent_vars):
+    """Jacobian of lmfit's residual (data - model) * weights with respect to the varied
+    parameters, as lmfit's Dfun with col_deriv = True"""
+    derivatives = jacobian(**independent_vars, **params.valuesdict())
+    weights = -1.0 if weights is None else -np.ravel(weights)
+    return np.array(
+        [
+            np.ravel(np.broadcast_to(derivatives[name], np.shape(data))) * weights
+            for name, param in params.items()
+            if param.vary
+        ]
+    )
+
+
+def _atan_model(x, fr, Ql, theta, sign=1):
+    """
+    Arctan fit for resonator phase response around complex plane origin
+    x: array of probe frequencies (independent variables)
+    fr: resonant frequency
+    Ql: loaded (total) quality factor
+    theta: arbitrary phase y-offset
+    sign: +1 if S shape, -1 if reverse S shape phase response, not varied
+    note that np.arctan return real values in the interval [-pi/2, pi/2]
+    """
+    return theta + 2 * np.arctan(2 * Ql * sign * (x / fr - 1))
+
+
+def _atan_jacobian(x, fr, Ql, theta, sign=1):
     """ """
+    detuning = x / fr - 1
+    slope = 2 / (1 + (2 * Ql * sign * detuning) ** 2)
+    return {
+        "fr": -slope * 2 * Ql * sign * x / fr**2,
+        "Ql": slope * 2 * sign * detuning,
+        "theta": 1.0,
+        "sign": slope * 2 * Ql * detuning,
+    }
 
-    def fn(x, fr, Ql, theta, sign=1):
-        """
-        Arctan fit for resonator phase response around complex plane origin
-        x: array of probe frequencies (independent variables)
-        fr: resonant frequency
-        Ql: loaded (total) quality factor
-        theta: arbitrary phase y-offset
-        sign: +1 if S shape, -1 if reverse S shape phase response, not varied
-        note that np.arctan return real values in the interval [-pi/2, pi/2]
-        """
-        return theta + 2 * np.arctan(2 * Ql * sign * (x / fr - 1))
 
-    def params(y, x):
-        """ """
-        sign = 1 if y[0] < y[-1] else -1
-        fr = x[np.argmax(np.gradient(y))]
-        Ql = (fr / (max(x) - min(x))) * np.sqrt(len(x))
-        pts = len(y) // 8
-        theta = np.average((y[:pts] + y[-pts:]) / 2)
-        params = create_params(fr=fr, Ql=Ql, theta=theta, sign=sign)
-        params["sign"].set(vary=False)
-        return params
-
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
+def _atan_guess(y, x):
+    """ """
+    sign = 1 if y[0] < y[-1] else -1
+    fr = x[np.argmax(np.gradient(y))]
+    Ql = (fr / (max(x) - min(x))) * np.sqrt(len(x))
+    pts = len(y) // 8
+    theta = np.average((y[:pts] + y[-pts:]) / 2)
+    params = create_params(fr=fr, Ql=Ql, theta=theta, sign=sign)
+    params["sign"].set(vary=False)
+    return params
 
 
-def cohstate_decay(y, x):
+def atan(y, x, init=None):
     """ """
+    model = Model(_atan_model)
+    jacobian = _atan_jacobian
+    return _fit(model, _atan_guess(y, x), y, init, jacobian, x=x)
 
-    def fn(x, amp, alpha0, tau, ofs, n):
-        """
-        Poissonian distribution given photon projection:
-        alpha = alpha0 * exp(-xs / tau)
-        """
-        alphas = alpha0 * np.exp(-x / 2.0 / tau)
-        nbars = alphas**2
-        return ofs + amp * nbars**n / 1 * np.exp(-nbars)
 
-    def params(y, x):
-        """ """
-        mul = 1 if (x[-1] > x[0]) else -1
-        amp = mul * (y[-1] - y[0])
-        if amp < 0:
-            ofs = np.max(y)
-        else:
-            ofs = np.min(y)
-        tau = x[-1] / 5
-        return create_params(n=0, amp=amp, ofs=ofs, alpha0=1.0, tau=tau)
-
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
+def _cohstate_decay_model(x, amp, alpha0, tau, ofs, n):
+    """
+    Poissonian distribution given photon projection:
+    alpha = alpha0 * exp(-xs / tau)
+    """
+    alphas = alpha0 * np.exp(-x / 2.0 / tau)
+    nbars = alphas**2
+    return ofs + amp * nbars**n / 1 * np.exp(-nbars)
 
 
-def displacement_cal(y, x):
+def _cohstate_decay_jacobian(x, amp, alpha0, tau, ofs, n):
     """ """
+    decay = np.exp(-x / tau)
+    nbars = alpha0**2 * decay
+    poisson = nbars**n * np.exp(-nbars)
+    dpoisson = poisson * (n / nbars - 1)  # derivative with respect to nbars
+    return {
+        "amp": poisson,
+        "alpha0": amp * dpoisson * 2 * alpha0 * decay,
+        "tau": amp * dpoisson * nbars * x / tau**2,
+        "ofs": 1.0,
+        "n": amp * poisson * np.log(nbars),
+    }
+
+
+def _cohstate_decay_guess(y, x):
+    """ """
+    mul = 1 if (x[-1] > x[0]) else -1
+    amp = mul * (y[-1] - y[0])
+    if amp < 0:
+        ofs = np.max(y)
+    else:
+        ofs = np.min(y)
+    tau = x[-1] / 5
+    return create_params(n=0, amp=amp, ofs=ofs, alpha0=1.0, tau=tau)
 
-    def fn(x, dispscale, ofs, amp, n):
-        """ """
-        alphas = x * dispscale
-        nbars = alphas**2
-        return ofs + amp * nbars**0 / math.factorial(0) * np.exp(-nbars)
 
-    def params(y, x):
-        """ """
-        mul = -1 if (x[-1] > x[0]) else 1
-        amp = mul * (y[-1] - y[0])
-        ofs = np.max(y) if (amp < 0) else np.min(y)
-        return create_params(dispscale=1.0, ofs=ofs, amp=amp, n=0)
+def cohstate_decay(y, x, init=None):
+    """ """
+    model = Model(_cohstate_decay_model)
+    jacobian = _cohstate_decay_jacobian
+    return _fit(model, _cohstate_decay_guess(y, x), y, init, jacobian, x=x)
 
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
+
+def _displacement_cal_model(x, dispscale, ofs, amp, n):
+    """ """
+    alphas = x * dispscale
+    nbars = alphas**2
+    return ofs + amp * nbars**0 / math.factorial(0) * np.exp(-nbars)
 
 
-def double_gaussian_2dhist(z, y, x):
+def _displacement_cal_jacobian(x, dispscale, ofs, amp, n):
     """ """
+    gaussian = np.exp(-((x * dispscale) ** 2))
+    return {
+        "dispscale": -amp * gaussian * 2 * x**2 * dispscale,
+        "ofs": 1.0,
+        "amp": gaussian,
+        "n": 0.0,
+    }
 
-    def fn(y, x, y0, x0, y1, x1, a0, a1, ofs, sigma=2):
-        """ """
-        r0 = (x - x0) ** 2 + (y - y0) ** 2
-        r1 = (x - x1) ** 2 + (y - y1) ** 2
-        a0_exp, a1_exp = np.exp(-0.5 * r0 / sigma**2), np.exp(-0.5 * r1 / sigma**2)
-        return ofs + a0 * a0_exp + a1 * a1_exp
+
+def _displacement_cal_guess(y, x):
+    """ """
+    mul = -1 if (x[-1] > x[0]) else 1
+    amp = mul * (y[-1] - y[0])
+    ofs = np.max(y) if (amp < 0) else np.min(y)
+    return create_params(dispscale=1.0, ofs=ofs, amp=amp, n=0)
+
+
+def displacement_cal(y, x, init=None):
+    """ """
+    model = Model(_displacement_cal_model)
+    jacobian = _displacement_cal_jacobian
+    return _fit(model, _displacement_cal_guess(y, x), y, init, jacobian, x=x)
+
+
+def _double_gaussian_2dhist_model(y, x, y0, x0, y1, x1, a0, a1, ofs, sigma=2):
+    """ """
+    r0 = (x - x0) ** 2 + (y - y0) ** 2
+    r1 = (x - x1) ** 2 + (y - y1) ** 2
+    a0_exp, a1_exp = np.exp(-0.5 * r0 / sigma**2), np.exp(-0.5 * r1 / sigma**2)
+    return ofs + a0 * a0_exp + a1 * a1_exp
+
+
+def _double_gaussian_2dhist_jacobian(y, x, y0, x0, y1, x1, a0, a1, ofs, sigma=2):
+    """ """
+    r0 = (x - x0) ** 2 + (y - y0) ** 2
+    r1 = (x - x1) ** 2 + (y - y1) ** 2
+    a0_exp, a1_exp = np.exp(-0.5 * r0 / sigma**2), np.exp(-0.5 * r1 / sigma**2)
+    g0, g1 = a0 * a0_exp / sigma**2, a1 * a1_exp / sigma**2
+    return {
+        "y0": g0 * (y - y0),
+        "x0": g0 * (x - x0),
+        "y1": g1 * (y - y1),
+        "x1": g1 * (x - x1),
+        "a0": a0_exp,
+        "a1": a1_exp,
+        "ofs": 1.0,
+        "sigma": (g0 * r0 + g1 * r1) / sigma,
+    }
+
+
+def double_gaussian_2dhist(z, y, x, init=None):
+    """ """
 
     def params(z, y, x):
         """ """
@@ -130,79 +224,141 @@ def double_gaussian_2dhist(z, y, x):
         y1 = y[mask].flatten()[maxidx1]
         a1 = z[mask].flatten()[maxidx1]
 
-        return create_params(y0=y0, x0=x0, y1=y1, x1=x1, a0=a0, a1=a1, sigma=sigma)
+        params = {"y0": y0, "x0": x0, "y1": y1, "x1": x1, "a0": a0, "a1": a1}
+        return create_params(**params, ofs=zofs, sigma=sigma)
 
-    result = Model(fn, independent_vars=["x", "y"]).fit(z, params(z, y, x), y=y, x=x)
-    return result.best_fit, result.best_values
+    model = Model(_double_gaussian_2dhist_model, independent_vars=["x", "y"])
+    jacobian = _double_gaussian_2dhist_jacobian
+    return _fit_2d(model, params(z, y, x), z, y, x, init, jacobian)
+
+
+def _fit_2d(model, params, z, y, x, init=None, jacobian=None):
+    """fit a 2D model on grids flattened once, to avoid 2D temporaries in every model
+    and Jacobian evaluation, returns best_fit with the same shape as z"""
+    z, y, x = np.asarray(z), np.asarray(y), np.asarray(x)
+    grids = {"y": np.ravel(y), "x": np.ravel(x)}
+    best_fit, best_values = _fit(model, params, np.ravel(z), init, jacobian, **grids)
+    return np.reshape(best_fit, z.shape), best_values
 
 
-def exp_decay(y, x):
+def _exp_decay_model(x, A, tau, ofs):
     """ """
+    return A * np.exp(-x / tau) + ofs
 
-    def fn(x, A, tau, ofs):
-        """ """
-        return A * np.exp(-x / tau) + ofs
 
-    def params(y, x):
-        """ """
-        ofs = y[-1]
-        y = y - ofs
-        tau = (x[-1] - x[0]) / 5
-        tau_dict = {"value": tau, "min": 0, "max": 100 * tau}
-        return create_params(A=y[0], tau=tau_dict, ofs=ofs)
+def _exp_decay_jacobian(x, A, tau, ofs):
+    """ """
+    decay = np.exp(-x / tau)
+    return {"A": decay, "tau": A * decay * x / tau**2, "ofs": 1.0}
 
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
+
+def _exp_decay_guess(y, x):
+    """ """
+    ofs = y[-1]
+    y = y - ofs
+    tau = (x[-1] - x[0]) / 5
+    tau_dict = {"value": tau, "min": 0, "max": 100 * tau}
+    return create_params(A=y[0], tau=tau_dict, ofs=ofs)
 
 
-def exp_decay_sine(y, x):
+def exp_decay(y, x, init=None):
     """ """
+    model = Model(_exp_decay_model)
+    jacobian = _exp_decay_jacobian
+    return _fit(model, _exp_decay_guess(y, x), y, init, jacobian, x=x)
 
-    def fn(x, amp=1, f0=0.05, phi=np.pi / 4, ofs=0, tau=0.5):
-        return amp * np.sin(2 * np.pi * x * f0 + phi) * np.exp(-x / tau) + ofs
 
-    def params(y, x):
-        """ """
-        params = sine(y, x, return_params=True)
-        params.add("tau", value=np.average(x), min=0, max=10 * x[-1])
-        return params
+def _exp_decay_sine_model(x, amp=1, f0=0.05, phi=np.pi / 4, ofs=0, tau=0.5):
+    return amp * np.sin(2 * np.pi * x * f0 + phi) * np.exp(-x / tau) + ofs
 
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
 
+def _exp_decay_sine_jacobian(x, amp=1, f0=0.05, phi=np.pi / 4, ofs=0, tau=0.5):
+    """ """
+    arg, decay = 2 * np.pi * x * f0 + phi, np.exp(-x / tau)
+    sin, cos = np.sin(arg) * decay, np.cos(arg) * decay
+    return {
+        "amp": sin,
+        "f0": amp * cos * 2 * np.pi * x,
+        "phi": amp * cos,
+        "ofs": 1.0,
+        "tau": amp * sin * x / tau**2,
+    }
+
+
+def _exp_decay_sine_guess(y, x):
+    """ """
+    params = sine(y, x, return_params=True)
+    params.add("tau", value=np.average(x), min=0, max=10 * x[-1])
+    return params
 
-def gaussian(y, x):
+
+def exp_decay_sine(y, x, init=None):
     """ """
+    model = Model(_exp_decay_sine_model)
+    jacobian = _exp_decay_sine_jacobian
+    return _fit(model, _exp_decay_sine_guess(y, x), y, init, jacobian, x=x)
 
-    def fn(x, x0, sig, ofs, amp):
-        """ """
-        return ofs + amp * np.exp(-((x - x0) ** 2) / (2 * sig**2))
 
-    def params(y, x):
-        """ """
-        ofs = (y[0] + y[-1]) / 2
-        peak_idx = np.argmax(abs(y - ofs))
-        sig = abs(x[-1] - x[0]) / 10
-        yrange = np.max(y) - np.min(y)
-        ofs_min, ofs_max = np.min(y) - 0.3 * yrange, np.max(y) + 0.3 * yrange
-        return create_params(
-            x0={"value": x[peak_idx], "min": np.min(x), "max": np.max(x)},
-            sig={"value": sig, "min": abs(x[1] - x[0]), "max": abs(x[-1] - x[0])},
-            ofs={"value": ofs, "min": ofs_min, "max": ofs_max},
-            amp={"value": y[peak_idx] - ofs, "min": -3 * yrange, "max": 3 * yrange},
-        )
+def _gaussian_model(x, x0, sig, ofs, amp):
+    """ """
+    return ofs + amp * np.exp(-((x - x0) ** 2) / (2 * sig**2))
+
+
+def _gaussian_jacobian(x, x0, sig, ofs, amp):
+    """ """
+    gaussian = np.exp(-((x - x0) ** 2) / (2 * sig**2))
+    return {
+        "x0": amp * gaussian * (x - x0) / sig**2,
+        "sig": amp * gaussian * (x - x0) ** 2 / sig**3,
+        "ofs": 1.0,
+        "amp": gaussian,
+    }
 
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
 
+def _gaussian_guess(y, x):
+    """ """
+    ofs = (y[0] + y[-1]) / 2
+    peak_idx = np.argmax(abs(y - ofs))
+    sig = abs(x[-1] - x[0]) / 10
+    yrange = np.max(y) - np.min(y)
+    ofs_min, ofs_max = np.min(y) - 0.3 * yrange, np.max(y) + 0.3 * yrange
+    return create_params(
+        x0={"value": x[peak_idx], "min": np.min(x), "max": np.max(x)},
+        sig={"value": sig, "min": abs(x[1] - x[0]), "max": abs(x[-1] - x[0])},
+        ofs={"value": ofs, "min": ofs_min, "max": ofs_max},
+        amp={"value": y[peak_idx] - ofs, "min": -3 * yrange, "max": 3 * yrange},
+    )
+
+
+def gaussian(y, x, init=None):
+    """ """
+    model = Model(_gaussian_model)
+    jacobian = _gaussian_jacobian
+    return _fit(model, _gaussian_guess(y, x), y, init, jacobian, x=x)
 
-def gaussian2d_symmetric(z, y, x):
+
+def _gaussian2d_symmetric_model(y, x, y0=0, x0=0, sigma=1, area=1, ofs=0):
     """ """
+    r2 = (x - x0) ** 2 / (2 * sigma**2) + (y - y0) ** 2 / (2 * sigma**2)
+    return ofs + area / (2 * sigma**2) / np.sqrt(np.pi / 2) * np.exp(-r2)
 
-    def fn(y, x, y0=0, x0=0, sigma=1, area=1, ofs=0):
-        """ """
-        r2 = (x - x0) ** 2 / (2 * sigma**2) + (y - y0) ** 2 / (2 * sigma**2)
-        return ofs + area / (2 * sigma**2) / np.sqrt(np.pi / 2) * np.exp(-r2)
+
+def _gaussian2d_symmetric_jacobian(y, x, y0=0, x0=0, sigma=1, area=1, ofs=0):
+    """ """
+    r2 = (x - x0) ** 2 / (2 * sigma**2) + (y - y0) ** 2 / (2 * sigma**2)
+    shape = np.exp(-r2) / (2 * sigma**2) / np.sqrt(np.pi / 2)
+    gaussian = area * shape
+    return {
+        "y0": gaussian * (y - y0) / sigma**2,
+        "x0": gaussian * (x - x0) / sigma**2,
+        "sigma": gaussian * 2 * (r2 - 1) / sigma,
+        "area": shape,
+        "ofs": 1.0,
+    }
+
+
+def gaussian2d_symmetric(z, y, x, init=None):
+    """ """
 
     def params(z, y, x):
         """ """
@@ -231,91 +387,517 @@ def gaussian2d_symmetric(z, y, x):
             ofs=zofs,
         )
 
-    result = Model(fn, independent_vars=["x", "y"]).fit(z, params(z, y, x), y=y, x=x)
-    return result.best_fit, result.best_values
+    model = Model(_gaussian2d_symmetric_model, independent_vars=["x", "y"])
+    jacobian = _gaussian2d_symmetric_jacobian
+    return _fit_2d(model, params(z, y, x), z, y, x, init, jacobian)
 
 
-def linear(y, x):
+def _linear_model(x, slope, intercept):
     """ """
-    result = LinearModel.fit(y, x=x)
-    return result.best_fit, result.best_values
+    return slope * x + intercept
 
 
-def lorentzian(y, x, return_params=False):
+def _linear_jacobian(x, slope, intercept):
     """ """
+    return {"slope": x, "intercept": 1.0}
 
-    def fn(x, fr, ofs, height, fwhm):
-        """ """
-        return np.abs(ofs + height / (1 + 2j * ((x - fr) / fwhm)))
 
-    def params(y, x):
-        """ """
-        pts = len(y) // 8
-        ofs = np.average((y[:pts] + y[-pts:]) / 2)
-        height = np.abs(np.max(y) - np.min(y))
-        fr_idx = (y - np.abs(ofs + height)).argmin()
-        fr = x[fr_idx]
-        is_inverted = np.abs(y[0] - y.max()) < np.abs(y[-1] - y.min())
-        height = -height if is_inverted else height
-        amp, left, right = height / 2 + ofs, y[:fr_idx], y[fr_idx:]
-        fwhm = x[fr_idx + np.abs(right - amp).argmin()] - x[np.abs(left - amp).argmin()]
-        return create_params(fr=fr, ofs=ofs, height=height, fwhm=fwhm)
-
-    fit_params = params(y, x)
+def _linear_guess(y, x):
+    """ """
+    slope, intercept = np.polyfit(x, y, 1)
+    return create_params(slope=slope, intercept=intercept)
+
+
+def linear(y, x, init=None):
+    """ """
+    model = Model(_linear_model)
+    jacobian = _linear_jacobian
+    return _fit(model, _linear_guess(y, x), y, init, jacobian, x=x)
+
+
+def _lorentzian_model(x, fr, ofs, height, fwhm):
+    """ """
+    return np.abs(ofs + height / (1 + 2j * ((x - fr) / fwhm)))
+
+
+def _lorentzian_jacobian(x, fr, ofs, height, fwhm):
+    """ """
+    return _lorentzian_asymmetric_jacobian(x, fr, ofs, height, fwhm, phi=0.0)
+
+
+def _lorentzian_guess(y, x):
+    """ """
+    pts = len(y) // 8
+    ofs = np.average((y[:pts] + y[-pts:]) / 2)
+    height = np.abs(np.max(y) - np.min(y))
+    fr_idx = (y - np.abs(ofs + height)).argmin()
+    fr = x[fr_idx]
+    is_inverted = np.abs(y[0] - y.max()) < np.abs(y[-1] - y.min())
+    height = -height if is_inverted else height
+    amp, left, right = height / 2 + ofs, y[:fr_idx], y[fr_idx:]
+    fwhm = x[fr_idx + np.abs(right - amp).argmin()] - x[np.abs(left - amp).argmin()]
+    return create_params(fr=fr, ofs=ofs, height=height, fwhm=fwhm)
+
+
+def lorentzian(y, x, return_params=False, init=None):
+    """ """
+    fit_params = _lorentzian_guess(y, x)
     if return_params:
         return fit_params
-    result = Model(fn).fit(y, fit_params, x=x)
-    return result.best_fit, result.best_values
+    model, jacobian = Model(_lorentzian_model), _lorentzian_jacobian
+    return _fit(model, fit_params, y, init, jacobian, x=x)
 
 
-def lorentzian_asymmetric(y, x):
+def _lorentzian_asymmetric_model(x, fr, ofs, height, fwhm, phi):
+    """ """
+    return np.abs(ofs + height * np.exp(1j * phi) / (1 + 2j * ((x - fr) / fwhm)))
+
+
+def _lorentzian_asymmetric_jacobian(x, fr, ofs, height, fwhm, phi):
+    """derivatives of |c| follow from those of the complex response c as
+    d|c| = Re(conj(c) dc) / |c|"""
+    detuning = (x - fr) / fwhm
+    denominator = 1 + 2j * detuning
+    peak = height * np.exp(1j * phi) / denominator
+    response = ofs + peak
+    ddetuning = -2j * peak / denominator  # derivative of c with respect to detuning
+    derivatives = {
+        "fr": -ddetuning / fwhm,
+        "ofs": 1.0,
+        "height": peak / height,
+        "fwhm": -ddetuning * detuning / fwhm,
+        "phi": 1j * peak,
+    }
+    conjugate, magnitude = np.conj(response), np.abs(response)
+    return {k: np.real(conjugate * v) / magnitude for k, v in derivatives.items()}
+
+
+def _lorentzian_asymmetric_guess(y, x):
     """ """
+    params = lorentzian(y, x, return_params=True)
+    ofs, height, fr = params["ofs"].value, params["height"].value, params["fr"]
+    phi = 4 * np.arcsin((np.max(y) - ofs) / height)
+    params.add("phi", value=phi)
+    fr_idx = (y - np.abs(ofs + height * np.exp(1j * phi))).argmin()
+    fr.set(value=x[fr_idx])
+    return params
 
-    def fn(x, fr, ofs, height, fwhm, phi):
-        """ """
-        return np.abs(ofs + height * np.exp(1j * phi) / (1 + 2j * ((x - fr) / fwhm)))
 
-    def params(y, x):
-        """ """
-        params = lorentzian(y, x, return_params=True)
-        ofs, height, fr = params["ofs"].value, params["height"].value, params["fr"]
-        phi = 4 * np.arcsin((np.max(y) - ofs) / height)
-        params.add("phi", value=phi)
-        fr_idx = (y - np.abs(ofs + height * np.exp(1j * phi))).argmin()
-        fr.set(value=x[fr_idx])
-        return params
-
-    result = Model(fn).fit(y, params(y, x), x=x)
-    return result.best_fit, result.best_values
+def lorentzian_asymmetric(y, x, init=None):
+    """ """
+    model = Model(_lorentzian_asymmetric_model)
+    jacobian = _lorentzian_asymmetric_jacobian
+    return _fit(model, _lorentzian_asymmetric_guess(y, x), y, init, jacobian, x=x)
 
 
-def sine(y, x, return_params=False):
+def _sine_model(x, f0, ofs, amp, phi):
     """ """
+    return ofs + amp * np.sin(2 * np.pi * f0 * x + phi)
 
-    def fn(x, f0, ofs, amp, phi):
-        """ """
-        return ofs + amp * np.sin(2 * np.pi * f0 * x + phi)
 
-    def params(y, x):
-        """ """
-        fs = np.fft.rfftfreq(len(x), x[1] - x[0])
-        ofs = np.mean(y)
-        fft = np.fft.rfft(y - ofs)
-        idx = np.argmax(abs(fft))
-        return create_params(
-            f0={"value": fs[idx], "min": fs[0], "max": fs[-1]},
-            ofs={"value": ofs, "min": np.min(y), "max": np.max(y)},
-            amp={"value": np.std(y - ofs), "min": 0, "max": np.max(y) - np.min(y)},
-            phi={"value": np.angle(fft[idx]), "min": -2 * np.pi, "max": 2 * np.pi},
-        )
+def _sine_jacobian(x, f0, ofs, amp, phi):
+    """ """
+    arg = 2 * np.pi * f0 * x + phi
+    cos = amp * np.cos(arg)
+    return {"f0": cos * 2 * np.pi * x, "ofs": 1.0, "amp": np.sin(arg), "phi": cos}
+
 
-    fit_params = params(y, x)
+def _sine_guess(y, x):
+    """ """
+    fs = np.fft.rfftfreq(len(x), x[1] - x[0])
+    ofs = np.mean(y)
+    fft = np.fft.rfft(y - ofs)
+    idx = np.argmax(abs(fft))
+    return create_params(
+        f0={"value": fs[idx], "min": fs[0], "max": fs[-1]},
+        ofs={"value": ofs, "min": np.min(y), "max": np.max(y)},
+        amp={"value": np.std(y - ofs), "min": 0, "max": np.max(y) - np.min(y)},
+        phi={"value": np.angle(fft[idx]), "min": -2 * np.pi, "max": 2 * np.pi},
+    )
+
+
+def sine(y, x, return_params=False, init=None):
+    """ """
+    fit_params = _sine_guess(y, x)
     if return_params:
         return fit_params
-    result = Model(fn).fit(y, fit_params, x=x)
-    return result.best_fit, result.best_values
+    model, jacobian = Model(_sine_model), _sine_jacobian
+    return _fit(model, fit_params, y, init, jacobian, x=x)
 
 
 FITFN_MAP = {
-    k: v for k, v in locals().items() if not k == "isfunction" and isfunction(v)
+    k: v
+    for k, v in locals().items()
+    if isfunction(v) and v.__module__ == __name__ and not k.startswith("_")
+}
+
+
+# closed-form estimators for evenly spaced x, orders of magnitude faster than a full
+# fit and returning (best_fit, best_values) like it, for use as live previews and as
+# starting values of full fits
+
+
+def _edge_offset(y):
+    """baseline estimated from the median of the outer eighths of y"""
+    pts = max(len(y) // 8, 1)
+    return np.median(np.concatenate((y[:pts], y[-pts:])))
+
+
+def _peak_moments(y, x):
+    """return (ofs, height, center, fwhm) of the single peak or dip in y, center is the
+    first moment and fwhm the extent of the points above half maximum"""
+    ofs = _edge_offset(y)
+    sign = 1 if np.max(y) - ofs >= ofs - np.min(y) else -1
+    weights = sign * (y - ofs)
+    height = np.max(weights)
+    above = weights >= height / 2
+    center = np.sum(x[above] * weights[above]) / np.sum(weights[above])
+    fwhm = np.count_nonzero(above) * abs(x[1] - x[0])
+    return ofs, sign * height, center, fwhm
+
+
+def _peak_frequency(y, x):
+    """frequency of the largest non-zero FFT peak of y, refined by parabolic
+    interpolation of the log spectrum of Hann-windowed data"""
+    spectrum = np.abs(np.fft.rfft((y - np.mean(y)) * np.hanning(len(y))))
+    idx = np.argmax(spectrum[1:]) + 1
+    if idx < len(spectrum) - 1:
+        left, center, right = np.log(spectrum[idx - 1 : idx + 2] + np.finfo(float).tiny)
+        curvature = left - 2 * center + right
+        if curvature < 0:
+            idx += 0.5 * (left - right) / curvature
+    return idx / (len(y) * abs(x[1] - x[0]))
+
+
+def _decay_scan(y, x, basis):
+    """variable projection over log-spaced decay times tau, basis(tau) returns the
+    design matrices whose coefficients are linear given tau, returns (tau, coefficients)
+    of the least-squares solution refined by parabolic interpolation in log(tau)"""
+    span = abs(x[-1] - x[0])
+    taus = np.geomspace(span / 100, span * 10, 41)
+    matrices = basis(taus[:, np.newaxis])
+    coefficients = np.linalg.pinv(matrices) @ y
+    residuals = np.einsum("tpc,tc->tp", matrices, coefficients) - y
+    costs = np.sum(residuals**2, axis=1)
+
+    idx = np.clip(np.argmin(costs), 1, len(taus) - 2)
+    left, center, right = costs[idx - 1 : idx + 2]
+    curvature = left - 2 * center + right
+    shift = 0.5 * (left - right) / curvature if curvature > 0 else 0.0
+    tau = taus[idx] * (taus[1] / taus[0]) ** np.clip(shift, -1, 1)
+    return tau, np.linalg.lstsq(basis(tau), y, rcond=None)[0]
+
+
+def estimate_exp_decay(y, x):
+    """ """
+
+    def basis(tau):
+        """ """
+        return np.stack(np.broadcast_arrays(np.exp(-x / tau), 1.0), axis=-1)
+
+    tau, (A, ofs) = _decay_scan(y, x, basis)
+    best_values = {"A": A, "tau": tau, "ofs": ofs}
+    return _exp_decay_model(x, **best_values), best_values
+
+
+def estimate_exp_decay_sine(y, x):
+    """ """
+    f0 = _peak_frequency(y, x)
+    sin, cos = np.sin(2 * np.pi * f0 * x), np.cos(2 * np.pi * f0 * x)
+
+    def basis(tau):
+        """ """
+        decay = np.exp(-x / tau)
+        return np.stack(np.broadcast_arrays(decay * sin, decay * cos, 1.0), axis=-1)
+
+    tau, (a_sin, a_cos, ofs) = _decay_scan(y, x, basis)
+    amp, phi = np.hypot(a_sin, a_cos), np.arctan2(a_cos, a_sin)
+    best_values = {"amp": amp, "f0": f0, "phi": phi, "ofs": ofs, "tau": tau}
+    return _exp_decay_sine_model(x, **best_values), best_values
+
+
+def estimate_gaussian(y, x):
+    """ """
+    ofs, amp, x0, fwhm = _peak_moments(y, x)
+    sig = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    best_values = {"x0": x0, "sig": sig, "ofs": ofs, "amp": amp}
+    return _gaussian_model(x, **best_values), best_values
+
+
+def estimate_linear(y, x):
+    """ """
+    slope, intercept = np.polyfit(x, y, 1)
+    best_values = {"slope": slope, "intercept": intercept}
+    return _linear_model(x, **best_values), best_values
+
+
+def estimate_lorentzian(y, x):
+    """ """
+    ofs, height, fr, fwhm = _peak_moments(y, x)
+    best_values = {"fr": fr, "ofs": ofs, "height": height, "fwhm": fwhm}
+    return _lorentzian_model(x, **best_values), best_values
+
+
+def estimate_sine(y, x):
+    """ """
+    f0 = _peak_frequency(y, x)
+    arg = 2 * np.pi * f0 * x
+    basis = np.stack(np.broadcast_arrays(np.sin(arg), np.cos(arg), 1.0), axis=-1)
+    (a_sin, a_cos, ofs), *_ = np.linalg.lstsq(basis, y, rcond=None)
+    amp, phi = np.hypot(a_sin, a_cos), np.arctan2(a_cos, a_sin)
+    best_values = {"f0": f0, "ofs": ofs, "amp": amp, "phi": phi}
+    return _sine_model(x, **best_values), best_values
+
+
+# estimators of fit functions in FITFN_MAP, keyed by fit function name
+ESTIMATOR_MAP = {
+    "exp_decay": estimate_exp_decay,
+    "exp_decay_sine": estimate_exp_decay_sine,
+    "gaussian": estimate_gaussian,
+    "linear": estimate_linear,
+    "lorentzian": estimate_lorentzian,
+    "sine": estimate_sine,
 }
+
+
+def estimate(fitfn, y, x):
+    """return (best_fit, best_values) of the closed-form estimator of fitfn, a fit
+    function in FITFN_MAP or its name, or None if fitfn has no estimator or if the
+    estimate is not finite e.g. for data that is too noisy"""
+    name = fitfn if isinstance(fitfn, str) else getattr(fitfn, "__name__", None)
+    if name not in ESTIMATOR_MAP:
+        return None
+    y, x = np.asarray(y, dtype=float), np.asarray(x, dtype=float)
+    try:
+        with np.errstate(all="ignore"):
+            best_fit, best_values = ESTIMATOR_MAP[name](y, x)
+    except (ValueError, np.linalg.LinAlgError):  # e.g. too few points
+        return None
+    if not np.all(np.isfinite(list(best_values.values()))):
+        return None
+    return best_fit, best_values
+
+
+# model, guess and Jacobian functions of 1D fit functions that support batched fitting
+_BATCH_MODELS = {
+    "atan": (_atan_model, _atan_guess, _atan_jacobian),
+    "cohstate_decay": (
+        _cohstate_decay_model,
+        _cohstate_decay_guess,
+        _cohstate_decay_jacobian,
+    ),
+    "displacement_cal": (
+        _displacement_cal_model,
+        _displacement_cal_guess,
+        _displacement_cal_jacobian,
+    ),
+    "exp_decay": (_exp_decay_model, _exp_decay_guess, _exp_decay_jacobian),
+    "exp_decay_sine": (
+        _exp_decay_sine_model,
+        _exp_decay_sine_guess,
+        _exp_decay_sine_jacobian,
+    ),
+    "gaussian": (_gaussian_model, _gaussian_guess, _gaussian_jacobian),
+    "linear": (_linear_model, _linear_guess, _linear_jacobian),
+    "lorentzian": (_lorentzian_model, _lorentzian_guess, _lorentzian_jacobian),
+    "lorentzian_asymmetric": (
+        _lorentzian_asymmetric_model,
+        _lorentzian_asymmetric_guess,
+        _lorentzian_asymmetric_jacobian,
+    ),
+    "sine": (_sine_model, _sine_guess, _sine_jacobian),
+}
+
+
+def fit_batch(fitfn, ys, x, init=None, max_iterations=200, tolerance=1e-10):
+    """fit each row of the 2D array ys against x with the same 1D fit function.
+
+    All rows are fitted together by a vectorised Levenberg-Marquardt solver. Each
+    iteration evaluates the model and its Jacobian for all rows at once and solves the
+    stacked normal equations of all rows in one call, rows that have converged are
+    dropped from subsequent iterations. Parameter bounds are handled in the same way as
+    lmfit, by fitting unbounded internal variables.
+
+    fitfn: a 1D fit function in FITFN_MAP or its name
+    ys: 2D array with one trace to be fitted per row
+    x: 1D array of independent variable values shared by all rows
+    init: optional dict of parameter name: per-row starting values e.g. to warm-start
+    from the best values of a previous batched fit, if None, rows start from their
+    closed-form estimates (see ESTIMATOR_MAP) where available
+
+    returns (best_fits, best_values) where best_fits has the same shape as ys and
+    best_values is a dict of parameter name: array of per-row best values"""
+    name = fitfn if isinstance(fitfn, str) else fitfn.__name__
+    try:
+        model, guess, model_jacobian = _BATCH_MODELS[name]
+    except KeyError:
+        raise ValueError(f"Batched fitting is not supported for '{name}'.") from None
+
+    ys, x = np.asarray(ys, dtype=float), np.asarray(x, dtype=float)
+
+    # per-row initial guesses, bounds, and which parameters are varied
+    defaults = {k: v.default for k, v in list(signature(model).parameters.items())[1:]}
+    names, guesses = list(defaults), [guess(y, x) for y in ys]
+    values, lower, upper = (np.empty((len(ys), len(names))) for _ in range(3))
+    for row, params in enumerate(guesses):
+        for col, key in enumerate(names):
+            if key in params:
+                param = params[key]
+            else:
+                param = lmfit.Parameter(key, value=defaults[key])
+            values[row, col] = param.value
+            lower[row, col], upper[row, col] = param.min, param.max
+    is_varied = [key not in guesses[0] or guesses[0][key].vary for key in names]
+    varied = np.flatnonzero(is_varied)
+
+    if init is not None:
+        for key, value in init.items():
+            if key in names:
+                values[:, names.index(key)] = value
+    else:  # start from closed-form estimates where available
+        for row, y in enumerate(ys):
+            estimated = estimate(name, y, x)
+            for key, value in (estimated[1] if estimated else {}).items():
+                values[row, names.index(key)] = value
+
+    # degenerate bounds (e.g. from all-zero data) are relaxed to keep the fit feasible
+    is_degenerate = lower >= upper
+    lower[is_degenerate], upper[is_degenerate] = -np.inf, np.inf
+    values = np.clip(values, lower, upper)
+
+    lower, upper = lower[:, varied], upper[:, varied]
+
+    def evaluate(internal_values, rows):
+        """ """
+        params = values[rows].copy()
+        params[:, varied] = _from_internal(internal_values, lower[rows], upper[rows])
+        return np.broadcast_to(model(x, *params.T[:, :, np.newaxis]), ys[rows].shape)
+
+    def jacobian(internal_values, rows):
+        """analytic Jacobian of shape (rows, points, varied parameters) with respect to
+        the internal variables"""
+        params = values[rows].copy()
+        params[:, varied] = _from_internal(internal_values, lower[rows], upper[rows])
+        derivatives = model_jacobian(x, *params.T[:, :, np.newaxis])
+        shape = ys[rows].shape
+        columns = [np.broadcast_to(derivatives[names[col]], shape) for col in varied]
+        scale = _internal_gradient(internal_values, lower[rows], upper[rows])
+        return np.stack(columns, axis=-1) * scale[:, np.newaxis, :]
+
+    internal_values = _to_internal(values[:, varied], lower, upper)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        best = _solve_batch(
+            evaluate, ys, internal_values, max_iterations, tolerance, jacobian
+        )
+        best_fits = evaluate(best, slice(None)).copy()
+    values[:, varied] = _from_internal(best, lower, upper)
+    best_values = {key: values[:, col] for col, key in enumerate(names)}
+    return best_fits, best_values
+
+
+def _to_internal(values, lower, upper):
+    """map bounded parameter values to unbounded internal variables, as lmfit does"""
+    lower = np.broadcast_to(lower, values.shape)
+    upper = np.broadcast_to(upper, values.shape)
+    has_lower, has_upper = np.isfinite(lower), np.isfinite(upper)
+    internal = values.copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        both = has_lower & has_upper
+        scaled = 2 * (values - lower) / (upper - lower) - 1
+        internal[both] = np.arcsin(np.clip(scaled[both], -1, 1))
+        only_lower = has_lower & ~has_upper
+        internal[only_lower] = np.sqrt((values - lower + 1)[only_lower] ** 2 - 1)
+        only_upper = has_upper & ~has_lower
+        internal[only_upper] = np.sqrt((upper - values + 1)[only_upper] ** 2 - 1)
+    return internal
+
+
+def _from_internal(internal, lower, upper):
+    """inverse of _to_internal()"""
+    lower = np.broadcast_to(lower, internal.shape)
+    upper = np.broadcast_to(upper, internal.shape)
+    has_lower, has_upper = np.isfinite(lower), np.isfinite(upper)
+    values = internal.copy()
+    with np.errstate(invalid="ignore"):
+        both = has_lower & has_upper
+        span = (upper - lower)[both]
+        values[both] = lower[both] + (np.sin(internal[both]) + 1) * span / 2
+        only_lower = has_lower & ~has_upper
+        values[only_lower] = (lower - 1 + np.sqrt(internal**2 + 1))[only_lower]
+        only_upper = has_upper & ~has_lower
+        values[only_upper] = (upper + 1 - np.sqrt(internal**2 + 1))[only_upper]
+    return values
+
+
+def _internal_gradient(internal, lower, upper):
+    """derivative of _from_internal() with respect to the internal variables"""
+    lower = np.broadcast_to(lower, internal.shape)
+    upper = np.broadcast_to(upper, internal.shape)
+    has_lower, has_upper = np.isfinite(lower), np.isfinite(upper)
+    gradient = np.ones_like(internal)
+    both = has_lower & has_upper
+    gradient[both] = np.cos(internal[both]) * (upper - lower)[both] / 2
+    only_lower = has_lower & ~has_upper
+    gradient[only_lower] = (internal / np.sqrt(internal**2 + 1))[only_lower]
+    only_upper = has_upper & ~has_lower
+    gradient[only_upper] = (-internal / np.sqrt(internal**2 + 1))[only_upper]
+    return gradient
+
+
+def _solve_batch(evaluate, ys, p, max_iterations, tolerance, jacobian=None):
+    """Levenberg-Marquardt least-squares solver vectorised over independent rows,
+    evaluate(p, rows) returns the model evaluated with parameters p for the rows and
+    jacobian(p, rows) its derivatives, which are taken by finite differences if None"""
+    p = p.copy()
+    damping = np.full(len(ys), 1.0)
+    residuals = evaluate(p, slice(None)) - ys
+    cost = np.sum(residuals**2, axis=1)
+    active = np.ones(len(ys), dtype=bool)
+    for _ in range(max_iterations):
+        rows = np.flatnonzero(active)
+        if not rows.size:
+            break
+
+        # Jacobian of shape (rows, points, parameters)
+        p_rows, r_rows = p[rows], residuals[rows]
+        if jacobian is not None:
+            jac = jacobian(p_rows, rows)
+        else:  # forward differences
+            steps = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(p_rows), 1.0)
+            jac = np.empty((*r_rows.shape, p_rows.shape[1]))
+            for col in range(p_rows.shape[1]):
+                p_step = p_rows.copy()
+                p_step[:, col] += steps[:, col]
+                model_step = evaluate(p_step, rows) - ys[rows]
+                jac[..., col] = (model_step - r_rows) / steps[:, np.newaxis, col]
+
+        # damped normal equations, solved for all rows in one call
+        jtj = np.einsum("rpi,rpj->rij", jac, jac)
+        jtr = np.einsum("rpi,rp->ri", jac, r_rows)
+        diagonal = np.einsum("rii->ri", jtj)
+        diagonal = np.maximum(diagonal, 1e-12 * diagonal.max(axis=1, keepdims=True))
+        jtj_damped = jtj + (damping[rows, np.newaxis] * diagonal)[..., np.newaxis] * (
+            np.eye(p_rows.shape[1])
+        )
+        delta = -np.einsum("rij,rj->ri", np.linalg.pinv(jtj_damped), jtr)
+
+        p_new = p_rows + delta
+        r_new = evaluate(p_new, rows) - ys[rows]
+        cost_new = np.sum(r_new**2, axis=1)
+
+        # accept steps that reduce the cost and relax the damping, else increase it
+        improved = cost_new < cost[rows]
+        accepted = rows[improved]
+        p[accepted], residuals[accepted] = p_new[improved], r_new[improved]
+        reduction = cost[accepted] - cost_new[improved]
+        cost[accepted] = cost_new[improved]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        damping[rows[~improved]] *= 10
+
+        # rows converge when the cost or the parameters stop changing appreciably
+        step = np.abs(p_new - p_rows)
+        small_step = np.all(step <= tolerance * (np.abs(p_rows) + tolerance), axis=1)
+        small_reduction = np.zeros(len(rows), dtype=bool)
+        small_reduction[improved] = reduction <= tolerance * cost_new[improved]
+        active[rows[small_step | small_reduction | (damping[rows] > 1e12)]] = False
+    return p
@@ -34,10 +34,70 @@ def update_frequency(mode, value, units="Hz", keep_phase=False):
     qua.update_frequency(mode.name, value, units=units, keep_phase=keep_phase)
 
 
+def get_threshold(pulse, threshold=None) -> float:
+    """return threshold if given, else that of the readout pulse set by training"""
+    threshold = pulse.threshold if threshold is None else threshold
+    if threshold is None:
+        message = f"No threshold given or set for {pulse}, train the readout first."
+        logger.error(message)
+        raise ActiveResetError(message)
+    return threshold
+
+
+def measure_state(readout, pulse, i_var, q_var, state, threshold=None):
+    """measure readout with pulse and assign True to the QUA bool state if the qubit is
+    measured excited, i.e. if i_var is below the threshold as in ReadoutTrainer, which
+    counts I above the threshold as ground, see get_threshold()"""
+    threshold = get_threshold(pulse, threshold)
+    readout.measure(pulse, targets=(i_var, q_var))
+    qua.assign(state, i_var < threshold)
+
+
+def conditional_pi(qubit, pi_pulse, state):
+    """play pi_pulse on qubit only if the QUA bool state is True"""
+    qubit.play(pi_pulse, condition=state)
+
+
+def reset_until_ground(
+    qubit,
+    pi_pulse,
+    readout,
+    pulse,
+    i_var,
+    q_var,
+    state,
+    attempts,
+    max_attempts: int,
+    threshold=None,
+    cooldown: int = 0,
+):
+    """measure the qubit and play a pi pulse while it is measured excited, up to
+    max_attempts times, the number of pi pulses played is assigned to the QUA int
+    attempts and state is False if the qubit was last measured in the ground state,
+    cooldown in ns is waited after each measurement for the readout to ring down"""
+    threshold = get_threshold(pulse, threshold)
+    qua.assign(attempts, 0)
+    align(qubit, readout)  # after pulses still playing on qubit e.g. of a sequence
+    measure_state(readout, pulse, i_var, q_var, state, threshold)
+    with qua.while_(state & (attempts < max_attempts)):
+        if cooldown:
+            qua.wait(int(cooldown / 4), qubit.name, readout.name)
+        align(qubit, readout)
+        qubit.play(pi_pulse)
+        align(qubit, readout)
+        measure_state(readout, pulse, i_var, q_var, state, threshold)
+        qua.assign(attempts, attempts + 1)
+    align(qubit, readout)
+
+
 class StreamProcessingError(Exception):
     """ """
 
 
+class ActiveResetError(Exception):
+    """ """
+
+
 class QuaVariable:
     """ """
 
@@ -77,24 +137,131 @@ class QuaVariable:
         if self.stream is True:
             qua.save(self.qua_variable, self.qua_stream)
 
-    def process_stream(self) -> None:
-        """ """
+    def process_stream(self, prefix: str = "") -> None:
+        """prefix is prepended to the tag of saved results"""
         if not self.stream:
             return
+        tag = f"{prefix}{self.tag}"
 
         adc_trace = self.is_adc_trace
         if adc_trace == 1:
-            self.qua_stream.input1().save_all(self.tag)
-            self.qua_stream.input1().average().save(f"{self.tag}_avg")
+            self.qua_stream.input1().save_all(tag)
+            self.qua_stream.input1().average().save(f"{tag}_avg")
         elif adc_trace == 2:
-            self.qua_stream.input2().save_all(self.tag)
-            self.qua_stream.input2().average().save(f"{self.tag}_avg")
+            self.qua_stream.input2().save_all(tag)
+            self.qua_stream.input2().average().save(f"{tag}_avg")
         elif not adc_trace and hasattr(self, "sweep_points"):  # is sweep
-            self.qua_stream.buffer(*self.buffer).save(self.tag)
+            self.qua_stream.buffer(*self.buffer).save(tag)
         elif not adc_trace:  # is dataset
-            self.qua_stream.buffer(*self.buffer).save_all(self.tag)
-            self.qua_stream.buffer(*self.buffer).average().save(f"{self.tag}_avg")
+            self.qua_stream.buffer(*self.buffer).save_all(tag)
+            self.qua_stream.buffer(*self.buffer).average().save(f"{tag}_avg")
         else:
-            message = f"Failed to process stream for qua variable '{self.tag}'."
+            message = f"Failed to process stream for qua variable '{tag}'."
             logger.error(message)
             raise StreamProcessingError(message)
+
+
+class ActiveReset:
+    """Resets the qubit to its ground state at the start of each repetition of an
+    Experiment with reset_until_ground() instead of waiting several T1 for it to decay,
+    experiments opt in with Experiment(..., active_reset=ActiveReset(...)). Modes and
+    pulses are given by their keys in the Experiment modes and pulses dicts. The mean
+    number of attempts, the fraction of repetitions that ended with the qubit measured
+    in the ground state (the reset fidelity) and the mean reset time estimated from
+    pulse lengths are saved to the datafile in the group 'active_reset'."""
+
+    TAGS: tuple[str] = ("active_reset_attempts", "active_reset_excited")
+
+    def __init__(
+        self,
+        qubit: str,
+        pi_pulse: str,
+        readout: str,
+        readout_pulse: str,
+        max_attempts: int = 3,
+        threshold: float = None,  # defaults to that of the readout pulse
+        cooldown: int = 0,  # ns to wait after each measurement
+    ) -> None:
+        """ """
+        self.keys = {
+            "qubit": qubit,
+            "pi_pulse": pi_pulse,
+            "readout": readout,
+            "readout_pulse": readout_pulse,
+        }
+        self.max_attempts, self.threshold = max_attempts, threshold
+        self.cooldown = cooldown
+        self.resources = {}  # set by bind()
+        self.results = {}  # set by update()
+        self._variables, self._streams = None, None
+
+    def bind(self, modes: dict, pulses: dict) -> None:
+        """find the modes and pulses of this reset among those of an Experiment"""
+        resources = {}
+        for key, name in self.keys.items():
+            found = pulses if key.endswith("pulse") else modes
+            if name not in found:
+                message = f"Active reset {key} '{name}' is not one of {list(found)}."
+                logger.error(message)
+                raise ActiveResetError(message)
+            resources[key] = found[name]
+        self.threshold = get_threshold(resources["readout_pulse"], self.threshold)
+        self.resources = resources
+
+    def declare(self) -> None:
+        """call in qua variable declaration section of qua program scope"""
+        self.results = {}
+        self._variables = (
+            qua.declare(qua.fixed),  # I
+            qua.declare(qua.fixed),  # Q
+            qua.declare(bool),  # state
+            qua.declare(int),  # attempts
+        )
+        self._streams = (qua.declare_stream(), qua.declare_stream())
+
+    def play(self) -> None:
+        """call at the start of each repetition, before the sequence"""
+        i_var, q_var, state, attempts = self._variables
+        rsc = self.resources
+        reset_until_ground(
+            rsc["qubit"],
+            rsc["pi_pulse"],
+            rsc["readout"],
+            rsc["readout_pulse"],
+            i_var,
+            q_var,
+            state,
+            attempts,
+            self.max_attempts,
+            self.threshold,
+            self.cooldown,
+        )
+        qua.save(attempts, self._streams[0])
+        qua.save(state, self._streams[1])
+
+    def process_stream(self, prefix: str = "") -> None:
+        """call in the stream processing section of qua program scope, prefix is
+        prepended to the tags of saved results"""
+        attempts_tag, excited_tag = (f"{prefix}{tag}" for tag in ActiveReset.TAGS)
+        self._streams[0].average().save(attempts_tag)
+        self._streams[1].boolean_to_int().average().save(excited_tag)
+
+    def update(self, data: dict) -> dict:
+        """update results from data fetched from the QM, return them"""
+        attempts_tag, excited_tag = ActiveReset.TAGS
+        if attempts_tag not in data or excited_tag not in data:
+            return self.results
+        attempts = float(data[attempts_tag])
+        pi_length = self.resources["pi_pulse"].total_length
+        readout_length = self.resources["readout_pulse"].total_length
+        cycle_length = pi_length + readout_length + self.cooldown
+        self.results = {
+            **self.keys,
+            "max_attempts": self.max_attempts,
+            "threshold": self.threshold,
+            "cooldown": self.cooldown,
+            "mean_attempts": attempts,
+            "fidelity": 1 - float(data[excited_tag]),
+            "mean_time_ns": readout_length + attempts * cycle_length,
+        }
+        return self.results
@@ -164,6 +164,7 @@ class Mode(Resource):
             if key in self._operations:
                 operation = self._operations[key]
                 del self._operations[key]
+                self.mark_changed()
                 logger.debug(f"Removed {self} '{key}' {operation = }.")
             else:
                 logger.warning(f"Operation '{key}' does not exist for {self}.")
@@ -37,6 +37,30 @@ class Readout(Mode):
 
         super().__init__(**parameters)
 
+    @staticmethod
+    def measure_multiplexed(*measurements: tuple, align: bool = True) -> None:
+        """measure several Readouts at once, e.g. resonators on a shared feedline, each
+        measurement is (readout, pulse, targets) or (readout, pulse, targets, kwargs)
+        where kwargs are passed to measure() e.g. stream or demod_type. The readouts are
+        aligned first so that their pulses are played and demodulated simultaneously,
+        each with its own intermediate frequency and integration weights."""
+        readouts = [measurement[0] for measurement in measurements]
+        for readout in readouts:
+            if not isinstance(readout, Readout):
+                message = f"Invalid {readout = }, must be of {Readout}."
+                logger.error(message)
+                raise ValueError(message)
+        names = [readout.name for readout in readouts]
+        if len(set(names)) != len(names):
+            message = f"Readouts can only be measured once at a time, got {names = }."
+            logger.error(message)
+            raise ValueError(message)
+
+        if align:
+            qua.align(*names)
+        for readout, pulse, targets, *kwargs in measurements:
+            readout.measure(pulse, targets=targets, **(kwargs[0] if kwargs else {}))
+
     def measure(
         self,
         pulse: Pulse,
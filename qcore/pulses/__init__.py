@@ -4,6 +4,7 @@ from qcore.pulses.constant_pulse import ConstantPulse
 from qcore.pulses.digital_waveform import DigitalWaveform
 from qcore.pulses.gaussian_pulse import GaussianPulse
 from qcore.pulses.numerical_pulse import NumericalPulse
+from qcore.pulses.pulse_family import PulseFamily
 from qcore.pulses.ramped_constant_pulse import RampedConstantPulse
 from qcore.pulses.readout_pulse import ConstantReadoutPulse, GaussianReadoutPulse
 
@@ -12,6 +13,7 @@ __all__ = [
     "DigitalWaveform",
     "GaussianPulse",
     "NumericalPulse",
+    "PulseFamily",
     "RampedConstantPulse",
     "ConstantReadoutPulse",
     "GaussianReadoutPulse",
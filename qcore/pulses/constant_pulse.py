@@ -51,5 +51,5 @@ class ConstantPulse(Pulse):
         """ """
         samples = np.ones(self.length)
         pad = np.zeros(self.pad) if self.pad else []
-        i_wave = (np.concatenate((samples, pad)) * self.total_I_amp).tolist()
+        i_wave = np.concatenate((samples, pad)) * self.total_I_amp
         return (i_wave, 0.0) if self.has_mixed_waveforms() else (i_wave, None)
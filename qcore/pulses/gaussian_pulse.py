@@ -1,8 +1,10 @@
 """ """
 
+from __future__ import annotations
+
 import numpy as np
 
-from qcore.pulses.pulse import Pulse
+from qcore.pulses.pulse import Pulse, linspace_rows
 
 
 class GaussianPulse(Pulse):
@@ -38,19 +40,31 @@ class GaussianPulse(Pulse):
 
     def sample(self):
         """ """
-        start, stop = -self.chop / 2 * self.sigma, self.chop / 2 * self.sigma
-        length = int(self.sigma * self.chop)
-        ts = np.linspace(start, stop, length)
-        pad = np.zeros(self.pad) if self.pad else []
-
-        i_samples = np.exp(-(ts**2) / (2.0 * self.sigma**2)) * self.total_I_ampx
-        i_wave = (np.concatenate((i_samples, pad))).tolist()
-
-        if self.Q_ampx is None:
-            return (i_wave, None)
-        elif self.Q_ampx == 0:
-            return (i_wave, self.Q_ampx)
-        else:
-            q_samples = (np.exp(0.5) / self.sigma) * -ts * i_samples * self.Q_ampx
-            q_wave = (np.concatenate((q_samples, pad))).tolist()
-            return (i_wave, q_wave)
+        return GaussianPulse._sample_all([self])[0]
+
+    @classmethod
+    def _sample_all(cls, pulses: list[GaussianPulse]) -> list[tuple]:
+        """sample pulses with different sigma, chop, amplitudes and pad at once"""
+        sigmas = np.array([pulse.sigma for pulse in pulses], dtype=float)
+        chops = np.array([pulse.chop for pulse in pulses], dtype=float)
+        i_ampxs = np.array([pulse.total_I_ampx for pulse in pulses], dtype=float)
+        q_ampxs = [pulse.Q_ampx for pulse in pulses]
+        start, stop = -chops / 2 * sigmas, chops / 2 * sigmas
+        lengths = (sigmas * chops).astype(int)
+        ts = linspace_rows(start, stop, lengths)
+
+        i_samples = np.exp(-(ts**2) / (2.0 * sigmas[:, None] ** 2)) * i_ampxs[:, None]
+        drags = np.array([0.0 if q is None else q for q in q_ampxs], dtype=float)
+        q_samples = (np.exp(0.5) / sigmas[:, None]) * -ts * i_samples * drags[:, None]
+
+        waves = []
+        for j, (pulse, length, q_ampx) in enumerate(zip(pulses, lengths, q_ampxs)):
+            pad = np.zeros(pulse.pad) if pulse.pad else []
+            i_wave = np.concatenate((i_samples[j, :length], pad))
+            if q_ampx is None:
+                waves.append((i_wave, None))
+            elif q_ampx == 0:
+                waves.append((i_wave, q_ampx))
+            else:
+                waves.append((i_wave, np.concatenate((q_samples[j, :length], pad))))
+        return waves
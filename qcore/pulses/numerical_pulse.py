@@ -4,7 +4,12 @@ from typing import Union
 
 import numpy as np
 
-from qcore.pulses.pulse import Pulse
+from qcore.pulses.pulse import Pulse, get_file_stamp, read_file
+
+
+def _read_shape(path: str) -> tuple[int]:
+    """return the shape of the array in a .npy file by reading its header only"""
+    return np.load(path, mmap_mode="r").shape
 
 
 class NumericalPulse(Pulse):
@@ -30,9 +35,8 @@ class NumericalPulse(Pulse):
             **parameters,
         )
 
-        self._path, self._pulse = None, None
-        self._length, self._pad = None, None
-        self.path = path  # will update _path, _pulse, _length, _pad
+        self._path = None
+        self.path = path
 
     @property
     def path(self) -> str:
@@ -41,22 +45,29 @@ class NumericalPulse(Pulse):
 
     @path.setter
     def path(self, value: str) -> None:
-        """ """
-        self._pulse = np.load(value)
+        """only the header of the file is read here, its samples are read when the pulse
+        is first sampled"""
+        read_file(value, _read_shape)  # fails early if the file is not a numpy array
         self._path = value
-        self._length = len(self._pulse)
-        cycle = Pulse.CLOCK_CYCLE
-        self._pad = (cycle - self._length % cycle) if self._length % cycle else 0
 
     @property
     def length(self) -> int:
         """ """
-        return self._length
+        return read_file(self._path, _read_shape)[0]
+
+    @length.setter
+    def length(self, _) -> None:
+        """ignored, as the length is that of the pulse loaded from path"""
 
     @property
     def pad(self) -> int:
         """ """
-        return self._pad
+        length, cycle = self.length, Pulse.CLOCK_CYCLE
+        return (cycle - length % cycle) if length % cycle else 0
+
+    @pad.setter
+    def pad(self, _) -> None:
+        """ignored, as the pad is set by the length of the pulse loaded from path"""
 
     @property
     def total_I_ampx(self) -> float:
@@ -68,12 +79,22 @@ class NumericalPulse(Pulse):
         """ """
         return Pulse.BASE_AMP * self.Q_ampx
 
-    def sample(self) -> tuple[list, list]:
+    def get_file_stamps(self) -> tuple:
+        """ """
+        return (get_file_stamp(self._path),)
+
+    def _waveform_key(self) -> tuple:
         """ """
-        i_samples = np.real(self._pulse)
-        q_samples = np.imag(self._pulse)
+        return (*super()._waveform_key(), *self.get_file_stamps())
+
+    def sample(self) -> tuple[np.ndarray, np.ndarray]:
+        """the file is memory-mapped, its samples are copied once to the waveforms,
+        which are cached by Pulse.sample() while the file is unchanged"""
+        pulse = np.load(self._path, mmap_mode="r")
+        i_samples = np.real(pulse)
+        q_samples = np.imag(pulse)
         pad = np.zeros(self.pad) if self.pad else []
 
         i_wave = np.concatenate((i_samples, pad))
         q_wave = np.concatenate((q_samples, pad))
-        return (i_wave.tolist(), q_wave.tolist())
+        return (i_wave, q_wave)
@@ -1,17 +1,124 @@
 """ """
 
-from typing import Any, Union
+from collections import OrderedDict
+import functools
+import os
+import threading
+from typing import Any, Callable, Union
+
+import numpy as np
 
 from qcore.helpers.logger import logger
 
 from qcore.pulses.digital_waveform import DigitalWaveform
 from qcore.resource import Resource
 
-class Pulse(Resource):
+# sampled waveforms shared by pulses of the same class and shape, keyed on both, least
+# recently used entries are evicted first
+_waveforms: OrderedDict = OrderedDict()
+_waveforms_lock = threading.Lock()
+
+
+# contents read from files by pulses, keyed on the path and reader, with the stamp of
+# the file when it was read, so that files are read again only after they change
+_files: dict[tuple[str, Callable], tuple[tuple[int, int], Any]] = {}
+_files_lock = threading.Lock()
+
+
+def get_file_stamp(path: str) -> tuple[int, int]:
+    """return the modification time and size of a file, which change with its
+    contents"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def read_file(path: str, reader: Callable[[str], Any]) -> Any:
+    """return reader(path), which is cached until the file changes"""
+    stamp, key = get_file_stamp(path), (os.path.abspath(path), reader)
+    with _files_lock:
+        cached_stamp, contents = _files.get(key, (None, None))
+    if cached_stamp != stamp:
+        contents = reader(path)
+        with _files_lock:
+            _files[key] = (stamp, contents)
+    return contents
+
+
+def _hashable(value: Any) -> Any:
     """ """
+    try:
+        hash(value)
+    except TypeError:
+        if isinstance(value, np.ndarray):
+            return (value.dtype.str, value.shape, value.tobytes())
+        return repr(value)
+    return value
+
+
+def _get_cached_waves(key: tuple) -> Union[tuple, None]:
+    """ """
+    with _waveforms_lock:
+        if key in _waveforms:
+            _waveforms.move_to_end(key)
+            return _waveforms[key]
+    return None
+
+
+def _cache_waves(key: tuple, waves: tuple) -> tuple:
+    """arrays are made read-only as they are shared between pulses"""
+    for wave in waves:
+        if isinstance(wave, np.ndarray):
+            wave.flags.writeable = False
+    with _waveforms_lock:
+        _waveforms[key] = waves
+        if len(_waveforms) > Pulse.MAX_CACHED_WAVEFORMS:
+            _waveforms.popitem(last=False)
+    return waves
+
+
+def _memoize_samples(sample: Callable) -> Callable:
+    """wrap sample() to return cached waveforms while the shape of the pulse is the
+    same"""
+
+    @functools.wraps(sample)
+    def wrapper(self):
+        key = (type(self), self._waveform_key())
+        waves = _get_cached_waves(key)
+        return _cache_waves(key, sample(self)) if waves is None else waves
+
+    return wrapper
+
+
+def linspace_rows(start, stop, num) -> np.ndarray:
+    """return np.linspace(start, stop, num) for arrays of start, stop and num as the
+    rows of a 2D array, rows are as long as the largest num and padded with nan"""
+    start, stop = np.asarray(start, dtype=float), np.asarray(stop, dtype=float)
+    start, stop, num = np.broadcast_arrays(start, stop, np.asarray(num, dtype=int))
+    step = (stop - start) / np.maximum(num - 1, 1)
+    index = np.arange(num.max(initial=0))
+    rows = index * step[:, None] + start[:, None]
+    has_stop = num > 1  # np.linspace sets the last point to stop exactly
+    rows[has_stop, num[has_stop] - 1] = stop[has_stop]
+    rows[index >= num[:, None]] = np.nan
+    return rows
+
+
+class Pulse(Resource):
+    """Subclasses implement sample(), which is memoized on the shape parameters of the
+    pulse, i.e. all parameters except its name and digital marker, see
+    _waveform_key(). Arbitrary waveforms are returned as numpy arrays. Subclasses may
+    also implement _sample_all() to sample many pulses at once, see sample_all()."""
 
     BASE_AMP = 0.2  # in V
     CLOCK_CYCLE = 4  # in ns
+    MAX_CACHED_WAVEFORMS: int = 1024
+    NON_SHAPE_PARAMS: tuple[str] = ("name", "digital_marker")
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """ """
+        super().__init_subclass__(**kwargs)
+        if "sample" in cls.__dict__:
+            cls.sample = _memoize_samples(cls.__dict__["sample"])
 
     def __init__(
         self,
@@ -31,6 +138,7 @@ class Pulse(Resource):
         self.Q_ampx: float = Q_ampx
 
         self._digital_marker = digital_marker
+        self._observe(digital_marker)
 
         super().__init__(name=name, **parameters)
 
@@ -45,10 +153,55 @@ class Pulse(Resource):
 
     def sample(
         self,
-    ) -> Union[tuple[float, Union[float, None]], tuple[list, Union[list, None]]]:
+    ) -> Union[
+        tuple[float, Union[float, None]], tuple[np.ndarray, Union[np.ndarray, None]]
+    ]:
         """ """
         raise NotImplementedError("Subclasses must implement 'sample()'.")
 
+    @classmethod
+    def sample_all(cls, pulses: list["Pulse"]) -> list[tuple]:
+        """return the samples of pulses of this class as sample() would, those not yet
+        cached are sampled together by the _sample_all() of this class if it has one,
+        e.g. in a single vectorised computation, and are then cached"""
+        for pulse in pulses:
+            if type(pulse) is not cls:
+                raise ValueError(f"Invalid {pulse = }, must be of {cls}.")
+        keys = [(cls, pulse._waveform_key()) for pulse in pulses]
+        waves = [_get_cached_waves(key) for key in keys]
+        missing = [i for i, wave in enumerate(waves) if wave is None]
+        if missing:
+            sampled = cls._get_sampler()([pulses[i] for i in missing])
+            for i, sample in zip(missing, sampled):
+                waves[i] = _cache_waves(keys[i], sample)
+        return waves
+
+    @classmethod
+    def _get_sampler(cls) -> Callable[[list["Pulse"]], list[tuple]]:
+        """return _sample_all() unless a class before it in the mro overrides
+        sample()"""
+        for klass in cls.__mro__:
+            if "_sample_all" in klass.__dict__:
+                return cls._sample_all
+            if "sample" in klass.__dict__:
+                break
+        return lambda pulses: [pulse.sample() for pulse in pulses]
+
+    def get_file_stamps(self) -> tuple:
+        """return the stamps of the files the pulse is sampled from, see
+        get_file_stamp(), so that consumers can tell when they change"""
+        return ()
+
+    def _waveform_key(self) -> tuple:
+        """return the values of the parameters that sample() depends on, subclasses
+        whose samples depend on private state must extend it"""
+        snapshot = self.snapshot()
+        return tuple(
+            (k, _hashable(v))
+            for k, v in snapshot.items()
+            if k not in Pulse.NON_SHAPE_PARAMS
+        )
+
     @property
     def digital_marker(self) -> Union[DigitalWaveform, None]:
         """ """
@@ -0,0 +1,120 @@
+""" """
+
+from typing import Any, Sequence, Union
+
+import numpy as np
+from qm import qua
+from qm.qua._dsl import _Variable
+
+from qcore.helpers.logger import logger
+from qcore.pulses.pulse import Pulse
+from qcore.resource import Resource
+
+
+class PulseFamily(Resource):
+    """Variants of a pulse with some of its shape parameters swept, e.g. sigma, chop or
+    Q_ampx of a GaussianPulse or ramp of a RampedConstantPulse. sweep maps parameter
+    names to sequences of values of equal length, one per variant. Variants are pulses
+    of the class of the pulse named '<family name>_<index>', to be registered on modes
+    as operations with add_to(). They are sampled in one vectorised computation when the
+    config is built, see Pulse.sample_all(), and play() switches between them with a QUA
+    variable, so sweeping them needs a single config. Variants are made when pulse or
+    sweep is set and must then be added to modes again. Experiments given the family in
+    their pulses map keep its variants among the operations of their modes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pulse: Pulse,
+        sweep: dict[str, Sequence[Any]],
+        **parameters,
+    ) -> None:
+        """ """
+        self._pulse: Pulse = None
+        self._sweep: dict[str, list] = {}
+        self._pulses: list[Pulse] = []
+        super().__init__(name=name, pulse=pulse, sweep=sweep, **parameters)
+
+    @property
+    def pulse(self) -> Pulse:
+        """ """
+        return self._pulse
+
+    @pulse.setter
+    def pulse(self, value: Pulse) -> None:
+        """ """
+        if not isinstance(value, Pulse):
+            raise ValueError(f"Invalid {value = }, must be of {Pulse}.")
+        self._pulse = value
+        self._set_pulses()
+
+    @property
+    def sweep(self) -> dict[str, list]:
+        """ """
+        return {key: list(values) for key, values in self._sweep.items()}
+
+    @sweep.setter
+    def sweep(self, value: dict[str, Sequence[Any]]) -> None:
+        """ """
+        try:
+            sweep = {str(k): np.asarray(v).tolist() for k, v in value.items()}
+        except AttributeError:
+            message = f"Expect {dict[str, Sequence]} of swept parameters and values."
+            raise ValueError(message) from None
+        if len({len(values) for values in sweep.values()}) > 1:
+            raise ValueError(f"Swept values must be of equal length, got {sweep = }.")
+        self._sweep = sweep
+        self._set_pulses()
+
+    def _set_pulses(self) -> None:
+        """ """
+        if self._pulse is None:
+            return
+        pulse, settables = self._pulse, self._pulse.settables()
+        for key in self._sweep:
+            if key not in settables:
+                raise ValueError(f"Invalid swept parameter {key = } of {pulse}.")
+
+        parameters = pulse.snapshot()  # as loaded from yaml, see yamlizer
+        count = len(next(iter(self._sweep.values()), []))
+        self._pulses = []
+        for index in range(count):
+            values = {key: values[index] for key, values in self._sweep.items()}
+            name = f"{self.name}_{index}"
+            self._pulses.append(type(pulse)(**{**parameters, **values, "name": name}))
+        logger.debug(f"Set {self} with {count} variants of {pulse}.")
+
+    def get_pulses(self) -> list[Pulse]:
+        """ """
+        return self._pulses.copy()
+
+    def add_to(self, *modes) -> None:
+        """register the variants as operations of modes, replacing the variants of this
+        family registered before e.g. with another sweep"""
+        for mode in modes:
+            operations = mode.operations.items()
+            stale = [key for key, op in operations if self._is_variant(op.name)]
+            mode.remove_operations(*stale)
+            mode.add_operations(*self._pulses)
+            logger.debug(f"Added {len(self._pulses)} variants of {self} to {mode}.")
+
+    def _is_variant(self, pulse_name: str) -> bool:
+        """ """
+        prefix = f"{self.name}_"
+        return pulse_name.startswith(prefix) and pulse_name[len(prefix) :].isdigit()
+
+    def sample(self) -> list[tuple]:
+        """return the samples of all variants, see Pulse.sample()"""
+        return type(self._pulse).sample_all(self._pulses)
+
+    def play(self, mode, index: Union[int, _Variable], **kwargs) -> None:
+        """play the variant at index, which may be a QUA int variable e.g. of a Sweep
+        over the variant indices, on mode, kwargs are passed to mode.play()"""
+        if not isinstance(index, _Variable):
+            mode.play(self._pulses[index], **kwargs)
+            return
+        with qua.switch_(index):
+            for i, pulse in enumerate(self._pulses):
+                with qua.case_(i):
+                    mode.play(pulse, **kwargs)
@@ -1,24 +1,39 @@
 """ """
 
+from __future__ import annotations
+
 import numpy as np
 
 from qcore.pulses.constant_pulse import ConstantPulse
+from qcore.pulses.pulse import linspace_rows
 
 
-def ramp_cos(length: int, up: bool = True) -> list[float]:
+def ramp_cos(length: int, up: bool = True) -> np.ndarray:
     """ """
-    samples = 0.5 * (1 - np.cos(np.linspace(0, np.pi, length)))
+    samples = sample_ramps("cos", [length])[0]
     return samples if up else samples[::-1]
 
 
-def ramp_tanh(length: int, up: bool = True) -> list[float]:
+def ramp_tanh(length: int, up: bool = True) -> np.ndarray:
     """ """
-    samples = (1 + np.tanh(np.linspace(-2, 2, length))) / 2
+    samples = sample_ramps("tanh", [length])[0]
     return samples if up else samples[::-1]
 
 
 RAMP_MAP = {"cos": ramp_cos, "tanh": ramp_tanh}
 
+# the interval each ramp function is sampled over and its shape on that interval
+RAMP_SHAPES = {
+    "cos": (0, np.pi, lambda x: 0.5 * (1 - np.cos(x))),
+    "tanh": (-2, 2, lambda x: (1 + np.tanh(x)) / 2),
+}
+
+
+def sample_ramps(rampfn: str, lengths: list[int]) -> np.ndarray:
+    """return up ramps of lengths as the rows of a 2D array, padded with nan"""
+    start, stop, shape = RAMP_SHAPES[rampfn]
+    return shape(linspace_rows(start, stop, lengths))
+
 
 class RampedConstantPulse(ConstantPulse):
     """ """
@@ -42,18 +57,35 @@ class RampedConstantPulse(ConstantPulse):
 
     def sample(self):
         """ """
-        has_constant_waveform = not (self.pad or self.ramp)
-        if has_constant_waveform:
-            return self._sample_constant_waveform()
-        else:
-            return self._sample_arbitrary_waveform()
-
-    def _sample_arbitrary_waveform(self):
-        rampfn = RAMP_MAP[self.rampfn] if self.rampfn is not None else False
-        up = rampfn(self.ramp, up=True) if rampfn else []
+        return RampedConstantPulse._sample_all([self])[0]
+
+    @classmethod
+    def _sample_all(cls, pulses: list[RampedConstantPulse]) -> list[tuple]:
+        """sample pulses with different ramps, lengths, amplitudes and pads at once,
+        the ramps of pulses with the same ramp function are sampled together"""
+        ramps = {}  # up ramp by pulse index
+        for rampfn in {pulse.rampfn for pulse in pulses if pulse.rampfn is not None}:
+            indices = [i for i, pulse in enumerate(pulses) if pulse.rampfn == rampfn]
+            lengths = [pulses[i].ramp for i in indices]
+            rows = sample_ramps(rampfn, lengths)
+            ramps.update({i: row[:n] for i, row, n in zip(indices, rows, lengths)})
+
+        waves = []
+        for i, pulse in enumerate(pulses):
+            has_constant_waveform = not (pulse.pad or pulse.ramp)
+            if has_constant_waveform:
+                waves.append(pulse._sample_constant_waveform())
+            else:
+                waves.append(pulse._sample_arbitrary_waveform(ramps.get(i, [])))
+        return waves
+
+    def _sample_arbitrary_waveform(self, up=None):
+        """up is the up ramp of the pulse if it has already been sampled"""
+        if up is None:
+            up = RAMP_MAP[self.rampfn](self.ramp) if self.rampfn is not None else []
         samples = np.ones(self.length)
-        down = rampfn(self.ramp, up=False) if rampfn else []
+        down = up[::-1]
         pad = np.zeros(self.pad) if self.pad else []
-        i_wave = (np.concatenate((up, samples, down, pad)) * self.total_I_amp).tolist()
+        i_wave = np.concatenate((up, samples, down, pad)) * self.total_I_amp
 
         return (i_wave, 0.0) if self.has_mixed_waveforms() else (i_wave, None)
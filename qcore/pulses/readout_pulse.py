@@ -8,7 +8,18 @@ import numpy as np
 from qcore.pulses.constant_pulse import ConstantPulse
 from qcore.pulses.gaussian_pulse import GaussianPulse
 from qcore.pulses.digital_waveform import DigitalWaveform
-from qcore.pulses.pulse import Pulse
+from qcore.pulses.pulse import Pulse, get_file_stamp, read_file
+
+
+def _read_weights(path: str) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+    """return the cosine and sine integration weights in a .npz file as read-only
+    arrays, which are shared by all builds of the config till the file changes"""
+    with np.load(path) as weights:
+        i_weights, q_weights = weights["I"], weights["Q"]
+    i_weights.flags.writeable, q_weights.flags.writeable = False, False
+    cos_weights = {"cosine": i_weights[0], "sine": i_weights[1]}
+    sin_weights = {"cosine": q_weights[0], "sine": q_weights[1]}
+    return (cos_weights, sin_weights)
 
 
 class ReadoutPulse(Pulse):
@@ -37,12 +48,17 @@ class ReadoutPulse(Pulse):
         except TypeError:
             return False
 
-    def sample_integration_weights(self) -> tuple[dict[str, list], dict[str, list]]:
+    def get_file_stamps(self) -> tuple:
         """ """
+        stamps = super().get_file_stamps()
         if self.has_optimized_weights:
-            weights = np.load(self.weights)
-            cos_weights = {"cosine": weights["I"][0], "sine": weights["I"][1]}
-            sin_weights = {"cosine": weights["Q"][0], "sine": weights["Q"][1]}
+            stamps += (get_file_stamp(self.weights),)
+        return stamps
+
+    def sample_integration_weights(self) -> tuple[dict[str, list], dict[str, list]]:
+        """ """
+        if self.has_optimized_weights:  # read again only after the file changes
+            cos_weights, sin_weights = read_file(self.weights, _read_weights)
         else:
             weights = [[(weight, self.total_length)] for weight in self.weights]
             cos_weights = {"cosine": weights[0], "sine": weights[1]}
@@ -2,6 +2,7 @@
 
 import inspect
 from typing import Any
+import weakref
 
 import qcore.helpers.yamlizer as yml
 from qcore.variables.parameter import Parameter
@@ -31,7 +32,11 @@ class ResourceMetaclass(type):
 
 
 class Resource(metaclass=ResourceMetaclass):
-    """ """
+    """Resources track changes with a version that increases whenever a public
+    attribute, Parameter or property is set, or when a Resource held by one of them
+    changes, e.g. a Pulse in Mode.operations. Consumers compare versions to find what
+    changed since they last looked, see QMConfigBuilder and Stage.save(). Changes made
+    without setting a public attribute must call mark_changed()."""
 
     name: str = Parameter()
 
@@ -45,6 +50,40 @@ class Resource(metaclass=ResourceMetaclass):
         """ """
         return f"{self.__class__.__name__} '{self._name}'"
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        """ """
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            self._observe(value)
+            self.mark_changed()
+
+    def _observe(self, value: Any) -> None:
+        """mark this Resource changed when value, or the Resources in value if it is a
+        list, tuple or dict, change"""
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, (list, tuple)):
+            value = (value,)
+        for item in value:
+            if isinstance(item, Resource) and item is not self:
+                item.__dict__.setdefault("_observers", weakref.WeakSet()).add(self)
+
+    def mark_changed(self) -> None:
+        """increase the version of this Resource and, once each, of those that hold it
+        directly or indirectly, Resources may hold each other"""
+        changed, pending = {id(self)}, [self]
+        while pending:
+            resource = pending.pop()
+            resource.__dict__["_version"] = resource.version() + 1
+            for observer in list(resource.__dict__.get("_observers", ())):
+                if id(observer) not in changed:
+                    changed.add(id(observer))
+                    pending.append(observer)
+
+    def version(self) -> int:
+        """ """
+        return self.__dict__.get("_version", 0)
+
     @name.getter
     def name(self) -> str:
         """ """
@@ -0,0 +1,281 @@
+""" Benchmark of the latency and robustness of fit functions in qcore.libs.fit_fns """
+
+import datetime
+import json
+import platform
+import time
+from pathlib import Path
+
+import lmfit
+import numpy as np
+
+from qcore.helpers.logger import logger
+from qcore.libs.fit_fns import FITFN_MAP
+
+# synthetic data generators, one per fit function in FITFN_MAP, each takes a random
+# number generator and a size (number of points per axis) and returns the
+# independent variables in the order expected by the fit function and the noiseless
+# data, for 2D fits the independent variables are grids with x varying along axis 0
+
+
+def _atan_data(rng, size):
+    """ """
+    x = np.linspace(4.9, 5.1, size)
+    fr, Ql, theta = rng.uniform(4.97, 5.03), rng.uniform(50, 300), rng.uniform(-1, 1)
+    sign = rng.choice((-1, 1))
+    return (x,), theta + 2 * np.arctan(2 * Ql * sign * (x / fr - 1))
+
+
+def _cohstate_decay_data(rng, size):
+    """ """
+    x = np.linspace(0, 10, size)
+    amp, alpha0, tau = rng.uniform(0.5, 1), rng.uniform(1, 2), rng.uniform(1, 3)
+    nbars = (alpha0 * np.exp(-x / 2 / tau)) ** 2
+    return (x,), rng.uniform(-0.1, 0.1) + amp * np.exp(-nbars)
+
+
+def _displacement_cal_data(rng, size):
+    """ """
+    x = np.linspace(0, 2, size)
+    dispscale, amp = rng.uniform(0.8, 2), rng.uniform(0.5, 1)
+    return (x,), rng.uniform(-0.1, 0.1) + amp * np.exp(-((x * dispscale) ** 2))
+
+
+def _double_gaussian_2dhist_data(rng, size):
+    """ """
+    x, y = np.meshgrid(*(np.linspace(-5, 5, size),) * 2, indexing="ij")
+    x0, y0 = rng.uniform(-3, -1, 2)
+    x1, y1 = rng.uniform(1, 3, 2)
+    a0, a1, sigma = rng.uniform(20, 50), rng.uniform(10, 30), rng.uniform(0.6, 1)
+    r0, r1 = (x - x0) ** 2 + (y - y0) ** 2, (x - x1) ** 2 + (y - y1) ** 2
+    z = a0 * np.exp(-0.5 * r0 / sigma**2) + a1 * np.exp(-0.5 * r1 / sigma**2)
+    return (y, x), z
+
+
+def _exp_decay_data(rng, size):
+    """ """
+    x = np.linspace(0, 10, size)
+    A, tau = rng.choice((-1, 1)) * rng.uniform(0.5, 2), rng.uniform(1, 4)
+    return (x,), A * np.exp(-x / tau) + rng.uniform(-1, 1)
+
+
+def _exp_decay_sine_data(rng, size):
+    """ """
+    x = np.linspace(0, 10, size)
+    amp, f0, phi = rng.uniform(0.5, 1), rng.uniform(0.3, 1.5), rng.uniform(-3, 3)
+    decay = np.exp(-x / rng.uniform(3, 8))
+    return (x,), amp * np.sin(2 * np.pi * f0 * x + phi) * decay + rng.uniform(-1, 1)
+
+
+def _gaussian_data(rng, size):
+    """ """
+    x = np.linspace(-5, 5, size)
+    x0, sig = rng.uniform(-2, 2), rng.uniform(0.3, 1.5)
+    amp = rng.choice((-1, 1)) * rng.uniform(0.5, 2)
+    return (x,), rng.uniform(-1, 1) + amp * np.exp(-((x - x0) ** 2) / (2 * sig**2))
+
+
+def _gaussian2d_symmetric_data(rng, size):
+    """ """
+    x, y = np.meshgrid(*(np.linspace(-5, 5, size),) * 2, indexing="ij")
+    x0, y0 = rng.uniform(-1, 1, 2)
+    sigma, area = rng.uniform(0.5, 1.5), rng.uniform(20, 50)
+    r2 = ((x - x0) ** 2 + (y - y0) ** 2) / (2 * sigma**2)
+    z = area / (2 * sigma**2) / np.sqrt(np.pi / 2) * np.exp(-r2)
+    return (y, x), z + rng.uniform(-1, 1)
+
+
+def _linear_data(rng, size):
+    """ """
+    x = np.linspace(-5, 5, size)
+    return (x,), rng.uniform(-2, 2) * x + rng.uniform(-1, 1)
+
+
+def _lorentzian_data(rng, size):
+    """ """
+    return _lorentzian_asymmetric_data(rng, size, phi=0)
+
+
+def _lorentzian_asymmetric_data(rng, size, phi=None):
+    """ """
+    x = np.linspace(-5, 5, size)
+    fr, fwhm, ofs = rng.uniform(-2, 2), rng.uniform(0.3, 1.5), rng.uniform(0.5, 1.5)
+    height = -rng.uniform(0.2, 0.8) * ofs
+    phi = rng.uniform(-0.5, 0.5) if phi is None else phi
+    return (x,), np.abs(ofs + height * np.exp(1j * phi) / (1 + 2j * (x - fr) / fwhm))
+
+
+def _sine_data(rng, size):
+    """ """
+    x = np.linspace(0, 10, size)
+    f0, amp, phi = rng.uniform(0.2, 2), rng.uniform(0.5, 2), rng.uniform(-3, 3)
+    return (x,), rng.uniform(-1, 1) + amp * np.sin(2 * np.pi * f0 * x + phi)
+
+
+SYNTHETIC_DATA = {
+    name: globals()[f"_{name}_data"]
+    for name in FITFN_MAP
+    if f"_{name}_data" in globals()
+}
+
+
+class FitBenchmark:
+    """Times fit functions in FITFN_MAP on synthetic data across sizes and noise levels.
+
+    Noise is Gaussian with a standard deviation given as a fraction of the peak-to-peak
+    range of the noiseless data. A fit has converged if it returns finite best values
+    and its rms residual is within CONVERGENCE_RTOL of the noise level (or within
+    NOISELESS_ATOL of the peak-to-peak range for noiseless data), i.e. it has found the
+    true minimum rather than a local one. Latencies are of fits that did not raise.
+
+    Results are a list of records, one per (fitfn, size, noise) combination, that are
+    saved to and loaded from a JSON file, and compared against a baseline to catch
+    latency or convergence regressions."""
+
+    SIZES: tuple[int] = (51, 201)  # points per axis
+    NOISES: tuple[float] = (0.0, 0.02, 0.1)  # relative to the peak-to-peak range
+    TRIALS: int = 20  # datasets per (fitfn, size, noise) combination
+    REPEATS: int = 3  # timed fits per dataset, the fastest is taken as its latency
+    SEED: int = 0
+    CONVERGENCE_RTOL: float = 0.5
+    NOISELESS_ATOL: float = 1e-3
+
+    MAX_SLOWDOWN: float = 1.5  # allowed ratio of median latency to the baseline's
+    MAX_CONVERGENCE_DROP: float = 0.05  # allowed drop in convergence rate
+
+    def __init__(
+        self,
+        fitfns: tuple[str] = None,  # names of fit functions, default all with data
+        sizes: tuple[int] = SIZES,
+        noises: tuple[float] = NOISES,
+        trials: int = TRIALS,
+        repeats: int = REPEATS,
+        seed: int = SEED,
+    ) -> None:
+        """ """
+        self.fitfns = tuple(SYNTHETIC_DATA) if fitfns is None else tuple(fitfns)
+        unsupported = set(self.fitfns) - set(SYNTHETIC_DATA)
+        if unsupported:
+            logger.warning(f"No synthetic data for {unsupported = }, ignored.")
+            self.fitfns = tuple(f for f in self.fitfns if f in SYNTHETIC_DATA)
+        self.sizes, self.noises = tuple(sizes), tuple(noises)
+        self.trials, self.repeats, self.seed = trials, repeats, seed
+        self.results: list[dict] = []
+
+    def run(self) -> list[dict]:
+        """ """
+        self.results = []
+        for name in self.fitfns:
+            for size in self.sizes:
+                for noise in self.noises:
+                    self.results.append(self._benchmark(name, size, noise))
+                    logger.info(self._summarize(self.results[-1]))
+        return self.results
+
+    def _benchmark(self, name: str, size: int, noise: float) -> dict:
+        """ """
+        rng = np.random.default_rng((self.seed, size, round(noise * 1e6)))
+        fitfn, generate = FITFN_MAP[name], SYNTHETIC_DATA[name]
+        latencies, num_converged, num_failed, rms_ratios = [], 0, 0, []
+        for _ in range(self.trials):
+            independent_vars, clean = generate(rng, size)
+            sigma = noise * np.ptp(clean)
+            data = clean + sigma * rng.standard_normal(clean.shape)
+
+            latency = np.inf  # the best of repeats, to reject timing jitter
+            try:
+                for _ in range(self.repeats):
+                    start = time.perf_counter()
+                    best_fit, best_values = fitfn(data, *independent_vars)
+                    latency = min(latency, time.perf_counter() - start)
+            except Exception:  # a failed fit counts against the convergence rate
+                num_failed += 1
+                continue
+            latencies.append(latency)
+
+            rms = np.sqrt(np.mean((np.asarray(best_fit) - data) ** 2))
+            tolerance = (1 + self.CONVERGENCE_RTOL) * sigma
+            tolerance = max(tolerance, self.NOISELESS_ATOL * np.ptp(clean))
+            is_finite = np.all(np.isfinite(list(best_values.values())))
+            num_converged += bool(is_finite and rms <= tolerance)
+            if sigma > 0:
+                rms_ratios.append(rms / sigma)
+
+        latencies_ms = np.array(latencies) * 1e3
+        done = latencies_ms.size > 0  # latencies are None if no fit completed
+        rms_ratio = float(np.median(rms_ratios)) if rms_ratios else None
+        return {
+            "fitfn": name,
+            "size": size,
+            "noise": noise,
+            "trials": self.trials,
+            "repeats": self.repeats,
+            "converged": num_converged / self.trials,
+            "failed": num_failed / self.trials,
+            "latency_ms_median": float(np.median(latencies_ms)) if done else None,
+            "latency_ms_mean": float(np.mean(latencies_ms)) if done else None,
+            "latency_ms_p95": float(np.percentile(latencies_ms, 95)) if done else None,
+            "rms_over_noise_median": rms_ratio,
+        }
+
+    def _summarize(self, record: dict) -> str:
+        """ """
+        latency = record["latency_ms_median"]
+        return (
+            f"{record['fitfn']} [size = {record['size']}, noise = {record['noise']}]: "
+            f"{'-' if latency is None else f'{latency:.3g}'} ms median latency, "
+            f"{record['converged']:.0%} converged, {record['failed']:.0%} failed."
+        )
+
+    def save(self, filepath) -> Path:
+        """save results with metadata needed to compare runs to a JSON file"""
+        filepath = Path(filepath)
+        metadata = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "lmfit": lmfit.__version__,
+            "machine": platform.node(),
+            "seed": self.seed,
+        }
+        with open(filepath, "w") as file:
+            json.dump({"metadata": metadata, "results": self.results}, file, indent=2)
+        logger.info(f"Saved fit benchmark results to '{filepath}'.")
+        return filepath
+
+    @staticmethod
+    def load(filepath) -> list[dict]:
+        """ """
+        with open(filepath) as file:
+            return json.load(file)["results"]
+
+    def compare(
+        self,
+        baseline,  # list of records or path to a JSON file saved by a previous run
+        max_slowdown: float = MAX_SLOWDOWN,
+        max_convergence_drop: float = MAX_CONVERGENCE_DROP,
+    ) -> list[str]:
+        """return descriptions of regressions of these results relative to the
+        baseline, records are matched by (fitfn, size, noise)"""
+        if not isinstance(baseline, list):
+            baseline = FitBenchmark.load(baseline)
+        baseline = {(r["fitfn"], r["size"], r["noise"]): r for r in baseline}
+
+        regressions = []
+        for record in self.results:
+            key = (record["fitfn"], record["size"], record["noise"])
+            if key not in baseline:
+                continue
+            old = baseline[key]
+            latency, old_latency = record["latency_ms_median"], old["latency_ms_median"]
+            if latency is not None and old_latency is not None:
+                slowdown = latency / old_latency
+                if slowdown > max_slowdown:
+                    regressions.append(f"{key}: {slowdown:.2f}x slower median latency.")
+            drop = old["converged"] - record["converged"]
+            if drop > max_convergence_drop:
+                regressions.append(f"{key}: convergence rate dropped by {drop:.0%}.")
+
+        for regression in regressions:
+            logger.warning(regression)
+        return regressions
@@ -0,0 +1,100 @@
+""" Standalone viewer of Datasets published by a running Experiment's live view """
+
+import threading
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt6 import QtCore as qtc
+
+from qcore.helpers.liveview import HOST, LiveViewClient, LiveViewError
+from qcore.helpers.logger import logger
+
+
+class LiveViewer:
+    """Plots the latest frame received from a LiveViewPublisher, started by setting
+    liveview_port on an Experiment, in a window of its own. Frames are received by a
+    background thread and the window redraws at every interval, 1D datasets as line
+    plots and 2D datasets as images, with fit parameters in the plot titles."""
+
+    INTERVAL: float = 0.2  # seconds
+    MAX_COLS: int = 2
+
+    def __init__(self, port: int, host: str = HOST, interval: float = INTERVAL):
+        """ """
+        self.port, self.host, self.interval = port, host, interval
+        self.client = None
+        self._lock = threading.Lock()  # guards the latest frame
+        self._frame = None  # (message, datasets) received but not yet drawn
+        self._items: dict[str, tuple[pg.PlotItem, pg.GraphicsObject]] = {}
+        self.layout, self.header, self.timer = None, None, None
+
+    def run(self) -> None:
+        """ """
+        self.client = LiveViewClient(self.port, self.host)
+        receiver = threading.Thread(target=self._receive, daemon=True)
+        receiver.start()
+
+        pg.setConfigOptions(
+            antialias=True, imageAxisOrder="row-major", background="w", foreground="k"
+        )
+        app = pg.mkQApp()
+        self.layout = pg.GraphicsLayoutWidget(show=True)
+        self.layout.setWindowTitle(f"Qcore live view [{self.host}:{self.port}]")
+        self.header = self.layout.addLabel("", colspan=LiveViewer.MAX_COLS, size="16pt")
+
+        self.timer = qtc.QTimer()
+        self.timer.timeout.connect(self.update)
+        self.timer.start(int(self.interval * 1000))
+        app.exec()
+        self.client.close()
+
+    def _receive(self) -> None:
+        """ """
+        try:
+            while True:
+                datasets = self.client.receive()
+                with self._lock:
+                    self._frame = (self.client.message, datasets)
+        except (LiveViewError, OSError) as err:
+            logger.info(f"Stopped receiving live view frames, details: {err}.")
+
+    def update(self) -> None:
+        """ """
+        with self._lock:
+            frame, self._frame = self._frame, None
+        if frame is None:
+            return
+
+        message, datasets = frame
+        self.header.setText(message)
+        for name, dataset in datasets.items():
+            if name not in self._items:
+                self._add_plot(name, dataset)
+            plot_item, item = self._items[name]
+            sweep_data = list(dataset["sweep_data"].values())
+            avg = dataset["avg"]
+            if avg.ndim == 1:
+                item.setData(x=np.asarray(sweep_data[-1], dtype=float), y=avg)
+            else:
+                item.setImage(avg, autoLevels=True)
+
+            fit_params = dataset["fit_params"]
+            if isinstance(fit_params, dict):
+                fit_str = ", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
+                plot_item.setTitle(f"{name} [{fit_str}]")
+
+    def _add_plot(self, name: str, dataset: dict) -> None:
+        """ """
+        num_plots = len(self._items)
+        row, col = 1 + num_plots // LiveViewer.MAX_COLS, num_plots % LiveViewer.MAX_COLS
+        plot_item = self.layout.addPlot(row=row, col=col, title=name)
+        plot_item.showGrid(x=True, y=True, alpha=0.5)
+        if dataset["avg"].ndim == 1:
+            item = plot_item.plot(pen="b")
+            item.setDownsampling(auto=True, method="peak")
+            item.setClipToView(True)
+            plot_item.setLabels(left=f"{name} ({dataset['units']})")
+        else:  # traces of 2D datasets are shown as rows of an image
+            item = pg.ImageItem()
+            plot_item.addItem(item)
+        self._items[name] = (plot_item, item)
@@ -0,0 +1,101 @@
+""" Benchmark of the throughput of sweep transfers from the instrument Server """
+
+import threading
+import time
+
+import numpy as np
+import Pyro5.api as pyro
+
+from qcore.helpers import serializer
+from qcore.helpers.logger import logger
+
+
+@pyro.expose
+class SweepSource:
+    """Stands in for a served instrument, returns sweeps as drivers do, i.e. as lists of
+    floats before the NumpySerializer and as arrays after"""
+
+    def sweep(self, size: int, as_list: bool):
+        """ """
+        freqs = np.linspace(4e9, 6e9, size)
+        amps = np.random.default_rng(size).standard_normal(size)
+        return (freqs.tolist(), amps.tolist()) if as_list else (freqs, amps)
+
+
+class TransferBenchmark:
+    """Times sweeps of (frequency, amplitude) arrays fetched from a Pyro daemon served
+    in this process, with the default serializer and lists of floats (before) and with
+    the NumpySerializer and arrays (after). Results are a list of records, one per
+    (mode, size) combination, with the latency and throughput of the sweep data."""
+
+    MODES: dict[str, tuple] = {  # name: (serializer name, whether sweeps are lists)
+        "default_lists": (None, True),
+        "numpy_arrays": (serializer.NumpySerializer.NAME, False),
+    }
+    SIZES: tuple[int] = (1_000, 10_000, 100_000)  # points per sweep
+    REPEATS: int = 20  # timed sweeps per (mode, size) combination
+
+    def __init__(self, sizes: tuple[int] = SIZES, repeats: int = REPEATS) -> None:
+        """ """
+        self.sizes, self.repeats = tuple(sizes), repeats
+        self.results: list[dict] = []
+
+    def run(self) -> list[dict]:
+        """ """
+        serializer.register()
+        daemon = pyro.Daemon()
+        uri = daemon.register(SweepSource)
+        thread = threading.Thread(target=daemon.requestLoop, daemon=True)
+        thread.start()
+
+        self.results = []
+        try:
+            for mode, (name, as_list) in TransferBenchmark.MODES.items():
+                with pyro.Proxy(uri) as proxy:
+                    proxy._pyroSerializer = name
+                    for size in self.sizes:
+                        self.results.append(self._benchmark(proxy, mode, size, as_list))
+                        logger.info(self._summarize(self.results[-1]))
+        finally:
+            daemon.shutdown()
+            thread.join()
+            daemon.close()
+        return self.results
+
+    def _benchmark(self, proxy, mode: str, size: int, as_list: bool) -> dict:
+        """ """
+        proxy.sweep(size, as_list)  # warm up the connection
+        latencies = []
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            proxy.sweep(size, as_list)
+            latencies.append(time.perf_counter() - start)
+        latency = float(np.median(latencies))
+        megabytes = 2 * size * np.dtype(float).itemsize / 1e6  # frequencies, amplitudes
+        return {
+            "mode": mode,
+            "size": size,
+            "repeats": self.repeats,
+            "latency_ms_median": latency * 1e3,
+            "throughput_mb_per_s": megabytes / latency,
+        }
+
+    def _summarize(self, record: dict) -> str:
+        """ """
+        return (
+            f"{record['mode']} [size = {record['size']}]: "
+            f"{record['latency_ms_median']:.3g} ms median latency, "
+            f"{record['throughput_mb_per_s']:.3g} MB/s."
+        )
+
+    def speedups(self) -> dict[int, float]:
+        """return the ratio of the throughput after to before by size"""
+        before, after = TransferBenchmark.MODES
+        throughputs = {
+            (r["mode"], r["size"]): r["throughput_mb_per_s"] for r in self.results
+        }
+        return {
+            size: throughputs[(after, size)] / throughputs[(before, size)]
+            for size in self.sizes
+            if (after, size) in throughputs and (before, size) in throughputs
+        }
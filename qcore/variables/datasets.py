@@ -35,6 +35,11 @@ class Dataset(QuaVariable):
         - ylabel: str
         - title: str
         - cmap (for image type plots only), default="viridis"
+        - fast_fit: whether to fit live plots with closed-form estimates instead of full
+        fits, for fitfns in qcore.libs.fit_fns.ESTIMATOR_MAP only, default = False
+        - downsample: whether to draw scatter and line plots downsampled to the screen
+        resolution and clipped to the view, with errorbars on a subset of points for
+        long traces, default = True
     - buffer_shape (for qua stream processing)
     """
 
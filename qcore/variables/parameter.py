@@ -1,18 +1,83 @@
 """ """
 
+import functools
 import inspect
+import time
 from typing import Any, Callable, get_type_hints, Type, Union
 
+
+class ParameterCache:
+    """Values of the cached Parameters of an object, with the time they were last read
+    or set, and hit statistics. Each object has its own, see of()."""
+
+    def __init__(self) -> None:
+        """ """
+        self._values: dict[str, tuple[Any, float]] = {}  # name: (value, timestamp)
+        self._hits, self._misses, self._invalidations = 0, 0, 0
+
+    @staticmethod
+    def of(obj: Any) -> "ParameterCache":
+        """return the cache of obj, created on first use"""
+        try:
+            return obj._parameter_cache
+        except AttributeError:
+            obj._parameter_cache = ParameterCache()
+            return obj._parameter_cache
+
+    def get(self, name: str, ttl: float) -> tuple[bool, Any]:
+        """return (True, value) if name was read or set less than ttl seconds ago,
+        else (False, None)"""
+        value, timestamp = self._values.get(name, (None, None))
+        if timestamp is not None and time.monotonic() - timestamp < ttl:
+            self._hits += 1
+            return True, value
+        self._misses += 1
+        return False, None
+
+    def put(self, name: str, value: Any) -> None:
+        """ """
+        self._values[name] = (value, time.monotonic())
+
+    def invalidate(self, *names: str) -> None:
+        """invalidate the cached values of names, or of all Parameters if none given"""
+        names = names or tuple(self._values)
+        for name in names:
+            if self._values.pop(name, None) is not None:
+                self._invalidations += 1
+
+    def stats(self) -> dict:
+        """return the number of hits, misses and invalidations so far, the hit rate,
+        and the names of the Parameters with cached values"""
+        reads = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / reads if reads else None,
+            "invalidations": self._invalidations,
+            "cached": sorted(self._values),
+        }
+
+
 class Parameter:
-    """ """
+    """ttl = None (default) reads the getter on every get, else gets within ttl seconds
+    of the last get or set of the same object return the cached value, see
+    ParameterCache. Set ttl = math.inf to cache till invalidated. Sets write the value
+    through to the cache, set write_through = False for devices that quantize values
+    e.g. to their frequency resolution, so that sets invalidate the cached value and
+    the next get reads back the value the device applied."""
 
     def __init__(
         self,
         bounds: Union[Callable, list, None] = None,
+        ttl: float = None,
+        write_through: bool = True,
     ) -> None:
         """ """
         self._name, self.type = None, None  # set by __set_name__()
-        self.fget, self.fset = None, None  # updated by getter() and setter()
+        self.ttl, self.write_through = ttl, write_through
+        self._fget, self._fset = None, None  # updated by getter() and setter()
+        # fget and fset go through __get__ and __set__, as Pyro5 calls them directly
+        self.fget, self.fset = None, None
         self.hint: str = None  # set by _parse_bounds()
         self._bound = self._parse_bounds(bounds)
 
@@ -47,28 +112,43 @@ class Parameter:
         if obj is None:  # user wants to inspect this Parameter's object representation
             return self
 
-        if self.fget is None:  # user has not specified a getter for this Parameter
+        if self._fget is None:  # user has not specified a getter for this Parameter
             raise AttributeError(f"'{self._name}' is not gettable.")
 
-        value = self.fget(obj)
+        if self.ttl is not None:
+            is_cached, value = ParameterCache.of(obj).get(self._name, self.ttl)
+            if is_cached:
+                return value
+
+        value = self._fget(obj)
         self.validate(value, obj)
+        if self.ttl is not None:
+            ParameterCache.of(obj).put(self._name, value)
         return value
 
     def __set__(self, obj: Any, value: Any) -> None:
         """ """
-        if self.fset is None:
+        if self._fset is None:
             raise AttributeError(f"'{self._name}' is not settable.")
         self.validate(value, obj)
-        self.fset(obj, value)
+        self._fset(obj, value)
+        if self.ttl is not None and self.write_through:
+            ParameterCache.of(obj).put(self._name, self._coerce(value))
+        elif self.ttl is not None:
+            ParameterCache.of(obj).invalidate(self._name)
 
     def validate(self, value: Any, obj: Any) -> None:
         """ """
-        value = value if self.type is None else self._typecheck(value)
+        value = self._coerce(value)
         in_bounds = self._bound(value, obj)
         if not in_bounds:
             message = f"'{self._name}' {value = } is out of bounds. Range: {self.hint}."
             raise ValueError(message)
 
+    def _coerce(self, value: Any) -> Any:
+        """return value as the type of this Parameter, if it has one"""
+        return value if self.type is None else self._typecheck(value)
+
     def _typecheck(self, value: Any) -> Any:
         """ """
         try:
@@ -84,18 +164,25 @@ class Parameter:
 
     def getter(self, getter):
         """ """
-        self.fget = getter
+        self._fget = getter
+        self.fget = functools.wraps(getter)(lambda obj: self.__get__(obj))
         return self
 
     def setter(self, setter):
         """ """
-        self.fset = setter
+        self._fset = setter
+        self.fset = functools.wraps(setter)(lambda obj, value: self.__set__(obj, value))
         return self
 
+    def refresh(self, obj: Any) -> Any:
+        """get the value from the getter even if a cached value is available"""
+        ParameterCache.of(obj).invalidate(self._name)
+        return self.__get__(obj)
+
     def is_gettable(self) -> bool:
         """ """
-        return self.fget is not None
+        return self._fget is not None
 
     def is_settable(self) -> bool:
         """ """
-        return self.fset is not None
+        return self._fset is not None